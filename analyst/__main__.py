@@ -5,6 +5,7 @@ Usage:
 Options:
     -h --help                   Show this screen.
 """
+import signal
 import sys
 import aumbry
 from docopt import docopt
@@ -16,6 +17,13 @@ from analyst.config import AppConfig
 
 
 class CustomWorker(SyncWorker):
+    def init_signals(self):
+        super(CustomWorker, self).init_signals()
+        signal.signal(signal.SIGHUP, self.handle_hup)
+
+    def handle_hup(self, sig, frame):
+        self.app.application.reload()
+
     def handle_quit(self, sig, frame):
         self.app.application.stop(sig)
         super(CustomWorker, self).handle_quit(sig, frame)
@@ -6,24 +6,58 @@ from falcon_auth import (
     TokenAuthBackend,
 )
 
+from analyst.asnindex import ASNIndexLoader
+from analyst.cache import CredentialCache, ExportCache, TokenCache
 from analyst.converters import IPV4Converter, LowerCaseAlphaNumConverter
+from analyst.geoip import ReaderRegistry
+from analyst.membership import MembershipIndex
 from analyst.middleware.cors import CORSComponentMiddleware
+from analyst.middleware.database import DatabaseConnectionMiddleware
 from analyst.middleware.json import RequireJSONMiddleware
 from analyst.models.manager import DBManager
 from analyst.models.user import User
-from analyst.resources import asn, geo, iplists, tokens, users
+from analyst.resources import asn, enrich, geo, iplists, status, tokens, users
 from analyst.serializers.datetime import DateTimeJSONHandler
+from analyst.sweeper import ExpirySweeper
 
 
 class AnalystService(falcon.API):
     def __init__(self, cfg):
-        token_auth = TokenAuthBackend(User.get_by_token)
-        basic_auth = BasicAuthBackend(User.get_by_basic_auth)
+        # Build an object to manage our db connections.
+        self.manager = DBManager(
+            cfg.db.file_path,
+            pragmas={
+                "journal_mode": cfg.db.journal_mode,
+                "synchronous": cfg.db.synchronous,
+                "cache_size": cfg.db.cache_size,
+                "mmap_size": cfg.db.mmap_size,
+                "busy_timeout": cfg.db.busy_timeout,
+            },
+        )
+        self.manager.setup()
+
+        # Users by token, shared invalidation across the forked workers.
+        self.token_cache = TokenCache(cfg.token_cache_size, cfg.token_cache_ttl)
+        token_auth = TokenAuthBackend(
+            lambda token: self.token_cache.get(token, User.get_by_token)
+        )
+        # Verified Basic credentials, invalidated together with the tokens.
+        self.credential_cache = CredentialCache(
+            cfg.credential_cache_size,
+            cfg.credential_cache_ttl,
+            self.token_cache.generation,
+        )
+        basic_auth = BasicAuthBackend(
+            lambda username, password: self.credential_cache.verify(
+                username, password, User.get_by_basic_auth
+            )
+        )
         multi_auth = MultiAuthBackend(token_auth, basic_auth)
         auth_middleware = FalconAuthMiddleware(multi_auth)
 
         super(AnalystService, self).__init__(
             middleware=[
+                DatabaseConnectionMiddleware(self.manager),
                 CORSComponentMiddleware(),
                 RequireJSONMiddleware(),
                 auth_middleware,
@@ -40,49 +74,131 @@ class AnalystService(falcon.API):
 
         self.cfg = cfg
 
-        # Build an object to manage our db connections.
-        self.manager = DBManager(self.cfg.db.file_path)
-        self.manager.setup()
+        # Long-lived, memory-mapped GeoIP readers shared by all resources.
+        self.readers = ReaderRegistry(
+            {"asn": (self.cfg.asn_path, "asn"), "geo": (self.cfg.geo_path, "city")},
+            check_interval=self.cfg.geoip_check_interval,
+            cache_size=self.cfg.geoip_cache_size,
+        )
+        # Sorted-array form of the ASN database, for batch lookups (optional) and
+        # the ASN to prefixes reverse index.
+        self.asn_index = ASNIndexLoader(self.readers["asn"])
+        bulk_asn_index = self.asn_index if self.cfg.asn_compiled_index else None
+        # Which IP lists contain an address, answered without a join.
+        self.membership = MembershipIndex(self.cfg.membership_refresh_interval)
+        # Rendered IP list exports, per list version.
+        self.export_cache = ExportCache(self.cfg.export_cache_size)
+        # Deletes expired IP list items in the background, see `start`.
+        self.sweeper = ExpirySweeper(
+            self.cfg.expiry_sweep_interval, self.cfg.expiry_sweep_batch_size
+        )
 
         # Build routes
+        self.add_route(
+            f"/api/{self.cfg.version}/status", status.StatusResource(self.readers)
+        )
         self.add_route(f"/api/{self.cfg.version}/init", users.InitResource())
-        self.add_route(f"/api/{self.cfg.version}/users", users.UsersResource())
+        self.add_route(
+            f"/api/{self.cfg.version}/users", users.UsersResource(self.token_cache)
+        )
         self.add_route(
             f"/api/{self.cfg.version}/users/{{username:lowercase_alpha_num}}",
-            users.UsersResource(),
+            users.UsersResource(self.token_cache),
         )
         self.add_route(
             f"/api/{self.cfg.version}/tokens/{{username:lowercase_alpha_num}}",
-            tokens.TokensResource(),
+            tokens.TokensResource(self.token_cache),
         )
         self.add_route(
-            f"/api/{self.cfg.version}/asn", asn.ASNResource(self.cfg.asn_path)
+            f"/api/{self.cfg.version}/asn",
+            asn.ASNResource(self.readers, self.cfg.max_batch_size, bulk_asn_index),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/asn/prefixes/{{asn_number:int}}",
+            asn.ASNPrefixesResource(self.asn_index),
         )
         self.add_route(
             f"/api/{self.cfg.version}/asn/{{ip:ipv4_addr}}",
-            asn.ASNResource(self.cfg.asn_path),
+            asn.ASNResource(self.readers, self.cfg.max_batch_size, bulk_asn_index),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/geo",
+            geo.GeoResource(self.readers, self.cfg.max_batch_size),
         )
         self.add_route(
-            f"/api/{self.cfg.version}/geo", geo.GeoResource(self.cfg.geo_path)
+            f"/api/{self.cfg.version}/geo/distance",
+            geo.GeoDistanceResource(
+                self.readers, self.cfg.max_batch_size, self.cfg.max_distance_pairs
+            ),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/geo/travel",
+            geo.GeoTravelResource(self.readers, self.cfg.max_batch_size),
         )
         self.add_route(
             f"/api/{self.cfg.version}/geo/{{ip:ipv4_addr}}",
-            geo.GeoResource(self.cfg.geo_path),
+            geo.GeoResource(self.readers, self.cfg.max_batch_size),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/enrich",
+            enrich.EnrichResource(
+                self.readers, self.membership, self.cfg.max_batch_size
+            ),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/enrich/{{ip:ipv4_addr}}",
+            enrich.EnrichResource(
+                self.readers, self.membership, self.cfg.max_batch_size
+            ),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists",
+            iplists.IPListResource(self.membership),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists/lookup",
+            iplists.IPListLookupResource(self.membership, self.cfg.max_batch_size),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists/query",
+            iplists.IPListQueryResource(self.membership),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists/lookup/{{ip:ipv4_addr}}",
+            iplists.IPListLookupResource(self.membership, self.cfg.max_batch_size),
         )
-        self.add_route(f"/api/{self.cfg.version}/iplists", iplists.IPListResource())
         self.add_route(
             f"/api/{self.cfg.version}/iplists/{{ip_list_name:lowercase_alpha_num}}",
-            iplists.IPListResource(),
+            iplists.IPListResource(self.membership),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists/{{ip_list_name}}.{{export_format}}",
+            iplists.IPListExportResource(self.export_cache),
         )
         self.add_route(
             f"/api/{self.cfg.version}/iplists/{{ip_list_name:lowercase_alpha_num}}/items",
-            iplists.IPListItemResource(),
+            iplists.IPListItemResource(
+                self.membership, self.asn_index, self.cfg.change_log_versions
+            ),
+        )
+        self.add_route(
+            f"/api/{self.cfg.version}/iplists/{{ip_list_name:lowercase_alpha_num}}/changes",
+            iplists.IPListChangesResource(),
         )
 
     def start(self):
         """ A hook to when a Gunicorn worker calls run()."""
-        pass
+        self.readers.open()
+        if self.cfg.asn_compiled_index:
+            self.asn_index.load()
+        self.sweeper.start()
+
+    def reload(self):
+        """ A hook to when a Gunicorn worker receives SIGHUP. """
+        self.readers.request_reload()
 
     def stop(self, signal):
         """ A hook to when a Gunicorn worker starts shutting down. """
+        self.sweeper.stop()
+        self.readers.close()
         self.manager.close()
@@ -0,0 +1,337 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from ipaddress import IPv4Address, IPv4Network, summarize_address_range
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import maxminddb
+import numpy as np
+
+from analyst.geoip import GeoIPDatabase
+from analyst.iputils import int_to_ipv4, ipv4_to_int, normalize_ipv4
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".index"
+INDEX_ARRAYS = ("start", "end", "asn", "org")
+
+
+class ASNIndex:
+    """
+    ASN Index
+
+    Params:
+
+    * **start**, **end**  Sorted uint32 arrays, first and last address per range.
+    * **asn**  uint32 array, autonomous system number of each range.
+    * **org**  uint32 array, position of each range's organization in `orgs`.
+    * **orgs**  List of interned organization names.
+    * **build_epoch**  Integer, build of the `.mmdb` the index was compiled from.
+
+    The IPv4 part of the ASN database compiled into flat arrays, so a whole batch
+    of addresses is resolved with one `searchsorted` instead of a tree walk each.
+    """
+
+    def __init__(
+        self,
+        start: np.ndarray,
+        end: np.ndarray,
+        asn: np.ndarray,
+        org: np.ndarray,
+        orgs: List[str],
+        build_epoch: int,
+    ):
+        self.start = start
+        self.end = end
+        self.asn = asn
+        self.org = org
+        self.orgs = orgs
+        self.build_epoch = build_epoch
+        self._by_asn = None
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @classmethod
+    def compile(cls, mmdb_path: str) -> "ASNIndex":
+        """
+        Compile
+
+        Params:
+
+        * **mmdb_path**  String, path to a GeoLite2/GeoIP2 ASN database.
+
+        Returns: New `ASNIndex`, built by walking every network in the database.
+        """
+        starts, ends, asns, org_ids = [], [], [], []
+        orgs = {}
+        with maxminddb.open_database(mmdb_path, maxminddb.MODE_MMAP) as reader:
+            build_epoch = reader.metadata().build_epoch
+            for network, record in reader:
+                if network.version != 4 or not record:
+                    continue
+                starts.append(int(network.network_address))
+                ends.append(int(network.broadcast_address))
+                asns.append(record.get("autonomous_system_number", 0))
+                org = record.get("autonomous_system_organization", None)
+                org_ids.append(orgs.setdefault(org, len(orgs)))
+
+        start = np.array(starts, dtype=np.uint32)
+        order = np.argsort(start, kind="stable")
+        return cls(
+            start[order],
+            np.array(ends, dtype=np.uint32)[order],
+            np.array(asns, dtype=np.uint32)[order],
+            np.array(org_ids, dtype=np.uint32)[order],
+            list(orgs),
+            build_epoch,
+        )
+
+    def save(self, directory: str) -> None:
+        """
+        Save
+
+        Writes one `.npy` file per array plus `meta.json`.  Written to a temporary
+        directory and renamed into place so readers never see half an index.
+        """
+        tmp_directory = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        for name in INDEX_ARRAYS:
+            np.save(os.path.join(tmp_directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(tmp_directory, "meta.json"), "w") as fp:
+            json.dump({"build_epoch": self.build_epoch, "orgs": self.orgs}, fp)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(tmp_directory, directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "ASNIndex":
+        """
+        Load
+
+        Returns: `ASNIndex` with its arrays memory-mapped from `directory`.
+        """
+        with open(os.path.join(directory, "meta.json"), "r") as fp:
+            meta = json.load(fp)
+        arrays = [
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in INDEX_ARRAYS
+        ]
+        return cls(*arrays, orgs=meta["orgs"], build_epoch=meta["build_epoch"])
+
+    @classmethod
+    def open(cls, mmdb_path: str) -> "ASNIndex":
+        """
+        Open
+
+        Returns: The index cached next to `mmdb_path` if it matches the database's
+        build, otherwise a freshly compiled one.  The compiled index is returned
+        even if it can't be cached, e.g. next to a read-only database.
+        """
+        directory = mmdb_path + INDEX_SUFFIX
+        with maxminddb.open_database(mmdb_path, maxminddb.MODE_MMAP) as reader:
+            build_epoch = reader.metadata().build_epoch
+
+        try:
+            index = cls.load(directory)
+            if index.build_epoch == build_epoch:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.compile(mmdb_path)
+        try:
+            index.save(directory)
+        except OSError:
+            logger.warning(
+                "Caching the ASN index in %s failed", directory, exc_info=True
+            )
+        return index
+
+    def lookup(self, ips: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lookup
+
+        Params:
+
+        * **ips**  Array of IPv4 addresses as integers.
+
+        Returns: Tuple of (found mask, range position) arrays; the position is only
+        meaningful where found is True.
+        """
+        ips = np.asarray(ips, dtype=np.uint32)
+        if not len(self.start):
+            return np.zeros(len(ips), dtype=bool), np.zeros(len(ips), dtype=np.intp)
+
+        position = np.searchsorted(self.start, ips, side="right") - 1
+        position = np.maximum(position, 0)
+        found = (self.start[position] <= ips) & (ips <= self.end[position])
+        return found, position
+
+    def bulk_lookup(
+        self,
+        ips: Iterable[str],
+        fallback: Callable[[List[str]], Iterator[Dict]] = None,
+    ) -> Iterator[Dict]:
+        """
+        Bulk Lookup
+
+        Params:
+
+        * **ips**  Iterable of IP address strings, may contain duplicates.
+        * **fallback**  Optional callable looking up the entries that aren't
+          IPv4 addresses, such as `analyst.bulk.bulk_lookup` on the reader.
+
+        Returns: Generator of results shaped like `analyst.bulk.bulk_lookup` for
+        ASN records, one per unique IPv4 address in numeric order, followed by
+        the fallback's results for everything else.  Without a fallback those
+        are reported with an `invalid` status.
+        """
+        addresses, others = [], {}
+        for ip in ips:
+            try:
+                addresses.append(ipv4_to_int(normalize_ipv4(ip)))
+            except ValueError:
+                others[ip] = None
+        values = np.unique(np.array(addresses, dtype=np.uint32))
+        found, position = self.lookup(values)
+        asns = self.asn[position].tolist()
+        orgs = self.org[position].tolist()
+
+        for value, ok, asn, org in zip(values.tolist(), found.tolist(), asns, orgs):
+            ip = int_to_ipv4(value)
+            if not ok:
+                yield {"ip": ip, "status": "not_found"}
+            else:
+                yield {
+                    "ip": ip,
+                    "status": "ok",
+                    "asn_number": asn,
+                    "asn_org": self.orgs[org],
+                }
+
+        if not others:
+            return
+        if fallback is not None:
+            yield from fallback(list(others))
+            return
+        for ip in others:
+            yield {"ip": ip, "status": "invalid"}
+
+    def _asn_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Reverse index, range positions grouped by ASN.  A stable sort keeps each
+        # group in address order.  Built on first use, an index is immutable.
+        if self._by_asn is None:
+            order = np.argsort(self.asn, kind="stable")
+            self._by_asn = (order, self.asn[order])
+        return self._by_asn
+
+    def ranges(self, asn_number: int) -> List[Tuple[int, int]]:
+        """
+        Ranges
+
+        Params:
+
+        * **asn_number**  Integer, autonomous system number.
+
+        Returns: List of (first, last) integer address ranges announced by the
+        ASN, in order, with adjacent ranges merged.
+        """
+        order, asns = self._asn_order()
+        low = np.searchsorted(asns, asn_number, side="left")
+        high = np.searchsorted(asns, asn_number, side="right")
+        positions = order[low:high]
+
+        ranges = []
+        for start, end in zip(
+            self.start[positions].tolist(), self.end[positions].tolist()
+        ):
+            if ranges and start == ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def prefixes(self, asn_number: int) -> List[IPv4Network]:
+        """
+        Prefixes
+
+        Returns: List of the collapsed CIDR prefixes announced by `asn_number`.
+        """
+        prefixes = []
+        for start, end in self.ranges(asn_number):
+            prefixes.extend(
+                summarize_address_range(IPv4Address(start), IPv4Address(end))
+            )
+        return prefixes
+
+    def org_name(self, asn_number: int) -> str:
+        order, asns = self._asn_order()
+        position = np.searchsorted(asns, asn_number, side="left")
+        if position == len(asns) or asns[position] != asn_number:
+            return None
+        return self.orgs[self.org[order[position]]]
+
+
+class ASNIndexLoader:
+    """
+    ASN Index Loader
+
+    Params:
+
+    * **database**  ASN `GeoIPDatabase` the index is compiled from.
+    * **retry_interval**  Float, seconds before a failed load is tried again.
+
+    Keeps the compiled index in step with the database's current build.  When
+    the build changes (or on first use) the matching index is loaded or compiled
+    on a background thread; until it is ready `current()` returns None and
+    callers fall back to the reader.  A load that fails is logged and not tried
+    again for `retry_interval`, so requests don't each start a compile.
+    """
+
+    def __init__(self, database: GeoIPDatabase, retry_interval: float = 300):
+        self.database = database
+        self.retry_interval = retry_interval
+        self._index = None
+        self._thread = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _build_epoch(self) -> int:
+        with self.database.reader() as reader:
+            return reader.metadata().build_epoch
+
+    def load(self) -> None:
+        """Start loading the index for the database's current build, if needed."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if time.monotonic() < self._retry_at:
+                return
+            self._thread = threading.Thread(
+                target=self._load, name="asn-index", daemon=True
+            )
+            self._thread.start()
+
+    def _load(self) -> None:
+        try:
+            self._index = ASNIndex.open(self.database.path)
+        except Exception:
+            logger.exception("Loading the ASN index for %s failed", self.database.path)
+            self._retry_at = time.monotonic() + self.retry_interval
+
+    def current(self) -> ASNIndex:
+        """
+        Current
+
+        Returns: Index matching the database's current build, or None.
+        """
+        index = self._index
+        if index is not None and index.build_epoch == self._build_epoch():
+            return index
+        self.load()
+        return None
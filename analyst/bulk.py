@@ -0,0 +1,186 @@
+import socket
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import geoip2.errors
+
+from analyst.geoip import GeoIPDatabase, ReaderHandle
+from analyst.membership import MembershipIndex
+
+
+def packed_ip(ip: str) -> bytes:
+    """
+    Packed IP
+
+    Params:
+
+    * **ip**  String, IPv4 or IPv6 address.
+
+    Returns: Bytes, network order address, used as a cheap sort key.
+    """
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        return socket.inet_pton(socket.AF_INET6, ip)
+
+
+def unique_sorted(ips: Iterable[str]) -> List[str]:
+    """
+    Unique Sorted
+
+    Params:
+
+    * **ips**  Iterable of IP address strings.
+
+    Returns: List, unique addresses in numeric order.
+
+    Looking addresses up in order walks neighbouring parts of the search tree
+    back to back and lets the prefix cache answer runs of addresses in the same
+    network.
+    """
+    return sorted(set(ips), key=packed_ip)
+
+
+def split_addresses(ips: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    Split Addresses
+
+    Params:
+
+    * **ips**  Iterable of strings, may contain duplicates and non-addresses.
+
+    Returns: Tuple of the unique IP addresses in numeric order (see
+    `unique_sorted`) and the unique entries that aren't IP addresses, in the
+    order given.
+    """
+    packed, invalid = {}, {}
+    for ip in ips:
+        if ip in packed or ip in invalid:
+            continue
+        try:
+            packed[ip] = packed_ip(ip)
+        except (OSError, ValueError):
+            invalid[ip] = None
+    return sorted(packed, key=packed.get), list(invalid)
+
+
+def bulk_lookup(
+    database: GeoIPDatabase, ips: Iterable[str], formatter: Callable
+) -> Iterator[Dict]:
+    """
+    Bulk Lookup
+
+    Params:
+
+    * **database**  `GeoIPDatabase` to query.
+    * **ips**  Iterable of IP address strings, may contain duplicates.
+    * **formatter**  Callable turning a geoip2 model into a result dictionary.
+
+    Returns: Generator of one result per unique address, in numeric order.
+
+    Addresses missing from the database are reported with a `not_found` status,
+    and entries that aren't addresses with `invalid` after the rest, instead of
+    aborting the batch.  A single reader handle is held for the whole batch, so
+    a reload part way through doesn't mix database builds.
+    """
+    addresses, invalid = split_addresses(ips)
+    with database.handle() as handle:
+        for ip in addresses:
+            try:
+                lookup = database.lookup(ip, handle)
+            except geoip2.errors.AddressNotFoundError:
+                yield {"ip": ip, "status": "not_found"}
+                continue
+
+            result = {"ip": ip, "status": "ok"}
+            result.update(formatter(lookup))
+            yield result
+    for ip in invalid:
+        yield {"ip": ip, "status": "invalid"}
+
+
+def bulk_locate(
+    database: GeoIPDatabase, ips: Iterable[str]
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Bulk Locate
+
+    Params:
+
+    * **database**  City `GeoIPDatabase`.
+    * **ips**  Iterable of IP address strings, may contain duplicates.
+
+    Returns: Dictionary of address to (latitude, longitude) for every unique
+    address the database has coordinates for.  Entries that aren't addresses
+    are left out like those it has no coordinates for.
+    """
+    located = {}
+    with database.handle() as handle:
+        for ip in split_addresses(ips)[0]:
+            try:
+                location = database.lookup(ip, handle).location
+            except geoip2.errors.AddressNotFoundError:
+                continue
+            if location.latitude is not None and location.longitude is not None:
+                located[ip] = (location.latitude, location.longitude)
+    return located
+
+
+def enrich(
+    ip: str,
+    asn: GeoIPDatabase,
+    geo: GeoIPDatabase,
+    membership: MembershipIndex,
+    asn_formatter: Callable,
+    geo_formatter: Callable,
+    asn_handle: ReaderHandle = None,
+    geo_handle: ReaderHandle = None,
+) -> Dict:
+    """
+    Enrich
+
+    Returns: Dictionary with the `asn` and `geo` records for `ip` (None when the
+    database has no record) and the names of the IP lists containing it.
+    """
+    result = {"ip": ip, "asn": None, "geo": None}
+    try:
+        result["asn"] = asn_formatter(asn.lookup(ip, asn_handle))
+    except geoip2.errors.AddressNotFoundError:
+        pass
+    try:
+        result["geo"] = geo_formatter(geo.lookup(ip, geo_handle))
+    except geoip2.errors.AddressNotFoundError:
+        pass
+    result["iplists"] = membership.lists_for(ip)
+    return result
+
+
+def bulk_enrich(
+    ips: Iterable[str],
+    asn: GeoIPDatabase,
+    geo: GeoIPDatabase,
+    membership: MembershipIndex,
+    asn_formatter: Callable,
+    geo_formatter: Callable,
+) -> Iterator[Dict]:
+    """
+    Bulk Enrich
+
+    Returns: Generator of one `enrich` result per unique address, in numeric
+    order, with both reader handles held for the whole batch.  Entries that
+    aren't addresses follow with an `invalid` status, as in `bulk_lookup`.
+    """
+    addresses, invalid = split_addresses(ips)
+    with asn.handle() as asn_handle, geo.handle() as geo_handle:
+        for ip in addresses:
+            yield enrich(
+                ip,
+                asn,
+                geo,
+                membership,
+                asn_formatter,
+                geo_formatter,
+                asn_handle,
+                geo_handle,
+            )
+    for ip in invalid:
+        yield {"ip": ip, "status": "invalid"}
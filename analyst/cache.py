@@ -0,0 +1,320 @@
+import hashlib
+import hmac
+import multiprocessing
+import secrets
+import threading
+import time
+from collections import Counter, OrderedDict
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional, Union
+
+IPAddress = Union[IPv4Address, IPv6Address]
+IPNetwork = Union[IPv4Network, IPv6Network]
+
+
+class PrefixLRUCache:
+    """
+    Prefix LRU Cache
+
+    Params:
+
+    * **maxsize**  Integer, maximum number of cached networks, 0 disables.
+
+    Bounded LRU cache keyed by network prefix instead of single address, so one
+    entry answers every address in the network it was stored under.  MaxMind
+    networks never overlap, so an address matches at most one cached network;
+    `get` probes only the prefix lengths currently held in the cache, longest
+    first.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._prefix_lens = {4: Counter(), 6: Counter()}
+        self._probe_order = {4: (), 6: ()}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, address: IPAddress) -> Any:
+        """
+        Get
+
+        Params:
+
+        * **address**  `ipaddress` address object.
+
+        Returns: Value cached for the network containing `address` or None.
+        """
+        if not self.maxsize:
+            return None
+
+        address_int = int(address)
+        bits = address.max_prefixlen
+        with self._lock:
+            for prefix_len in self._probe_order[address.version]:
+                key = (address.version, address_int >> (bits - prefix_len), prefix_len)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, network: IPNetwork, value: Any) -> None:
+        if not self.maxsize:
+            return
+
+        key = (
+            network.version,
+            int(network.network_address) >> (network.max_prefixlen - network.prefixlen),
+            network.prefixlen,
+        )
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._add_prefix_len(network.version, network.prefixlen)
+            self._entries[key] = value
+
+            while len(self._entries) > self.maxsize:
+                (version, _, prefix_len), _ = self._entries.popitem(last=False)
+                self._remove_prefix_len(version, prefix_len)
+                self.evictions += 1
+
+    def _add_prefix_len(self, version: int, prefix_len: int) -> None:
+        lens = self._prefix_lens[version]
+        lens[prefix_len] += 1
+        if lens[prefix_len] == 1:
+            self._probe_order[version] = tuple(sorted(lens, reverse=True))
+
+    def _remove_prefix_len(self, version: int, prefix_len: int) -> None:
+        lens = self._prefix_lens[version]
+        lens[prefix_len] -= 1
+        if not lens[prefix_len]:
+            del lens[prefix_len]
+            self._probe_order[version] = tuple(sorted(lens, reverse=True))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._prefix_lens = {4: Counter(), 6: Counter()}
+            self._probe_order = {4: (), 6: ()}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "maxsize": self.maxsize,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ExportCache:
+    """
+    Export Cache
+
+    Params:
+
+    * **max_bytes**  Integer, total size of the cached bodies, 0 disables.
+
+    Rendered IP list exports keyed by (list, format, encoding), each stored with
+    the version of the list it was rendered from, its ETag, so a newer version
+    replaces the old body instead of sitting next to it.  Least recently used
+    bodies are evicted past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[bytes]:
+        """
+        Get
+
+        Returns: Body cached for `key` at `version` or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+            self._entries[key] = (version, body)
+            self.size += len(body)
+
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def tee(
+        self, key: Hashable, version: Hashable, chunks: Iterable[bytes]
+    ) -> Iterator[bytes]:
+        """
+        Tee
+
+        Returns: Generator passing `chunks` through while keeping a copy, cached
+        once the last chunk has been sent.  Bodies too big for the cache stop
+        being copied as soon as they outgrow it, and nothing is cached if the
+        client goes away part way through.
+        """
+        body = []
+        size = 0
+        for chunk in chunks:
+            if body is not None:
+                body.append(chunk)
+                size += len(chunk)
+                if size > self.max_bytes:
+                    body = None
+            yield chunk
+
+        if body is not None:
+            self.put(key, version, b"".join(body))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_bytes": self.max_bytes,
+            "size": self.size,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class TokenCache:
+    """
+    Token Cache
+
+    Params:
+
+    * **maxsize**  Integer, maximum number of cached tokens, 0 disables.
+    * **ttl**  Float, seconds a cached user is trusted for.
+    * **generation**  Optional shared counter of another cache, to invalidate
+      both together.
+
+    Per-worker cache in front of the token lookup the authentication middleware
+    runs on every request.  Only tokens that resolved to an active user are
+    cached, so guessed tokens can't push real ones out.
+
+    Invalidation is a generation counter in shared memory, created before
+    gunicorn forks its workers, so `invalidate()` in one worker empties the
+    cache of every worker on its next lookup.  Changes made outside the API are
+    picked up within `ttl`.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, generation=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = generation or multiprocessing.Value("Q", 0)
+        self._seen_generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str, load: Callable[[str], Any]) -> Any:
+        """
+        Get
+
+        Params:
+
+        * **token**  String, API token.
+        * **load**  Callable returning the user for a token, or None.
+
+        Returns: The user for `token`, from the cache when fresh.
+        """
+        if not self.maxsize:
+            return load(token)
+
+        now = time.monotonic()
+        # An aligned 8 byte read, no need for the cross-process lock.
+        generation = self.generation.get_obj().value
+        with self._lock:
+            if generation != self._seen_generation:
+                self._entries.clear()
+                self._seen_generation = generation
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = load(token)
+        if user is not None:
+            with self._lock:
+                if generation == self._seen_generation:
+                    self._entries[token] = (now + self.ttl, user)
+                    self._entries.move_to_end(token)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self) -> None:
+        """Empty the cache of every worker, call after changing a user."""
+        with self.generation.get_lock():
+            self.generation.value += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "maxsize": self.maxsize,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CredentialCache(TokenCache):
+    """
+    Credential Cache
+
+    Params: See `TokenCache`.
+
+    Users whose Basic credentials verified, so a client sending the same
+    username and password on every request pays for the PBKDF2 hash once per
+    `ttl` instead of every time.  Entries are keyed by an HMAC-SHA256 of the
+    credentials under a random key that never leaves the process: passwords
+    aren't kept, and the keys can't be used to guess them offline.  Failed
+    attempts are never cached and keep paying the full hash.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, generation=None):
+        super().__init__(maxsize, ttl, generation)
+        self._key = secrets.token_bytes(32)
+
+    def verify(
+        self, username: str, password: str, load: Callable[[str, str], Any]
+    ) -> Any:
+        """
+        Verify
+
+        Params:
+
+        * **username**, **password**  Strings, Basic credentials.
+        * **load**  Callable verifying the credentials, returns a user or None.
+
+        Returns: The user for the credentials, from the cache when fresh.
+        """
+        message = f"{len(username)}:{username}{password}".encode("utf-8")
+        digest = hmac.new(self._key, message, hashlib.sha256).digest()
+        return self.get(digest, lambda _: load(username, password))
@@ -2,10 +2,29 @@ from aumbry import Attr, YamlConfig
 
 
 class DatabaseConfig(YamlConfig):
-    __mapping__ = {"file_path": Attr("file_path", str)}
+    __mapping__ = {
+        "file_path": Attr("file_path", str),
+        "journal_mode": Attr("journal_mode", str),
+        "synchronous": Attr("synchronous", str),
+        "cache_size": Attr("cache_size", int),
+        "mmap_size": Attr("mmap_size", int),
+        "busy_timeout": Attr("busy_timeout", int),
+    }
 
     connection = ""
 
+    def __init__(self):
+        self.file_path = None
+        # Readers don't block on a writer, or the other way round.
+        self.journal_mode = "wal"
+        # Safe with WAL, only the last transactions can be lost on power loss.
+        self.synchronous = "normal"
+        # Negative is KiB, 64 MiB of page cache per connection.
+        self.cache_size = -64000
+        self.mmap_size = 256 * 1024 * 1024
+        # Milliseconds to wait for the write lock before "database is locked".
+        self.busy_timeout = 5000
+
 
 class AppConfig(YamlConfig):
     __mapping__ = {
@@ -13,7 +32,21 @@ class AppConfig(YamlConfig):
         "gunicorn": Attr("gunicorn", dict),
         "version": Attr("version", str),
         "asn_path": Attr("asn_path", str),
-        "geo_path": Attr("geo_path", str)
+        "geo_path": Attr("geo_path", str),
+        "geoip_check_interval": Attr("geoip_check_interval", int),
+        "geoip_cache_size": Attr("geoip_cache_size", int),
+        "max_batch_size": Attr("max_batch_size", int),
+        "max_distance_pairs": Attr("max_distance_pairs", int),
+        "asn_compiled_index": Attr("asn_compiled_index", bool),
+        "membership_refresh_interval": Attr("membership_refresh_interval", int),
+        "export_cache_size": Attr("export_cache_size", int),
+        "change_log_versions": Attr("change_log_versions", int),
+        "expiry_sweep_interval": Attr("expiry_sweep_interval", int),
+        "expiry_sweep_batch_size": Attr("expiry_sweep_batch_size", int),
+        "token_cache_size": Attr("token_cache_size", int),
+        "token_cache_ttl": Attr("token_cache_ttl", int),
+        "credential_cache_size": Attr("credential_cache_size", int),
+        "credential_cache_ttl": Attr("credential_cache_ttl", int),
     }
 
     def __init__(self):
@@ -22,3 +55,17 @@ class AppConfig(YamlConfig):
         self.version = None
         self.asn_path = None
         self.geo_path = None
+        self.geoip_check_interval = 60
+        self.geoip_cache_size = 10000
+        self.max_batch_size = 100000
+        self.max_distance_pairs = 1000000
+        self.asn_compiled_index = False
+        self.membership_refresh_interval = 5
+        self.export_cache_size = 64 * 1024 * 1024
+        self.change_log_versions = 1000
+        self.expiry_sweep_interval = 60
+        self.expiry_sweep_batch_size = 500
+        self.token_cache_size = 10000
+        self.token_cache_ttl = 30
+        self.credential_cache_size = 1000
+        self.credential_cache_ttl = 300
@@ -0,0 +1,70 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """
+    Haversine
+
+    Returns: Array of great-circle distances in kilometers between each pair
+    `(lat1[i], lon1[i])` and `(lat2[i], lon2[i])`, inputs broadcast like any
+    NumPy expression.
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(
+    lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """
+    Haversine Matrix
+
+    Params:
+
+    * **lat1**, **lon1**  Arrays of N source coordinates in degrees.
+    * **lat2**, **lon2**  Arrays of M target coordinates in degrees.
+
+    Returns: N×M array of great-circle distances in kilometers.
+
+    Computed in one broadcast over all pairs instead of a Python loop per pair.
+    """
+    return haversine(
+        np.asarray(lat1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lon1, dtype=np.float64)[:, np.newaxis],
+        np.asarray(lat2, dtype=np.float64)[np.newaxis, :],
+        np.asarray(lon2, dtype=np.float64)[np.newaxis, :],
+    )
+
+
+def nearest_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """
+    Nearest K
+
+    Params:
+
+    * **distances**  N×M distance matrix.
+    * **k**  Integer, targets to keep per source.
+
+    Returns: N×min(k, M) array of target indices per source, closest first.
+
+    Uses a partial sort so only the kept columns are fully ordered.
+    """
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        indices = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+    order = np.take_along_axis(distances, indices, axis=1).argsort(
+        axis=1, kind="stable"
+    )
+    return np.take_along_axis(indices, order, axis=1)
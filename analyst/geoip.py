@@ -0,0 +1,292 @@
+import ipaddress
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Tuple, Union
+
+import geoip2.database
+
+from analyst.cache import IPAddress, PrefixLRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class ReaderHandle:
+    """
+    Reader Handle
+
+    Params:
+
+    * **reader**  Open `geoip2.database.Reader`.
+    * **stat**  Tuple of the database file's (inode, mtime, size) when opened.
+
+    Counts the requests currently using `reader`.  A retired handle closes
+    (unmaps) its reader once the last of those requests releases it.
+    """
+
+    def __init__(self, reader: geoip2.database.Reader, stat: Tuple[int, int, int]):
+        self.reader = reader
+        self.stat = stat
+        self.loaded_on = datetime.utcnow()
+        self.users = 0
+        self.retired = False
+
+    def close_if_unused(self) -> None:
+        if self.retired and self.users == 0:
+            self.reader.close()
+
+
+def file_stat(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class GeoIPDatabase:
+    """
+    GeoIP Database
+
+    Params:
+
+    * **path**  String, path to a MaxMind `.mmdb` file.
+    * **lookup_type**  String, reader method used by `lookup`, e.g. `asn` or `city`.
+    * **check_interval**  Seconds between checks for a new file, 0 disables.
+    * **cache_size**  Networks held by the lookup cache, 0 disables.
+
+    Holds a single long-lived `geoip2.database.Reader` opened with `MODE_MMAP`.
+    The reader is read-only once opened so it is shared by every request (and
+    every thread) in the worker, only opening and swapping take the lock.
+
+    When the file is replaced (new inode, mtime or size) or `request_reload()` is
+    called, the next request opens the new file and swaps it in.  Requests already
+    holding the old reader finish on it, the old mapping is closed after them.
+    The lookup cache is cleared whenever the reader is swapped.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lookup_type: str,
+        check_interval: int = 0,
+        cache_size: int = 0,
+    ):
+        self.path = path
+        self.lookup_type = lookup_type
+        self.check_interval = check_interval
+        self.cache = PrefixLRUCache(cache_size)
+        self._handle = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reload_requested = False
+        self._next_check = 0.0
+
+    def open(self) -> ReaderHandle:
+        with self._lock:
+            if self._handle is None:
+                self._handle = self._load()
+            return self._handle
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.retired = True
+                self._handle.close_if_unused()
+                self._handle = None
+                self.cache.clear()
+
+    def _load(self) -> ReaderHandle:
+        stat = file_stat(self.path)
+        reader = geoip2.database.Reader(self.path, mode=geoip2.database.MODE_MMAP)
+        self._next_check = time.monotonic() + self.check_interval
+        return ReaderHandle(reader, stat)
+
+    def reload(self) -> ReaderHandle:
+        """
+        Reload
+
+        Returns: The new handle.
+
+        Opens the database file again and atomically swaps it in.  The old reader
+        is closed as soon as no request is using it.  If the file can't be opened
+        the current reader is kept and a requested reload stays requested.
+        """
+        requested, self._reload_requested = self._reload_requested, False
+        try:
+            new_handle = self._load()
+        except Exception:
+            self._reload_requested = self._reload_requested or requested
+            raise
+        with self._lock:
+            old_handle, self._handle = self._handle, new_handle
+            self.cache.clear()
+            if old_handle is not None:
+                old_handle.retired = True
+                old_handle.close_if_unused()
+        return new_handle
+
+    def request_reload(self) -> None:
+        """
+        Request Reload
+
+        Flags the database to be reloaded by the next request.  Takes no locks, so
+        it is safe to call from a signal handler.
+        """
+        self._reload_requested = True
+
+    def _needs_reload(self) -> bool:
+        if self._reload_requested:
+            return True
+        if not self.check_interval or self._handle is None:
+            return False
+
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+
+        try:
+            return file_stat(self.path) != self._handle.stat
+        except OSError:
+            # File is mid-replace, keep serving the current mapping.
+            return False
+
+    @contextmanager
+    def handle(self) -> Iterator[ReaderHandle]:
+        """
+        Handle
+
+        Returns: Context manager yielding the current handle, opened on first use.
+
+        The handle's reader stays open until the context exits, even if a reload
+        swaps in a newer one meanwhile.
+        """
+        if self._handle is None:
+            self.open()
+        elif self._needs_reload() and self._reload_lock.acquire(blocking=False):
+            # Only one thread reloads, the others keep using the current reader.
+            try:
+                self.reload()
+            except Exception:
+                # Most likely a file caught mid-replace, retried on a later
+                # request while this one is served from the current reader.
+                logger.exception("Reloading %s failed", self.path)
+            finally:
+                self._reload_lock.release()
+
+        with self._lock:
+            handle = self._handle
+            handle.users += 1
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                handle.users -= 1
+                handle.close_if_unused()
+
+    @contextmanager
+    def reader(self) -> Iterator[geoip2.database.Reader]:
+        """
+        Reader
+
+        Returns: Context manager yielding the current reader, see `handle`.
+        """
+        with self.handle() as handle:
+            yield handle.reader
+
+    def lookup(self, ip: str, handle: ReaderHandle = None):
+        """
+        Lookup
+
+        Params:
+
+        * **ip**  String, IP address.
+        * **handle**  Optional handle already held by the caller, used on cache miss.
+
+        Returns: geoip2 model for `ip` from the cache or the reader.
+
+        Raises `geoip2.errors.AddressNotFoundError`.  Cached models are shared by
+        every address in their network, so use `ip` rather than the model's
+        `ip_address`.
+        """
+        address = ipaddress.ip_address(ip)
+        model = self.cache.get(address)
+        if model is not None:
+            return model
+
+        if handle is None:
+            with self.handle() as handle:
+                return self._lookup(address, handle)
+        return self._lookup(address, handle)
+
+    def _lookup(self, address: IPAddress, handle: ReaderHandle):
+        model = getattr(handle.reader, self.lookup_type)(address)
+        network = getattr(model, "network", None) or model.traits.network
+        with self._lock:
+            # Don't cache a record from a reader that a reload already replaced.
+            if handle is self._handle:
+                self.cache.put(network, model)
+        return model
+
+    def status(self) -> Dict[str, Union[str, int, datetime, None]]:
+        handle = self._handle
+        if handle is None:
+            return {
+                "path": self.path,
+                "build_epoch": None,
+                "loaded_on": None,
+                "cache": self.cache.stats(),
+            }
+
+        metadata = handle.reader.metadata()
+        return {
+            "path": self.path,
+            "database_type": metadata.database_type,
+            "build_epoch": metadata.build_epoch,
+            "loaded_on": handle.loaded_on,
+            "cache": self.cache.stats(),
+        }
+
+
+class ReaderRegistry:
+    """
+    Reader Registry
+
+    Params:
+
+    * **databases**  Dictionary of database name to (`.mmdb` path, lookup type).
+    * **check_interval**  Seconds between checks for replaced database files.
+    * **cache_size**  Networks held by each database's lookup cache.
+
+    Owned by `AnalystService`, opened in `start()` and closed in `stop()`.
+    """
+
+    def __init__(
+        self,
+        databases: Dict[str, Tuple[str, str]],
+        check_interval: int = 0,
+        cache_size: int = 0,
+    ):
+        self.databases = {
+            name: GeoIPDatabase(path, lookup_type, check_interval, cache_size)
+            for name, (path, lookup_type) in databases.items()
+        }
+
+    def __getitem__(self, name: str) -> GeoIPDatabase:
+        return self.databases[name]
+
+    def open(self) -> None:
+        for database in self.databases.values():
+            database.open()
+
+    def close(self) -> None:
+        for database in self.databases.values():
+            database.close()
+
+    def request_reload(self) -> None:
+        for database in self.databases.values():
+            database.request_reload()
+
+    def status(self) -> Dict[str, dict]:
+        return {name: database.status() for name, database in self.databases.items()}
@@ -0,0 +1,89 @@
+import socket
+from typing import Iterator, Tuple
+
+
+def ipv4_to_int(ip: str) -> int:
+    """Dotted quad to integer, much cheaper than going through `ipaddress`."""
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def int_to_ipv4(value: int) -> str:
+    """Integer to dotted quad."""
+    return socket.inet_ntoa(int(value).to_bytes(4, "big"))
+
+
+def normalize_ipv4(ip: str) -> str:
+    """
+    Normalize IPv4
+
+    Params:
+
+    * **ip**  String, dotted quad, surrounding whitespace is ignored.
+
+    Returns: String, the address in canonical dotted quad form.
+
+    Raises `ValueError` for anything that isn't a dotted quad IPv4 address.
+    """
+    try:
+        return socket.inet_ntop(
+            socket.AF_INET, socket.inet_pton(socket.AF_INET, ip.strip())
+        )
+    except (OSError, AttributeError):
+        raise ValueError(f"{ip!r} is not a valid IPv4 address")
+
+
+def parse_network(entry: str) -> Tuple[str, int, int, int]:
+    """
+    Parse Network
+
+    Params:
+
+    * **entry**  String, IPv4 address or CIDR network such as `10.0.0.0/8`.
+
+    Returns: Tuple of (network address, prefix length, first address, last
+    address), the first and last addresses as integers.  A plain address is a
+    /32.
+
+    Raises `ValueError` for invalid entries, including networks with host bits
+    set.
+    """
+    if not isinstance(entry, str):
+        raise ValueError(f"{entry!r} is not a valid IPv4 address or network")
+    address, slash, prefix_len = entry.strip().partition("/")
+    address = normalize_ipv4(address)
+    start = ipv4_to_int(address)
+    if not slash:
+        return address, 32, start, start
+
+    if not prefix_len.isdigit() or int(prefix_len) > 32:
+        raise ValueError(f"{entry!r} is not a valid IPv4 network")
+    size = 1 << (32 - int(prefix_len))
+    if start & (size - 1):
+        raise ValueError(f"{entry!r} has host bits set")
+    return address, int(prefix_len), start, start + size - 1
+
+
+def summarize_range(start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """
+    Summarize Range
+
+    Params:
+
+    * **start**, **end**  Integers, first and last address of the range.
+
+    Returns: Generator of (network address, prefix length) for the fewest CIDR
+    networks covering the range, in order.  Same result as
+    `ipaddress.summarize_address_range` working on integers, each network is
+    the largest block aligned at the next address that still fits.
+    """
+    while start <= end:
+        # Largest block `start` is aligned to, then the largest that fits.
+        size = start & -start or 1 << 32
+        size = min(size, 1 << ((end - start + 1).bit_length() - 1))
+        yield start, 33 - size.bit_length()
+        start += size
+
+
+def format_network(address: str, prefix_len: int) -> str:
+    """Network address and prefix length to CIDR notation, bare for a /32."""
+    return address if prefix_len == 32 else f"{address}/{prefix_len}"
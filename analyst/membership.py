@@ -0,0 +1,222 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from peewee import fn
+
+from analyst.iputils import ipv4_to_int
+from analyst.models.iplist import IPList, IPListMember
+
+ListEntry = Tuple[str, int, np.ndarray, np.ndarray, Optional[datetime]]
+
+
+def merge_ranges(start: np.ndarray, end: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge Ranges
+
+    Params:
+
+    * **start**, **end**  Arrays of first and last addresses, in any order.
+
+    Returns: Tuple of (start, end) arrays of the disjoint ranges covering the
+    same addresses, sorted.  Adjacent ranges are merged too.
+    """
+    order = np.argsort(start, kind="stable")
+    start = start[order].astype(np.int64)
+    end = end[order].astype(np.int64)
+    if not len(start):
+        return start.astype(np.uint32), end.astype(np.uint32)
+
+    # A range opens a new group unless it starts inside, or right after, every
+    # range before it.
+    reach = np.maximum.accumulate(end)
+    first = np.ones(len(start), dtype=bool)
+    first[1:] = start[1:] > reach[:-1] + 1
+    groups = np.flatnonzero(first)
+    return (
+        start[groups].astype(np.uint32),
+        np.maximum.reduceat(end, groups).astype(np.uint32),
+    )
+
+
+def list_ranges(ip_list_id: int, now: datetime = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    List Ranges
+
+    Returns: Tuple of (start, end) arrays of the disjoint address ranges covered
+    by the entries on a list that are live at `now`, see `merge_ranges`.
+    """
+    query = (
+        IPListMember.select(IPListMember.start, IPListMember.end)
+        .where((IPListMember.ip_list == ip_list_id) & IPListMember.live(now))
+        .tuples()
+    )
+    ranges = np.array(list(query.iterator()), dtype=np.int64).reshape(-1, 2)
+    return merge_ranges(ranges[:, 0], ranges[:, 1])
+
+
+def next_expiry(ip_list_id: int, now: datetime) -> Optional[datetime]:
+    """When the first entry on a list live at `now` expires, None if none do."""
+    return (
+        IPListMember.select(fn.MIN(IPListMember.expires_at))
+        .where((IPListMember.ip_list == ip_list_id) & (IPListMember.expires_at > now))
+        .scalar()
+    )
+
+
+class MembershipIndex:
+    """
+    Membership Index
+
+    Params:
+
+    * **refresh_interval**  Float, seconds between checks of the list versions.
+
+    Per-worker answer to "which lists contain this IP" that never touches
+    SQLite on the hot path.  Every list is held as sorted uint32 arrays of the
+    disjoint address ranges its entries cover, so a lookup is one binary search
+    per list, and a batch is one vectorized `searchsorted` per list.
+
+    `IPList.version` is bumped in the same transaction as every write to a
+    list's items.  At most once per `refresh_interval` a lookup reads the
+    versions (one small query) and reloads only the lists that changed, or
+    that have an entry expired since they were loaded; the other lookups keep
+    serving the previous snapshot while it does.  Writes in this worker call
+    `invalidate()` so they are visible to its next lookup.
+    """
+
+    def __init__(self, refresh_interval: float = 0):
+        self.refresh_interval = refresh_interval
+        self._lists = None
+        self._next_check = 0.0
+        self._stale = set()
+        self._stale_all = False
+        self._lock = threading.Lock()
+
+    def invalidate(self, ip_list_id: int = None) -> None:
+        """
+        Invalidate
+
+        Params:
+
+        * **ip_list_id**  Integer, list to reload, every list when omitted.
+
+        Forces the next lookup to refresh.
+        """
+        if ip_list_id is None:
+            self._stale_all = True
+        else:
+            self._stale.add(ip_list_id)
+        self._next_check = 0.0
+
+    def _refresh(self, lists: Dict[int, ListEntry]) -> Dict[int, ListEntry]:
+        stale, self._stale = self._stale, set()
+        stale_all, self._stale_all = self._stale_all, False
+        self._next_check = time.monotonic() + self.refresh_interval
+
+        refreshed = {}
+        now = datetime.utcnow()
+        # Versions are read before the items, a write landing in between is
+        # picked up by the next refresh.
+        for ip_list_id, name, version in IPList.select(
+            IPList.id, IPList.name, IPList.version
+        ).tuples():
+            entry = lists.get(ip_list_id)
+            if (
+                stale_all
+                or ip_list_id in stale
+                or entry is None
+                or entry[1] != version
+                # Expired entries stay until the sweep, bumping the version.
+                or (entry[4] is not None and entry[4] <= now)
+            ):
+                entry = (
+                    (name, version)
+                    + list_ranges(ip_list_id, now)
+                    + (next_expiry(ip_list_id, now),)
+                )
+            elif entry[0] != name:
+                entry = (name, version) + entry[2:]
+            refreshed[ip_list_id] = entry
+        return refreshed
+
+    def snapshot(self) -> Dict[int, ListEntry]:
+        """
+        Snapshot
+
+        Returns: Dictionary of list id to (name, version, start, end, expiry)
+        with the sorted range arrays and when the first of their entries
+        expires, refreshed first if due.  The dictionary is never mutated, it
+        is safe to use without holding a lock.
+        """
+        lists = self._lists
+        if lists is None:
+            with self._lock:
+                if self._lists is None:
+                    self._lists = self._refresh({})
+                return self._lists
+
+        if time.monotonic() >= self._next_check:
+            # Only one thread refreshes, the others carry on with the old lists.
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._lists = lists = self._refresh(lists)
+                finally:
+                    self._lock.release()
+        return lists
+
+    def lists_for(self, ip: str) -> List[str]:
+        """
+        Lists For
+
+        Params:
+
+        * **ip**  String, IP address.
+
+        Returns: Sorted list of the names of IP lists containing `ip`.
+        """
+        try:
+            # A uint32 scalar, a Python int would make numpy upcast the array.
+            value = np.uint32(ipv4_to_int(ip))
+        except OSError:
+            return []
+        names = []
+        for name, _, start, end, _ in self.snapshot().values():
+            position = np.searchsorted(start, value, side="right") - 1
+            if position >= 0 and end[position] >= value:
+                names.append(name)
+        return sorted(names)
+
+    def bulk_lists_for(self, ips: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Bulk Lists For
+
+        Params:
+
+        * **ips**  Iterable of IPv4 address strings, may contain duplicates.
+
+        Returns: Dictionary of every unique address to the sorted names of the
+        IP lists containing it.  Entries that aren't IPv4 addresses are on no
+        list, as in `lists_for`.
+        """
+        unique_ips = list(dict.fromkeys(ips))
+        values = np.zeros(len(unique_ips), dtype=np.uint32)
+        valid = np.ones(len(unique_ips), dtype=bool)
+        for i, ip in enumerate(unique_ips):
+            try:
+                values[i] = ipv4_to_int(ip)
+            except (OSError, TypeError):
+                valid[i] = False
+        names = [[] for _ in unique_ips]
+        for name, _, start, end, _ in sorted(
+            self.snapshot().values(), key=lambda entry: entry[0]
+        ):
+            if not len(start):
+                continue
+            position = np.searchsorted(start, values, side="right") - 1
+            found = (position >= 0) & (end[np.maximum(position, 0)] >= values)
+            for i in np.flatnonzero(found & valid).tolist():
+                names[i].append(name)
+        return dict(zip(unique_ips, names))
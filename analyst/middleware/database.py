@@ -0,0 +1,71 @@
+from typing import Callable, Iterable
+
+import falcon
+
+from analyst.models.manager import DBManager
+
+
+class ClosingStream:
+    """
+    Closing Stream
+
+    Params:
+
+    * **chunks**  Iterable response body.
+    * **on_close**  Callable run once, when the body is exhausted or the
+      server closes it.
+
+    A plain generator wouldn't do, one that never started ignores `close()`
+    and never runs its `finally`.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], on_close: Callable[[], None]):
+        self.chunks = iter(chunks)
+        self.on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        try:
+            return next(self.chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        on_close, self.on_close = self.on_close, None
+        if on_close is None:
+            return
+        try:
+            if hasattr(self.chunks, "close"):
+                self.chunks.close()
+        finally:
+            on_close()
+
+
+class DatabaseConnectionMiddleware:
+    """
+    Database Connection Middleware
+
+    Opens the worker's database connection when a request comes in and closes
+    it once the response is ready, the lifecycle peewee recommends for web
+    apps, so no connection outlives a request or is shared with a forked
+    process.  A streamed response may still read while it is sent, its
+    connection is closed once the body is exhausted or the server closes it.
+    In-memory databases are left alone, closing one would lose it.
+    """
+
+    def __init__(self, manager: DBManager):
+        self.manager = manager
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response):
+        self.manager.connect()
+
+    def process_response(
+        self, req: falcon.Request, resp: falcon.Response, resource, req_succeeded: bool
+    ):
+        if resp.stream is not None:
+            resp.stream = ClosingStream(resp.stream, self.manager.close)
+        else:
+            self.manager.close()
@@ -1,15 +1,26 @@
 import falcon
 
+from analyst.serializers.ndjson import MEDIA_NDJSON
+
+DEFAULT_MEDIA_TYPES = (falcon.MEDIA_JSON, MEDIA_NDJSON)
+
 
 class RequireJSONMiddleware:
     """
     Require JSON Middleware
 
     Ensure each requests is expecting a JSON response.  Check HTTP Header `Accept`
+
+    Newline delimited JSON (`application/x-ndjson`) is allowed for streamed bulk
+    responses.  A resource serving other formats lists them in a `media_types`
+    attribute.
     """
 
-    def process_request(self, req: falcon.Request, resp: falcon.Response):
-        if not req.client_accepts_json:
+    def process_resource(
+        self, req: falcon.Request, resp: falcon.Response, resource, params: dict
+    ):
+        media_types = getattr(resource, "media_types", DEFAULT_MEDIA_TYPES)
+        if not any(req.client_accepts(media_type) for media_type in media_types):
             raise falcon.HTTPNotAcceptable(
                 "This API only accepts responses encoded as JSON."
             )
@@ -6,7 +6,7 @@ from falcon import HTTPNotFound
 
 
 class BaseModel(peewee.Model):
-    created_on = peewee.DateTimeField(default=datetime.utcnow())
+    created_on = peewee.DateTimeField(default=datetime.utcnow)
     modified_on = peewee.DateTimeField(null=True)
 
     def save(self, *args, **kwargs) -> int:
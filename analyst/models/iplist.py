@@ -1,12 +1,40 @@
 import ipaddress
+from datetime import datetime, timedelta
+from typing import Dict, Iterable
+
 import peewee
+from peewee import SQL, chunked, fn
 
+from analyst.iputils import format_network, parse_network
 from analyst.models import BaseModel
 from analyst.models.user import User
 
 
 class ListItem(BaseModel):
-    ip = peewee.IPField(unique=True)
+    # Network address, the whole entry for a single address.
+    ip = peewee.IPField(index=True)
+    prefix_len = peewee.IntegerField(default=32)
+    # First and last address as integers, so containment and overlap queries
+    # are range predicates on the (start, end) index.
+    start = peewee.IntegerField()
+    end = peewee.IntegerField()
+
+    class Meta:
+        indexes = ((("start", "end"), True),)
+
+    def save(self, *args, **kwargs) -> int:
+        if self.start is None:
+            _, _, self.start, self.end = parse_network(self.cidr)
+        return super().save(*args, **kwargs)
+
+    @property
+    def cidr(self) -> str:
+        return format_network(self.ip, self.prefix_len)
+
+    @classmethod
+    def overlapping(cls, start: int, end: int) -> peewee.Expression:
+        """Entries sharing at least one address with `start` to `end`."""
+        return (cls.start <= end) & (cls.end >= start)
 
 
 class IPList(BaseModel):
@@ -15,6 +43,54 @@ class IPList(BaseModel):
     is_active = peewee.BooleanField(default=True)
     is_public = peewee.BooleanField(default=True)
     created_by = peewee.ForeignKeyField(User)
+    # Bumped with every change to the list or its items, see `MembershipIndex`.
+    version = peewee.IntegerField(default=0)
+    # Changes up to this version have been dropped from `IPListChange`.
+    compacted_version = peewee.IntegerField(default=0)
+    # Seconds new items live for unless given an expiry, never expire if null.
+    default_ttl = peewee.IntegerField(null=True)
+
+    @property
+    def etag(self) -> str:
+        """Changes with every write to the list, across deleting and recreating."""
+        return f"{self.id}.{self.version}"
+
+    def last_expired(self, now: datetime = None) -> datetime:
+        """Latest expiry passed by items the sweep hasn't removed yet, or None."""
+        return (
+            IPListItem.select(fn.MAX(IPListItem.expires_at))
+            # `+ 0` keeps SQLite on the `expires_at` index, which only holds a
+            # few expired items between sweeps, rather than the list's.
+            .where(
+                (IPListItem.expires_at <= (now or datetime.utcnow()))
+                & (IPListItem.ip_list + 0 == self.id)
+            ).scalar()
+        )
+
+    def items_etag(self, now: datetime = None) -> str:
+        """
+        Like `etag`, and also changes as soon as an item expires, for responses
+        listing the live items.  The sweep bumps the version once it removes
+        them.
+        """
+        expired = self.last_expired(now)
+        if expired is None:
+            return self.etag
+        return f"{self.etag}.{expired:%Y%m%d%H%M%S%f}"
+
+    def bump_version(self) -> int:
+        """Record a change to the list's items, call inside the same transaction."""
+        IPList.update(version=IPList.version + 1).where(IPList.id == self.id).execute()
+        self.version = (
+            IPList.select(IPList.version).where(IPList.id == self.id).scalar()
+        )
+        return self.version
+
+    def expiry(self, now: datetime = None) -> datetime:
+        """When items added now expire, None if they don't."""
+        if not self.default_ttl:
+            return None
+        return (now or datetime.utcnow()) + timedelta(seconds=self.default_ttl)
 
 
 class IPListItem(BaseModel):
@@ -22,3 +98,505 @@ class IPListItem(BaseModel):
     ip_list = peewee.ForeignKeyField(IPList)
     added_by = peewee.ForeignKeyField(User)
     note = peewee.CharField(null=True)
+    # Removed by `sweep_expired` after this, reads skip it as soon as it passes.
+    expires_at = peewee.DateTimeField(null=True, index=True)
+
+    class Meta:
+        # An entry is on a list once, see `unique_list_items`.
+        indexes = ((("ip_list", "ip"), True),)
+
+    @classmethod
+    def live(cls, now: datetime = None) -> peewee.Expression:
+        """Items that haven't expired."""
+        return cls.expires_at.is_null() | (cls.expires_at > (now or datetime.utcnow()))
+
+    @classmethod
+    def create_table(cls, safe: bool = True, **options) -> None:
+        super().create_table(safe, **options)
+        create_member_triggers(cls._meta.database)
+
+
+class IPListMember(peewee.Model):
+    """
+    IP List Member
+
+    The entries on each list with the list id and first and last address held
+    directly, keyed on (ip_list, start, end) in a `WITHOUT ROWID` table, so
+    reading a list or checking an entry is a range scan of one B-tree with no
+    joins.  A denormalized copy of `IPListItem` kept in step by the triggers in
+    `MEMBER_TRIGGERS`, never written to directly.
+    """
+
+    ip_list = peewee.ForeignKeyField(IPList, index=False)
+    start = peewee.IntegerField()
+    end = peewee.IntegerField()
+    expires_at = peewee.DateTimeField(null=True)
+
+    class Meta:
+        primary_key = peewee.CompositeKey("ip_list", "start", "end")
+        without_rowid = True
+
+    @classmethod
+    def live(cls, now: datetime = None) -> peewee.Expression:
+        """Members that haven't expired."""
+        return cls.expires_at.is_null() | (cls.expires_at > (now or datetime.utcnow()))
+
+
+MEMBER_TRIGGERS = {
+    "iplistitem_member_insert": """
+        AFTER INSERT ON "iplistitem" BEGIN
+            INSERT OR REPLACE INTO "iplistmember"
+                ("ip_list_id", "start", "end", "expires_at")
+            SELECT NEW."ip_list_id", "start", "end", NEW."expires_at"
+            FROM "listitem" WHERE "id" = NEW."ip_id";
+        END""",
+    "iplistitem_member_update": """
+        AFTER UPDATE OF "ip_list_id", "ip_id", "expires_at" ON "iplistitem" BEGIN
+            DELETE FROM "iplistmember" WHERE "ip_list_id" = OLD."ip_list_id"
+                AND "start" = (SELECT "start" FROM "listitem" WHERE "id" = OLD."ip_id")
+                AND "end" = (SELECT "end" FROM "listitem" WHERE "id" = OLD."ip_id");
+            INSERT OR REPLACE INTO "iplistmember"
+                ("ip_list_id", "start", "end", "expires_at")
+            SELECT NEW."ip_list_id", "start", "end", NEW."expires_at"
+            FROM "listitem" WHERE "id" = NEW."ip_id";
+        END""",
+    "iplistitem_member_delete": """
+        AFTER DELETE ON "iplistitem" BEGIN
+            DELETE FROM "iplistmember" WHERE "ip_list_id" = OLD."ip_list_id"
+                AND "start" = (SELECT "start" FROM "listitem" WHERE "id" = OLD."ip_id")
+                AND "end" = (SELECT "end" FROM "listitem" WHERE "id" = OLD."ip_id");
+        END""",
+}
+
+
+def create_member_triggers(database: peewee.Database) -> None:
+    """Keep `IPListMember` in step with every write to `IPListItem`."""
+    for name, trigger in MEMBER_TRIGGERS.items():
+        database.execute_sql(f'CREATE TRIGGER IF NOT EXISTS "{name}" {trigger}')
+
+
+class IPListChange(BaseModel):
+    """
+    IP List Change
+
+    Append-only log of the entries added to and removed from a list, stamped
+    with the list version the change produced.
+    """
+
+    ADD = "add"
+    REMOVE = "remove"
+
+    # The feed reads a list's changes in version order, all from the index
+    # below, which also serves lookups by list alone.
+    ip_list = peewee.ForeignKeyField(IPList, index=False)
+    version = peewee.IntegerField()
+    action = peewee.CharField(max_length=6)
+    ip = peewee.ForeignKeyField(ListItem)
+
+    class Meta:
+        indexes = ((("ip_list", "version", "action", "ip"), False),)
+
+
+def log_changes(
+    ip_list: IPList, action: str, items: peewee.Expression, version: int = None
+) -> None:
+    """
+    Log Changes
+
+    Params:
+
+    * **ip_list**  `IPList` that changed.
+    * **action**  `IPListChange.ADD` or `IPListChange.REMOVE`.
+    * **items**  Expression selecting the `IPListItem` rows that changed.
+    * **version**  Integer, list version the change produced, defaults to the
+      current one.
+    """
+    version = ip_list.version if version is None else version
+    IPListChange.insert_from(
+        IPListItem.select(
+            IPListItem.ip_list,
+            peewee.Value(version),
+            peewee.Value(action),
+            IPListItem.ip,
+            peewee.Value(IPListChange.created_on.db_value(datetime.utcnow())),
+        ).where(items),
+        fields=[
+            IPListChange.ip_list,
+            IPListChange.version,
+            IPListChange.action,
+            IPListChange.ip,
+            IPListChange.created_on,
+        ],
+    ).execute()
+
+
+def write_transaction():
+    """
+    Write Transaction
+
+    Returns: `atomic()` context taking the SQLite write lock when it begins.
+
+    A deferred transaction that reads before it writes can't wait for the lock
+    when it upgrades, SQLite fails it straight away with "database is locked"
+    if another connection is writing.  Opened `IMMEDIATE`, it waits out
+    `busy_timeout` like any other write.  Only the outermost block takes the
+    lock, nested ones are savepoints.
+    """
+    return IPList._meta.database.atomic("IMMEDIATE")
+
+
+def compact_changes(ip_list: IPList, keep_versions: int) -> None:
+    """
+    Compact Changes
+
+    Drops the change log of `ip_list` older than its last `keep_versions`
+    versions.  Clients asking for changes since a dropped version are told to
+    resync from a full export instead.
+    """
+    floor = ip_list.version - keep_versions
+    if floor <= ip_list.compacted_version:
+        return
+    with write_transaction():
+        IPListChange.delete().where(
+            (IPListChange.ip_list == ip_list) & (IPListChange.version <= floor)
+        ).execute()
+        IPList.update(compacted_version=floor).where(IPList.id == ip_list.id).execute()
+    ip_list.compacted_version = floor
+
+
+# `add_ips` and `remove_ips` bind one entry at a time through `executemany`,
+# the chunk size only bounds memory and the work done per call into SQLite.
+WRITE_CHUNK_SIZE = 10000
+
+# SQLite before 3.32 allows 999 bound parameters per statement, for `IN` lists.
+IN_CHUNK_SIZE = 900
+
+
+def insert_list_items_sql() -> str:
+    """
+    Insert List Items SQL
+
+    Returns: The `INSERT OR IGNORE ... SELECT` statement `add_ips` runs per
+    entry, taking (ip_list, added_by, note, created_on, expires_at, start, end).
+    The list item is found on the `listitem` (start, end) index, entries
+    already on the list hit the (ip_list, ip) unique index.
+    """
+    param = SQL(IPList._meta.database.param)
+    sql, _ = (
+        IPListItem.insert_from(
+            ListItem.select(param, ListItem.id, param, param, param, param).where(
+                (ListItem.start == param) & (ListItem.end == param)
+            ),
+            fields=[
+                IPListItem.ip_list,
+                IPListItem.ip,
+                IPListItem.added_by,
+                IPListItem.note,
+                IPListItem.created_on,
+                IPListItem.expires_at,
+            ],
+        )
+        .on_conflict_ignore()
+        .sql()
+    )
+    return sql
+
+
+def add_ips(
+    ip_list: IPList,
+    ips: Iterable[str],
+    added_by: User,
+    note: str = None,
+    chunk_size: int = WRITE_CHUNK_SIZE,
+    expires_at: datetime = None,
+) -> Dict[str, int]:
+    """
+    Add IPs
+
+    Params:
+
+    * **ip_list**  `IPList` to add to.
+    * **ips**  Iterable of IPv4 address or CIDR network strings, consumed in
+      chunks, may contain duplicates.
+    * **added_by**  `User` recorded on the new list items.
+    * **note**  Optional note recorded on the new list items.
+    * **expires_at**  Optional expiry of the new list items, defaults to the
+      list's `default_ttl` from now.  Entries already on the list that would
+      expire sooner are pushed out to it.
+
+    Returns: Dictionary of `requested` (entries read), `created` (new
+    `ListItem` rows), `added` (new `IPListItem` rows) and `skipped` (entries
+    already on the list or repeated) counts.
+
+    Runs in one transaction.  Each chunk is an `INSERT OR IGNORE` of the list
+    items followed by an `INSERT OR IGNORE ... SELECT` of the list entries, both
+    rendered once and run with `executemany`.  Nothing is held in memory beyond
+    one chunk.  An invalid entry raises `ValueError` and rolls the whole import
+    back.
+    """
+    database = IPList._meta.database
+    param = SQL(database.param)
+    now = datetime.utcnow()
+    expires_at = expires_at or ip_list.expiry(now)
+    now = ListItem.created_on.db_value(now)
+    expires_at = IPListItem.expires_at.db_value(expires_at)
+
+    insert_items, _ = (
+        ListItem.insert_many(
+            [(param,) * 5],
+            fields=[
+                ListItem.ip,
+                ListItem.prefix_len,
+                ListItem.start,
+                ListItem.end,
+                ListItem.created_on,
+            ],
+        )
+        .on_conflict_ignore()
+        .sql()
+    )
+    insert_list_items = insert_list_items_sql()
+    extend_list_items, _ = (
+        IPListItem.update(expires_at=param)
+        .where(
+            (IPListItem.ip_list == param)
+            & IPListItem.ip.in_(
+                ListItem.select(ListItem.id).where(
+                    (ListItem.start == param) & (ListItem.end == param)
+                )
+            )
+            & (IPListItem.expires_at < param)
+        )
+        .sql()
+    )
+
+    requested = 0
+    created = 0
+    extended = 0
+    with write_transaction():
+        # Row ids only grow, everything past this one is added by this call.
+        last_item = IPListItem.select(fn.MAX(IPListItem.id)).scalar() or 0
+
+        cursor = database.cursor()
+        for chunk in chunked(ips, chunk_size):
+            requested += len(chunk)
+            ranges = [parse_network(entry)[1:] for entry in chunk]
+            cursor.executemany(
+                insert_items,
+                [
+                    (start, prefix_len, start, end, now)
+                    for prefix_len, start, end in ranges
+                ],
+            )
+            # Summed over the chunk, rows already there are ignored.
+            created += cursor.rowcount
+            cursor.executemany(
+                insert_list_items,
+                [
+                    (ip_list.id, added_by.id, note, now, expires_at, start, end)
+                    for _, start, end in ranges
+                ],
+            )
+            if expires_at is not None:
+                cursor.executemany(
+                    extend_list_items,
+                    [
+                        (expires_at, ip_list.id, start, end, expires_at)
+                        for _, start, end in ranges
+                    ],
+                )
+                extended += cursor.rowcount
+
+        added = IPListItem.select().where(IPListItem.id > last_item).count()
+        # Extending an entry that had expired, but wasn't swept yet, brings it
+        # back, so that is a change too.
+        if added or extended:
+            ip_list.bump_version()
+        if added:
+            log_changes(ip_list, IPListChange.ADD, IPListItem.id > last_item)
+
+    return {
+        "requested": requested,
+        "created": created,
+        "added": added,
+        "skipped": requested - added,
+    }
+
+
+def remove_ips(
+    ip_list: IPList, ips: Iterable[str], chunk_size: int = WRITE_CHUNK_SIZE
+) -> int:
+    """
+    Remove IPs
+
+    Returns: Integer, number of `ips` removed from `ip_list`.  Entries match
+    exactly, removing an address doesn't split a network containing it.  Runs
+    in one transaction like `add_ips`.
+    """
+    database = IPList._meta.database
+    param = SQL(database.param)
+    matching = (IPListItem.ip_list == param) & IPListItem.ip.in_(
+        ListItem.select(ListItem.id).where(
+            (ListItem.start == param) & (ListItem.end == param)
+        )
+    )
+    delete_items, _ = IPListItem.delete().where(matching).sql()
+    log_items, _ = IPListChange.insert_from(
+        IPListItem.select(IPListItem.ip_list, param, param, IPListItem.ip, param).where(
+            matching
+        ),
+        fields=[
+            IPListChange.ip_list,
+            IPListChange.version,
+            IPListChange.action,
+            IPListChange.ip,
+            IPListChange.created_on,
+        ],
+    ).sql()
+    now = IPListChange.created_on.db_value(datetime.utcnow())
+
+    removed = 0
+    with write_transaction() as transaction:
+        # The removals are logged against the version they produce, undone
+        # below when nothing matched.
+        version = ip_list.bump_version()
+        cursor = database.cursor()
+        for chunk in chunked(ips, chunk_size):
+            # An entry given twice would be logged twice, the log runs first.
+            rows = list(
+                dict.fromkeys(
+                    (ip_list.id,) + parse_network(entry)[2:] for entry in chunk
+                )
+            )
+            cursor.executemany(
+                log_items, [(version, IPListChange.REMOVE, now) + row for row in rows]
+            )
+            cursor.executemany(delete_items, rows)
+            removed += cursor.rowcount
+        if not removed:
+            transaction.rollback()
+            ip_list.version = version - 1
+    return removed
+
+
+def collapse_ranges(ip_list: IPList, added_by: User, note: str = None) -> int:
+    """
+    Collapse Ranges
+
+    Params:
+
+    * **ip_list**  `IPList` to collapse.
+    * **added_by**, **note**  Recorded on the list items that replace others.
+
+    Returns: Integer, number of list items replaced.
+
+    Merges overlapping and adjacent entries into the fewest CIDR networks that
+    cover the same addresses.  Entries that are already part of the result keep
+    their note and author, expired ones are dropped.
+    """
+    with write_transaction():
+        rows = list(
+            IPListItem.select(
+                IPListItem.id, ListItem.start, ListItem.end, IPListItem.live()
+            )
+            .join(ListItem)
+            .where(IPListItem.ip_list == ip_list)
+            .order_by(ListItem.start)
+            .tuples()
+        )
+        live = [(item_id, start, end) for item_id, start, end, ok in rows if ok]
+
+        merged = []
+        for _, start, end in live:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        networks = {}
+        for start, end in merged:
+            for network in ipaddress.summarize_address_range(
+                ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)
+            ):
+                key = (int(network.network_address), int(network.broadcast_address))
+                networks[key] = str(network)
+
+        stale = [
+            item_id
+            for item_id, start, end, ok in rows
+            if not ok or (start, end) not in networks
+        ]
+        if not stale:
+            return 0
+
+        present = {(start, end) for _, start, end in live}
+        ip_list.bump_version()
+        for chunk in chunked(stale, IN_CHUNK_SIZE):
+            log_changes(ip_list, IPListChange.REMOVE, IPListItem.id.in_(chunk))
+            IPListItem.delete().where(IPListItem.id.in_(chunk)).execute()
+        add_ips(
+            ip_list,
+            (network for key, network in networks.items() if key not in present),
+            added_by,
+            note,
+        )
+    return len(stale)
+
+
+def delete_items(ip_list: IPList, items: peewee.Expression) -> int:
+    """
+    Delete Items
+
+    Params:
+
+    * **ip_list**  `IPList` to delete from.
+    * **items**  Expression selecting the `IPListItem` rows to delete.
+
+    Returns: Integer, number of list items deleted, logged as removals under a
+    new list version.  Nothing changes when none match.
+    """
+    items = (IPListItem.ip_list == ip_list) & items
+    with write_transaction() as transaction:
+        version = ip_list.bump_version()
+        log_changes(ip_list, IPListChange.REMOVE, items)
+        deleted = IPListItem.delete().where(items).execute()
+        if not deleted:
+            transaction.rollback()
+            ip_list.version = version - 1
+    return deleted
+
+
+def sweep_expired(batch_size: int, now: datetime = None) -> int:
+    """
+    Sweep Expired
+
+    Params:
+
+    * **batch_size**  Integer, most list items deleted.
+    * **now**  Optional datetime items expire against, defaults to now.
+
+    Returns: Integer, number of expired list items deleted.
+
+    The oldest expired items are picked through the `expires_at` index and
+    deleted with `delete_items` in one short transaction, so callers sweeping a
+    backlog in batches let other writers in between them.
+    """
+    expired = IPListItem.expires_at <= (now or datetime.utcnow())
+    by_list = {}
+    for item_id, ip_list_id in (
+        IPListItem.select(IPListItem.id, IPListItem.ip_list)
+        .where(expired)
+        .order_by(IPListItem.expires_at)
+        .limit(batch_size)
+        .tuples()
+    ):
+        by_list.setdefault(ip_list_id, []).append(item_id)
+    if not by_list:
+        return 0
+
+    deleted = 0
+    with write_transaction():
+        for ip_list in IPList.select().where(IPList.id.in_(list(by_list))):
+            for chunk in chunked(by_list[ip_list.id], IN_CHUNK_SIZE):
+                deleted += delete_items(ip_list, IPListItem.id.in_(chunk) & expired)
+    return deleted
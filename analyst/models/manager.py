@@ -1,15 +1,44 @@
 from peewee import *
 from analyst.models.user import User
-from analyst.models.iplist import ListItem, IPList, IPListItem
+from analyst.models.iplist import ListItem, IPList, IPListItem, IPListChange, IPListMember
+from analyst.models.migrations import run_migrations
 
 
 class DBManager:
-    def __init__(self, db_path: str, db_classes: list = [User, ListItem, IPList, IPListItem]):
+    def __init__(self, db_path: str, db_classes: list = [User, ListItem, IPList, IPListItem, IPListChange, IPListMember], pragmas: dict = None):
         self.db_path = db_path
         self.db_classes = db_classes
+        self.pragmas = pragmas or {}
         self.db = None
 
+    @property
+    def in_memory(self) -> bool:
+        """ An in-memory database only lives as long as its one connection. """
+        return self.db_path == ":memory:"
+
     def setup(self):
-        self.db = SqliteDatabase(self.db_path)
+        # Pragmas are applied to every new connection.  busy_timeout is also
+        # the sqlite3 module's timeout, in seconds.
+        busy_timeout = self.pragmas.get("busy_timeout", 5000)
+        self.db = SqliteDatabase(
+            self.db_path,
+            pragmas=list(self.pragmas.items()),
+            timeout=busy_timeout / 1000,
+        )
         self.db.bind(self.db_classes)
-        self.db.create_tables(self.db_classes)
+        self.migrate()
+        if not self.in_memory:
+            # Don't hand an open connection to the forked workers.
+            self.db.close()
+
+    def connect(self):
+        if not self.in_memory:
+            self.db.connect(reuse_if_open=True)
+
+    def close(self):
+        if not self.in_memory and not self.db.is_closed():
+            self.db.close()
+
+    def migrate(self) -> list:
+        """ Bring the schema up to date, see `analyst.models.migrations`. """
+        return run_migrations(self.db, self.db_classes)
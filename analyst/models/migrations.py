@@ -0,0 +1,162 @@
+from typing import Callable, List
+
+import peewee
+from playhouse.migrate import SqliteMigrator, migrate
+
+from analyst.models.iplist import IPListMember, create_member_triggers
+
+Migration = Callable[[peewee.SqliteDatabase, List[str]], None]
+
+# Applied in order, the schema version of a database (`PRAGMA user_version`) is
+# the number of migrations it has had.  Only ever append to this list.
+MIGRATIONS: List[Migration] = []
+
+
+def migration(func: Migration) -> Migration:
+    MIGRATIONS.append(func)
+    return func
+
+
+def columns(database: peewee.SqliteDatabase, table: str) -> set:
+    return {column.name for column in database.get_columns(table)}
+
+
+def indexes(database: peewee.SqliteDatabase, table: str) -> set:
+    return {index.name for index in database.get_indexes(table)}
+
+
+@migration
+def list_item_ranges(database: peewee.SqliteDatabase, tables: List[str]) -> None:
+    """List items became ranges, existing single addresses are /32s."""
+    if "listitem" not in tables or "start" in columns(database, "listitem"):
+        return
+    migrator = SqliteMigrator(database)
+    migrate(
+        migrator.drop_index("listitem", "listitem_ip"),
+        migrator.add_column("listitem", "prefix_len", peewee.IntegerField(default=32)),
+        migrator.add_column("listitem", "start", peewee.IntegerField(default=0)),
+        migrator.add_column("listitem", "end", peewee.IntegerField(default=0)),
+    )
+    database.execute_sql(
+        'UPDATE "listitem" SET "start" = CAST("ip" AS INTEGER), '
+        '"end" = CAST("ip" AS INTEGER)'
+    )
+
+
+@migration
+def list_versions_and_expiry(
+    database: peewee.SqliteDatabase, tables: List[str]
+) -> None:
+    """Columns for list versions, the change log and expiring items."""
+    migrator = SqliteMigrator(database)
+    added = {
+        "iplist": (
+            ("version", peewee.IntegerField(default=0)),
+            ("compacted_version", peewee.IntegerField(default=0)),
+            ("default_ttl", peewee.IntegerField(null=True)),
+        ),
+        "iplistitem": (("expires_at", peewee.DateTimeField(null=True)),),
+    }
+    for table, fields in added.items():
+        if table not in tables:
+            continue
+        existing = columns(database, table)
+        migrate(
+            *(
+                migrator.add_column(table, name, field)
+                for name, field in fields
+                if name not in existing
+            )
+        )
+    if "iplistitem" in tables and "iplistitem_expires_at" not in indexes(
+        database, "iplistitem"
+    ):
+        migrate(migrator.add_index("iplistitem", ("expires_at",)))
+
+
+@migration
+def unique_list_items(database: peewee.SqliteDatabase, tables: List[str]) -> None:
+    """
+    An entry is on a list at most once.  Duplicates left by older versions are
+    dropped, keeping the first one added (and its note and author).
+    """
+    if "iplistitem" not in tables:
+        return
+    database.execute_sql(
+        'DELETE FROM "iplistitem" WHERE "id" NOT IN ('
+        'SELECT MIN("id") FROM "iplistitem" GROUP BY "ip_list_id", "ip_id")'
+    )
+    migrate(
+        SqliteMigrator(database).add_index(
+            "iplistitem", ("ip_list_id", "ip_id"), unique=True
+        )
+    )
+
+
+@migration
+def change_feed_index(database: peewee.SqliteDatabase, tables: List[str]) -> None:
+    """The change feed reads only from the index, which replaces two others."""
+    if "iplistchange" not in tables:
+        return
+    migrator = SqliteMigrator(database)
+    existing = indexes(database, "iplistchange")
+    migrate(
+        *(
+            migrator.drop_index("iplistchange", name)
+            for name in ("iplistchange_ip_list_id", "iplistchange_ip_list_id_version")
+            if name in existing
+        ),
+        migrator.add_index(
+            "iplistchange", ("ip_list_id", "version", "action", "ip_id")
+        ),
+    )
+
+
+@migration
+def list_members(database: peewee.SqliteDatabase, tables: List[str]) -> None:
+    """The `IPListMember` copy of every list's entries, and its triggers."""
+    if "iplistitem" not in tables:
+        return
+    database.create_tables([IPListMember])
+    create_member_triggers(database)
+    database.execute_sql(
+        'INSERT OR REPLACE INTO "iplistmember" '
+        '("ip_list_id", "start", "end", "expires_at") '
+        'SELECT "ip_list_id", "start", "end", "expires_at" '
+        'FROM "iplistitem" JOIN "listitem" ON "listitem"."id" = "ip_id"'
+    )
+
+
+def run_migrations(database: peewee.SqliteDatabase, models: list) -> List[str]:
+    """
+    Run Migrations
+
+    Params:
+
+    * **database**  Open `SqliteDatabase` the models are bound to.
+    * **models**  List of model classes, tables missing after migrating are
+      created.
+
+    Returns: List of the names of the migrations applied.
+
+    Each migration runs in its own transaction together with the schema version
+    it produces, so an interrupted upgrade resumes where it stopped.  A new
+    database is created from the models at the latest version, without running
+    any migrations.
+    """
+    tables = database.get_tables()
+    if not tables:
+        with database.atomic():
+            database.create_tables(models)
+            database.pragma("user_version", len(MIGRATIONS))
+        return []
+
+    applied = []
+    version = database.pragma("user_version")
+    for number, func in enumerate(MIGRATIONS[version:], version + 1):
+        with database.atomic():
+            func(database, tables)
+            database.pragma("user_version", number)
+        applied.append(func.__name__)
+    database.create_tables(models)
+    return applied
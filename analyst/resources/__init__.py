@@ -1,7 +1,10 @@
 from functools import wraps
-from typing import Callable
+from typing import Callable, Dict, List, Optional, Sized, Tuple
 
 import falcon
+import peewee
+
+from analyst.asnindex import ASNIndex, ASNIndexLoader
 
 
 class BaseResource:
@@ -21,3 +24,107 @@ def check_permission(check_func: Callable) -> Callable:
         return wrapper
 
     return decorator
+
+
+def check_batch_size(items: Sized, max_size: int) -> None:
+    """
+    Check Batch Size
+
+    Raises `falcon.HTTPBadRequest` if `items` holds more than `max_size` entries.
+    The JSON schemas carry a hard ceiling, this applies the configured limit.
+    """
+    if len(items) > max_size:
+        raise falcon.HTTPBadRequest(
+            "Request data failed validation",
+            f"Batch of {len(items)} exceeds the maximum of {max_size}.",
+        )
+
+
+def require_asn_index(asn_index: ASNIndexLoader) -> ASNIndex:
+    """
+    Require ASN Index
+
+    Returns: The compiled ASN index for the current database build.
+
+    Raises `falcon.HTTPServiceUnavailable` while it is still being built.
+    """
+    index = asn_index.current()
+    if index is None:
+        raise falcon.HTTPServiceUnavailable(
+            "Service Unavailable", "ASN index is being built.", retry_after=30
+        )
+    return index
+
+
+def not_modified(req: falcon.Request, resp: falcon.Response, etag: str) -> bool:
+    """
+    Not Modified
+
+    Params:
+
+    * **etag**  String, strong entity tag of the representation, unquoted.
+
+    Returns: Boolean, True (with the status set to 304) if the client's
+    `If-None-Match` already has `etag` and the body can be skipped.
+    """
+    resp.etag = f'"{etag}"'
+    if_none_match = req.if_none_match or ()
+    if "*" in if_none_match or etag in if_none_match:
+        resp.status = falcon.HTTP_304
+        return True
+    return False
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def created_between(req: falcon.Request, field: peewee.Field) -> List:
+    """
+    Created Between
+
+    Returns: List of expressions filtering `field` on the optional
+    `created_after` and `created_before` query parameters
+    (`2020-01-31T00:00:00Z`).
+    """
+    filters = []
+    after = req.get_param_as_datetime("created_after")
+    if after is not None:
+        filters.append(field >= after)
+    before = req.get_param_as_datetime("created_before")
+    if before is not None:
+        filters.append(field < before)
+    return filters
+
+
+def keyset_page(
+    req: falcon.Request,
+    query: peewee.Select,
+    key: peewee.Field,
+    *filters: peewee.Expression,
+) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Keyset Page
+
+    Params:
+
+    * **query**  Select of dictionaries including `key`, unordered.
+    * **key**  Unique integer field the pages are ordered by.
+    * **filters**  Expressions the rows must match.
+
+    Returns: Tuple of (rows, next), rows after the `after` query parameter, at
+    most `limit` of them, and the `after` of the following page or None on the
+    last one.
+
+    Pages continue from the last key instead of skipping rows with `OFFSET`,
+    so with an index on `key` every page costs the same as the first.
+    """
+    limit = req.get_param_as_int(
+        "limit", min_value=1, max_value=MAX_PAGE_SIZE, default=DEFAULT_PAGE_SIZE
+    )
+    after = req.get_param_as_int("after", min_value=0, default=0)
+    rows = list(query.where(key > after, *filters).order_by(key).limit(limit + 1))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, rows[-1][key.name]
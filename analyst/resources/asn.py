@@ -1,46 +1,100 @@
+import time
+from typing import Dict, Union
+
 import falcon
-import geoip2.database
+import geoip2.errors
+import geoip2.models
 from falcon.media.validators.jsonschema import validate
 
-from analyst.resources import BaseResource
+from analyst.asnindex import ASNIndexLoader
+from analyst.bulk import bulk_lookup
+from analyst.geoip import ReaderRegistry
+from analyst.resources import BaseResource, check_batch_size, require_asn_index
 from analyst.schemas import load_schema
+from analyst.serializers.ndjson import (
+    MEDIA_NDJSON,
+    client_prefers_ndjson,
+    ndjson_stream,
+)
+
+
+def asn_record(lookup: geoip2.models.ASN) -> Dict[str, Union[int, str]]:
+    return {
+        "asn_number": lookup.autonomous_system_number,
+        "asn_org": lookup.autonomous_system_organization,
+    }
 
 
 class ASNResource(BaseResource):
-    def __init__(self, asn_path):
-        self.asn_path = asn_path
+    def __init__(
+        self,
+        readers: ReaderRegistry,
+        max_batch_size: int,
+        asn_index: ASNIndexLoader = None,
+    ):
+        self.database = readers["asn"]
+        self.max_batch_size = max_batch_size
+        self.asn_index = asn_index
+
+    def _bulk(self, ips):
+        # The compiled index answers the whole batch in one search when it's ready.
+        index = self.asn_index.current() if self.asn_index is not None else None
+        if index is not None:
+            # IPv6 and anything else the index can't parse go to the reader.
+            return index.bulk_lookup(
+                ips, lambda others: bulk_lookup(self.database, others, asn_record)
+            )
+        return bulk_lookup(self.database, ips, asn_record)
 
     @validate(load_schema("asn"))
     def on_post(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
-        results = list()
-        with geoip2.database.Reader(self.asn_path) as reader:  # pragma: no cover
-            for ip in req.media.get("ips", None):
-                try:
-                    lookup = reader.asn(ip)
-                    results.append(
-                        {
-                            "ip": lookup.ip_address,
-                            "asn_number": lookup.autonomous_system_number,
-                            "asn_org": lookup.autonomous_system_organization,
-                        }
-                    )
-                except geoip2.errors.AddressNotFoundError:  # pragma: no cover
-                    raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
-
-        resp.media = results
+        ips = req.media.get("ips")
+        check_batch_size(ips, self.max_batch_size)
+
+        if client_prefers_ndjson(req):
+            # Results are looked up as the server writes the response.
+            resp.content_type = MEDIA_NDJSON
+            resp.stream = ndjson_stream(self._bulk(ips))
+            return
+
+        start = time.perf_counter()
+        resp.media = list(self._bulk(ips))
+        elapsed = time.perf_counter() - start
+
+        resp.set_header("X-Lookup-Count", str(len(resp.media)))
+        resp.set_header("X-Lookup-Time-Ms", f"{elapsed * 1000:.3f}")
 
     def on_get(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
         if ip is None:
             raise falcon.HTTPNotFound()
 
-        with geoip2.database.Reader(self.asn_path) as reader:
-            try:
-                lookup = reader.asn(ip)
-                resp.media = {
-                    "ip": lookup.ip_address,
-                    "asn_number": lookup.autonomous_system_number,
-                    "asn_org": lookup.autonomous_system_organization,
-                }
-            except geoip2.errors.AddressNotFoundError:  # pragma: no cover
-                raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
+        try:
+            lookup = self.database.lookup(ip)
+            resp.media = {"ip": ip, **asn_record(lookup)}
+        except geoip2.errors.AddressNotFoundError:  # pragma: no cover
+            raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
+
+
+class ASNPrefixesResource(BaseResource):
+    """
+    ASN Prefixes Resource
+
+    Collapsed CIDR prefixes announced by an ASN, from the reverse index of the
+    compiled ASN database.
+    """
+
+    def __init__(self, asn_index: ASNIndexLoader):
+        self.asn_index = asn_index
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response, asn_number: int):
+        index = require_asn_index(self.asn_index)
+        prefixes = index.prefixes(asn_number)
+        if not prefixes:
+            raise falcon.HTTPNotFound()
 
+        resp.media = {
+            "asn_number": asn_number,
+            "asn_org": index.org_name(asn_number),
+            "count_addresses": sum(x.num_addresses for x in prefixes),
+            "prefixes": [str(x) for x in prefixes],
+        }
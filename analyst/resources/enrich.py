@@ -0,0 +1,64 @@
+import time
+
+import falcon
+from falcon.media.validators.jsonschema import validate
+
+from analyst.bulk import bulk_enrich, enrich
+from analyst.geoip import ReaderRegistry
+from analyst.membership import MembershipIndex
+from analyst.resources import BaseResource, check_batch_size
+from analyst.resources.asn import asn_record
+from analyst.resources.geo import geo_record
+from analyst.schemas import load_schema
+from analyst.serializers.ndjson import (
+    MEDIA_NDJSON,
+    client_prefers_ndjson,
+    ndjson_stream,
+)
+
+
+class EnrichResource(BaseResource):
+    """
+    Enrich Resource
+
+    ASN, geo and IP list membership for an address in one request, each looked
+    up once per unique address.
+    """
+
+    def __init__(
+        self, readers: ReaderRegistry, membership: MembershipIndex, max_batch_size: int
+    ):
+        self.asn = readers["asn"]
+        self.geo = readers["geo"]
+        self.membership = membership
+        self.max_batch_size = max_batch_size
+
+    def _bulk(self, ips):
+        return bulk_enrich(
+            ips, self.asn, self.geo, self.membership, asn_record, geo_record
+        )
+
+    @validate(load_schema("asn"))
+    def on_post(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
+        ips = req.media.get("ips")
+        check_batch_size(ips, self.max_batch_size)
+
+        if client_prefers_ndjson(req):
+            resp.content_type = MEDIA_NDJSON
+            resp.stream = ndjson_stream(self._bulk(ips))
+            return
+
+        start = time.perf_counter()
+        resp.media = list(self._bulk(ips))
+        elapsed = time.perf_counter() - start
+
+        resp.set_header("X-Lookup-Count", str(len(resp.media)))
+        resp.set_header("X-Lookup-Time-Ms", f"{elapsed * 1000:.3f}")
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
+        if ip is None:
+            raise falcon.HTTPNotFound()
+
+        resp.media = enrich(
+            ip, self.asn, self.geo, self.membership, asn_record, geo_record
+        )
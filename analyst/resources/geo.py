@@ -1,50 +1,198 @@
+import time
+from typing import Dict, Iterator, List, Optional, Union
+
 import falcon
-import geoip2.database
+import geoip2.errors
+import geoip2.models
+import numpy as np
 from falcon.media.validators.jsonschema import validate
 
-from analyst.resources import BaseResource
+from analyst.bulk import bulk_locate, bulk_lookup
+from analyst.distance import haversine_matrix, nearest_k
+from analyst.geoip import ReaderRegistry
+from analyst.resources import BaseResource, check_batch_size
 from analyst.schemas import load_schema
+from analyst.serializers.ndjson import (
+    MEDIA_NDJSON,
+    client_prefers_ndjson,
+    ndjson_stream,
+)
+from analyst.travel import DEFAULT_MAX_KMH, DEFAULT_MIN_KM, detect_impossible_travel
+
+
+def geo_record(lookup: geoip2.models.City) -> Dict[str, Union[float, str]]:
+    return {
+        "city": lookup.city.name,
+        "continent": lookup.continent.name,
+        "lat": lookup.location.latitude,
+        "lon": lookup.location.longitude,
+        "country": lookup.country.name,
+    }
 
 
 class GeoResource(BaseResource):
-    def __init__(self, geo_path):
-        self.geo_path = geo_path
+    def __init__(self, readers: ReaderRegistry, max_batch_size: int):
+        self.database = readers["geo"]
+        self.max_batch_size = max_batch_size
 
     @validate(load_schema("asn"))
     def on_post(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
-        results = list()
-        with geoip2.database.Reader(self.geo_path) as reader:
-            for ip in req.media.get("ips", None):
-                try:
-                    lookup = reader.city(ip)
-                    results.append(
-                        {
-                            "city": lookup.city.name,
-                            "continent": lookup.continent.name,
-                            "lat": lookup.location.latitude,
-                            "lon": lookup.location.longitude,
-                            "country": lookup.country.name,
-                        }
-                    )
-                except geoip2.errors.AddressNotFoundError:  # pragma: no cover
-                    raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
-
-        resp.media = results
+        ips = req.media.get("ips")
+        check_batch_size(ips, self.max_batch_size)
+
+        if client_prefers_ndjson(req):
+            # Results are looked up as the server writes the response.
+            resp.content_type = MEDIA_NDJSON
+            resp.stream = ndjson_stream(bulk_lookup(self.database, ips, geo_record))
+            return
+
+        start = time.perf_counter()
+        resp.media = list(bulk_lookup(self.database, ips, geo_record))
+        elapsed = time.perf_counter() - start
+
+        resp.set_header("X-Lookup-Count", str(len(resp.media)))
+        resp.set_header("X-Lookup-Time-Ms", f"{elapsed * 1000:.3f}")
 
     def on_get(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
         if ip is None:
             raise falcon.HTTPNotFound()
 
-        with geoip2.database.Reader(self.geo_path) as reader:
-            try:
-                lookup = reader.city(ip)
-                resp.media = {
-                    "city": lookup.city.name,
-                    "continent": lookup.continent.name,
-                    "lat": lookup.location.latitude,
-                    "lon": lookup.location.longitude,
-                    "country": lookup.country.name,
-                }
-            except geoip2.errors.AddressNotFoundError:  # pragma: no cover
-                raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
+        try:
+            lookup = self.database.lookup(ip)
+            resp.media = geo_record(lookup)
+        except geoip2.errors.AddressNotFoundError:  # pragma: no cover
+            raise falcon.HTTPBadRequest("Bad Request", "No response for query.")
+
+
+# Source × target pairs computed at once by `GeoDistanceResource`, each takes a
+# few float64 temporaries.
+DISTANCE_CHUNK_PAIRS = 100000
+
+
+def distance_rows(
+    source_ips: List[str],
+    source_coords: np.ndarray,
+    target_ips: List[str],
+    target_coords: np.ndarray,
+    nearest: Optional[int],
+    max_km: Optional[float],
+) -> Iterator[Dict[str, Union[str, list]]]:
+    """Results for a block of sources against every target."""
+    distances = haversine_matrix(
+        source_coords[:, 0],
+        source_coords[:, 1],
+        target_coords[:, 0],
+        target_coords[:, 1],
+    )
+
+    if nearest is not None:
+        columns = nearest_k(distances, nearest)
+    else:
+        columns = np.broadcast_to(np.arange(len(target_ips)), distances.shape)
+    kept = np.round(np.take_along_axis(distances, columns, axis=1), 3)
+    keep = kept <= max_km if max_km is not None else np.ones(kept.shape, bool)
+
+    for ip, row_columns, row_km, row_keep in zip(
+        source_ips, columns.tolist(), kept.tolist(), keep.tolist()
+    ):
+        yield {
+            "ip": ip,
+            "targets": [
+                {"ip": target_ips[column], "km": km}
+                for column, km, ok in zip(row_columns, row_km, row_keep)
+                if ok
+            ],
+        }
+
+
+class GeoDistanceResource(BaseResource):
+    """
+    Geo Distance Resource
+
+    Great-circle distances between every source and target IP, using coordinates
+    from the city database.  `nearest` keeps the k closest targets per source and
+    `max_km` drops pairs further apart, so the full matrix needn't be returned.
+
+    At most `max_pairs` sources × targets per request.  The matrix is computed
+    `DISTANCE_CHUNK_PAIRS` at a time, a block of source rows per chunk, so
+    memory doesn't grow with the size of the request.
+    """
+
+    def __init__(self, readers: ReaderRegistry, max_batch_size: int, max_pairs: int):
+        self.database = readers["geo"]
+        self.max_batch_size = max_batch_size
+        self.max_pairs = max_pairs
+
+    @validate(load_schema("geo_distance"))
+    def on_post(self, req: falcon.Request, resp: falcon.Response):
+        sources = req.media.get("sources")
+        targets = req.media.get("targets")
+        nearest = req.media.get("nearest", None)
+        max_km = req.media.get("max_km", None)
+        check_batch_size(sources, self.max_batch_size)
+        if len(sources) * len(targets) > self.max_pairs:
+            raise falcon.HTTPBadRequest(
+                "Request data failed validation",
+                f"{len(sources)} sources × {len(targets)} targets exceeds the "
+                f"maximum of {self.max_pairs} pairs.",
+            )
+
+        located = bulk_locate(self.database, sources + targets)
+        source_ips = [ip for ip in dict.fromkeys(sources) if ip in located]
+        target_ips = [ip for ip in dict.fromkeys(targets) if ip in located]
+        not_found = sorted(set(sources + targets) - set(located))
+
+        if not source_ips or not target_ips:
+            resp.media = {"distances": [], "not_found": not_found}
+            return
+
+        source_coords = np.array([located[ip] for ip in source_ips])
+        target_coords = np.array([located[ip] for ip in target_ips])
+        rows = max(1, DISTANCE_CHUNK_PAIRS // len(target_ips))
+        results = []
+        for first in range(0, len(source_ips), rows):
+            results.extend(
+                distance_rows(
+                    source_ips[first : first + rows],
+                    source_coords[first : first + rows],
+                    target_ips,
+                    target_coords,
+                    nearest,
+                    max_km,
+                )
+            )
+
+        resp.media = {"distances": results, "not_found": not_found}
+
+
+class GeoTravelResource(BaseResource):
+    """
+    Geo Travel Resource
+
+    Flags logins from one user in two places further apart than they could have
+    travelled, see `analyst.travel`.  Events are `user`, `ip` and `timestamp`
+    (epoch seconds or ISO 8601).
+    """
+
+    def __init__(self, readers: ReaderRegistry, max_batch_size: int):
+        self.database = readers["geo"]
+        self.max_batch_size = max_batch_size
+
+    @validate(load_schema("geo_travel"))
+    def on_post(self, req: falcon.Request, resp: falcon.Response):
+        events = req.media.get("events")
+        check_batch_size(events, self.max_batch_size)
+
+        try:
+            alerts = list(
+                detect_impossible_travel(
+                    ((x["user"], x["ip"], x["timestamp"]) for x in events),
+                    self.database,
+                    max_kmh=req.media.get("max_kmh", DEFAULT_MAX_KMH),
+                    min_km=req.media.get("min_km", DEFAULT_MIN_KM),
+                )
+            )
+        except ValueError:
+            raise falcon.HTTPBadRequest("Bad Request", "Invalid event timestamp.")
 
+        resp.media = {"alerts": alerts}
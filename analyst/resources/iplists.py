@@ -1,20 +1,116 @@
+import time
+from datetime import datetime, timedelta
+from typing import Tuple
+
 import falcon
 from falcon.media.validators.jsonschema import validate
 from peewee import DoesNotExist, IntegrityError
 
-from analyst.models.iplist import IPList, IPListItem, ListItem
+from analyst.asnindex import ASNIndexLoader
+from analyst.cache import ExportCache
+from analyst.iputils import format_network, parse_network
+from analyst.membership import MembershipIndex, list_ranges
+from analyst.models.iplist import (
+    IPList,
+    IPListChange,
+    IPListItem,
+    ListItem,
+    add_ips,
+    collapse_ranges,
+    compact_changes,
+    remove_ips,
+    write_transaction,
+)
 from analyst.models.user import User
-from analyst.resources import BaseResource, check_permission
+from analyst.resources import (
+    BaseResource,
+    check_batch_size,
+    check_permission,
+    created_between,
+    keyset_page,
+    not_modified,
+    require_asn_index,
+)
 from analyst.schemas import load_schema
+from analyst.serializers.iplist import (
+    AGGREGATED_FORMATS,
+    EXPORT_MEDIA_TYPES,
+    export_ip_list,
+    export_networks,
+)
+from analyst.serializers.ndjson import (
+    MEDIA_NDJSON,
+    client_prefers_ndjson,
+    ndjson_stream,
+)
+from analyst.serializers.stream import buffered, client_accepts_gzip, gzip_stream
+from analyst.setalgebra import evaluate, list_names, parse_expression, range_networks
+from analyst.travel import from_epoch, to_epoch
+
+
+def network_param(req: falcon.Request, name: str) -> Tuple[int, int]:
+    """(first, last) address of a network query parameter, None if absent."""
+    value = req.get_param(name)
+    if value is None:
+        return None
+    try:
+        return parse_network(value)[2:]
+    except ValueError as e:
+        raise falcon.HTTPInvalidParam(str(e), name)
 
 
 class IPListItemResource:
+    def __init__(
+        self,
+        membership: MembershipIndex,
+        asn_index: ASNIndexLoader,
+        change_log_versions: int,
+    ):
+        self.membership = membership
+        self.asn_index = asn_index
+        self.change_log_versions = change_log_versions
+
     def on_get(self, req: falcon.Request, resp: falcon.Response, ip_list_name: str):
         ip_list = IPList.get_or_404(IPList.name == ip_list_name)
+        if not_modified(req, resp, ip_list.items_etag()):
+            return
+
+        filters = [IPListItem.ip_list == ip_list, IPListItem.live()]
+        filters += created_between(req, IPListItem.created_on)
+        overlaps = network_param(req, "overlaps")
+        if overlaps is not None:
+            filters.append(ListItem.overlapping(*overlaps))
+        within = network_param(req, "within")
+        if within is not None:
+            filters.append((ListItem.start >= within[0]) & (ListItem.end <= within[1]))
+        added_by = req.get_param("added_by")
+        if added_by is not None:
+            filters.append(User.username == added_by.lower())
+
+        query = (
+            IPListItem.select(
+                IPListItem.id,
+                ListItem.ip,
+                ListItem.prefix_len,
+                IPListItem.note,
+                User.username.alias("added_by"),
+                IPListItem.created_on,
+                IPListItem.expires_at,
+            )
+            .join_from(IPListItem, ListItem)
+            .join_from(IPListItem, User, on=IPListItem.added_by)
+            .dicts()
+        )
+        items, next_after = keyset_page(req, query, IPListItem.id, *filters)
+        for item in items:
+            item["ip"] = format_network(item["ip"], item.pop("prefix_len"))
+
         resp.media = {
             "iplist": ip_list.to_dict(
                 fields=["name", "description", "created_by", "is_active", "created_on"]
-            )
+            ),
+            "items": items,
+            "next": next_after,
         }
 
     @check_permission(lambda user: user.is_admin or user.is_manager)
@@ -22,50 +118,58 @@ class IPListItemResource:
     def on_post(self, req: falcon.Request, resp: falcon.Response, ip_list_name: str):
         ip_list = IPList.get_or_404(IPList.name == ip_list_name)
 
-        ips = req.media.get("ips")
-        existing_ips = ListItem.select().where(ListItem.ip.in_(ips))
-
-        existing_ips_list = [x.ip for x in list(existing_ips)]
-        new_ips_list = list(set(ips) - set(existing_ips_list))
-
-        ListItem.insert_many(
-            [(x,) for x in new_ips_list], fields=[ListItem.ip]
-        ).execute()
-
-        list_ips = (
-            ListItem.select()
-            .join(IPListItem)
-            .join(IPList)
-            .where((IPList.id == ip_list.id), (ListItem.ip.in_(existing_ips_list)))
-        )
-        list_ips_list = [x.ip for x in list(list_ips)]
-        new_list_ips_list = list(set(ips) - set(list_ips_list))
+        if "asn" in req.media:
+            asn_number = req.media.get("asn")
+            prefixes = require_asn_index(self.asn_index).prefixes(asn_number)
+            if not prefixes:
+                raise falcon.HTTPBadRequest("Bad Request", "ASN announces no prefixes.")
+            result = {"requested_asn": asn_number}
+            entries = (str(prefix) for prefix in prefixes)
+        else:
+            result = {}
+            entries = req.media.get("ips")
 
         note = req.media.get("note", None)
         if note:
             note = note.strip()
-        ip_list_items = []
-        for list_item in ListItem.select().where(ListItem.ip.in_(new_list_ips_list)):
-            ip_list_items.append((ip_list, list_item, req.context["user"], note))
-
-        IPListItem.insert_many(
-            ip_list_items,
-            fields=[
-                IPListItem.ip_list,
-                IPListItem.ip,
-                IPListItem.added_by,
-                IPListItem.note,
-            ],
-        ).execute()
+        expires_at = None
+        if "ttl" in req.media:
+            expires_at = datetime.utcnow() + timedelta(seconds=req.media["ttl"])
+        elif "expires_at" in req.media:
+            try:
+                expires_at = from_epoch(to_epoch(req.media["expires_at"]))
+            except ValueError as e:
+                raise falcon.HTTPBadRequest("Request data failed validation", str(e))
+        try:
+            with write_transaction():
+                counts = add_ips(
+                    ip_list,
+                    entries,
+                    req.context["user"],
+                    note,
+                    expires_at=expires_at,
+                )
+                if req.media.get("collapse", False):
+                    result["count_collapsed"] = collapse_ranges(
+                        ip_list, req.context["user"], note
+                    )
+        except ValueError as e:
+            raise falcon.HTTPBadRequest("Request data failed validation", str(e))
+        self.membership.invalidate(ip_list.id)
+        compact_changes(ip_list, self.change_log_versions)
 
-        if len(new_ips_list) > 0 or len(new_list_ips_list) > 0:
+        if counts["created"] > 0 or counts["added"] > 0:
             resp.status = falcon.HTTP_201
 
-        resp.media = {
-            "requested_ips": ips,
-            "created_ips": new_ips_list,
-            "ips_added_to_list": new_list_ips_list,
-        }
+        result.update(
+            {
+                "count_requested": counts["requested"],
+                "count_created": counts["created"],
+                "count_added": counts["added"],
+                "count_skipped": counts["skipped"],
+            }
+        )
+        resp.media = result
 
     @check_permission(lambda user: user.is_admin or user.is_manager)
     @validate(load_schema("delete_ip_list_items"))
@@ -74,23 +178,26 @@ class IPListItemResource:
 
         ips = req.media.get("ips", None)
 
-        remove_ips = ListItem.select().where(ListItem.ip.in_(ips))
-
-        deleted = (
-            IPListItem.delete()
-            .where((IPListItem.ip_list == ip_list), (IPListItem.ip.in_(remove_ips)))
-            .execute()
-        )
+        try:
+            deleted = remove_ips(ip_list, ips)
+        except ValueError as e:
+            raise falcon.HTTPBadRequest("Request data failed validation", str(e))
+        self.membership.invalidate(ip_list.id)
+        compact_changes(ip_list, self.change_log_versions)
 
         resp.media = {"count_removed": deleted, "requested_ips": ips}
 
 
 class IPListResource:
+    def __init__(self, membership: MembershipIndex):
+        self.membership = membership
+
     def on_get(
         self, req: falcon.Request, resp: falcon.Response, ip_list_name: str = None
     ):
         if ip_list_name is None:
             iplist = IPList.select(
+                IPList.id,
                 IPList.name,
                 IPList.description,
                 IPList.created_by,
@@ -98,10 +205,15 @@ class IPListResource:
                 IPList.is_public,
                 IPList.created_on,
             ).dicts()
+            iplists, next_after = keyset_page(
+                req, iplist, IPList.id, *created_between(req, IPList.created_on)
+            )
 
-            resp.media = {"iplists": list(iplist)}
+            resp.media = {"iplists": iplists, "next": next_after}
         else:
             ip_list = IPList.get_or_404(IPList.name == ip_list_name)
+            if not_modified(req, resp, ip_list.etag):
+                return
             resp.media = {
                 "iplist": ip_list.to_dict(
                     fields=[
@@ -111,6 +223,8 @@ class IPListResource:
                         "is_active",
                         "is_public",
                         "created_on",
+                        "version",
+                        "default_ttl",
                     ]
                 )
             }
@@ -126,6 +240,7 @@ class IPListResource:
                 description=req.media.get("description", None),
                 is_active=req.media.get("is_active", True),
                 is_public=req.media.get("is_public", True),
+                default_ttl=req.media.get("default_ttl", None),
                 created_by=req.context["user"],
             )
             iplist.save()
@@ -144,10 +259,18 @@ class IPListResource:
     ):
         ip_list = IPList.get_or_404(IPList.name == ip_list_name)
 
-        for k in ("description", "is_active", "is_public"):
-            if k in req.media:
-                setattr(ip_list, k, req.media.get(k))
-        ip_list.save()
+        fields = [
+            k
+            for k in ("description", "is_active", "is_public", "default_ttl")
+            if k in req.media
+        ]
+        for k in fields:
+            setattr(ip_list, k, req.media.get(k))
+        # Only the edited columns, the version read above may be stale by now.
+        with write_transaction():
+            if fields:
+                ip_list.save(only=[getattr(IPList, k) for k in fields])
+            ip_list.bump_version()
 
         resp.media = {"status": "Success", "Message": "Updated IP List"}
 
@@ -157,7 +280,256 @@ class IPListResource:
     ):
         ip_list = IPList.get_or_404(IPList.name == ip_list_name)
 
-        IPListItem.delete().where(IPListItem.ip_list == ip_list).execute()
-        ip_list.delete_instance()
+        # The change log goes with the list, its pollers get a 404 and then,
+        # once it is recreated, a resync.
+        with write_transaction():
+            IPListChange.delete().where(IPListChange.ip_list == ip_list).execute()
+            IPListItem.delete().where(IPListItem.ip_list == ip_list).execute()
+            ip_list.delete_instance()
+        self.membership.invalidate(ip_list.id)
 
         resp.media = {"status": "Success", "message": "List deleted."}
+
+
+class IPListChangesResource(BaseResource):
+    """
+    IP List Changes Resource
+
+    Entries added to and removed from a list since a version, so consumers
+    keep a copy in step without downloading the whole list.  Once the change
+    log has been compacted past that version, or the list was deleted and
+    recreated under its name, the client is told to resync from a full export
+    instead.
+    """
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response, ip_list_name: str):
+        ip_list = IPList.get_or_404(IPList.name == ip_list_name)
+        since = req.get_param_as_int("since", min_value=0, default=0)
+        if not_modified(req, resp, ip_list.etag):
+            return
+
+        resp.media = {
+            "iplist": ip_list.name,
+            "version": ip_list.version,
+            "since": since,
+            # Ahead of the list when it was deleted and recreated since.
+            "resync": since < ip_list.compacted_version or since > ip_list.version,
+            "changes": [],
+        }
+        if resp.media["resync"] or since >= ip_list.version:
+            return
+
+        changes = (
+            IPListChange.select(
+                IPListChange.version,
+                IPListChange.action,
+                ListItem.ip,
+                ListItem.prefix_len,
+            )
+            .join(ListItem)
+            .where(
+                (IPListChange.ip_list == ip_list)
+                & (IPListChange.version > since)
+                & (IPListChange.version <= ip_list.version)
+            )
+            .order_by(IPListChange.version, IPListChange.id)
+            .tuples()
+        )
+        resp.media["changes"] = [
+            {"version": version, "action": action, "ip": format_network(ip, prefix_len)}
+            for version, action, ip, prefix_len in changes.iterator()
+        ]
+
+
+class IPListLookupResource(BaseResource):
+    """
+    IP List Lookup Resource
+
+    Which IP lists contain an address, single or in bulk, answered from the
+    in-memory `MembershipIndex`.
+    """
+
+    def __init__(self, membership: MembershipIndex, max_batch_size: int):
+        self.membership = membership
+        self.max_batch_size = max_batch_size
+
+    @validate(load_schema("asn"))
+    def on_post(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
+        ips = req.media.get("ips")
+        check_batch_size(ips, self.max_batch_size)
+
+        start = time.perf_counter()
+        results = [
+            {"ip": ip, "iplists": names}
+            for ip, names in self.membership.bulk_lists_for(ips).items()
+        ]
+        elapsed = time.perf_counter() - start
+
+        if client_prefers_ndjson(req):
+            resp.content_type = MEDIA_NDJSON
+            resp.stream = ndjson_stream(results)
+            return
+
+        resp.media = results
+        resp.set_header("X-Lookup-Count", str(len(results)))
+        resp.set_header("X-Lookup-Time-Ms", f"{elapsed * 1000:.3f}")
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response, ip: str = None):
+        if ip is None:
+            raise falcon.HTTPNotFound()
+
+        resp.media = {"ip": ip, "iplists": self.membership.lists_for(ip)}
+
+
+class IPListExportResource(BaseResource):
+    """
+    IP List Export Resource
+
+    Every entry on a list as `.txt`, `.csv` or `.json`, streamed from the
+    database cursor straight into the response, gzip compressed when the client
+    accepts it.  `.cidr` is the list aggregated into the fewest networks.
+
+    The list version, and the last expiry passed, is the ETag, so unchanged
+    lists cost pollers a 304, and bodies are cached per (list, ETag, format) to
+    serve repeat downloads from memory.
+    """
+
+    media_types = tuple(
+        dict.fromkeys(
+            media_type.split(";")[0] for media_type in EXPORT_MEDIA_TYPES.values()
+        )
+    )
+
+    def __init__(self, export_cache: ExportCache):
+        self.export_cache = export_cache
+
+    def on_get(
+        self,
+        req: falcon.Request,
+        resp: falcon.Response,
+        ip_list_name: str,
+        export_format: str,
+    ):
+        export_format = export_format.lower()
+        if export_format not in EXPORT_MEDIA_TYPES:
+            raise falcon.HTTPNotFound()
+        ip_list = IPList.get_or_404(IPList.name == ip_list_name.lower())
+
+        encoding = "gzip" if client_accepts_gzip(req) else "identity"
+        resp.vary = ("Accept-Encoding",)
+        # Stamps the cached bodies too, so one goes stale when an item expires.
+        etag = ip_list.items_etag()
+        if not_modified(req, resp, f"{etag}.{encoding}"):
+            return
+
+        resp.content_type = EXPORT_MEDIA_TYPES[export_format]
+        # Where a consumer of the change feed picks up after a full export.
+        resp.set_header("X-IPList-Version", str(ip_list.version))
+        if encoding == "gzip":
+            resp.set_header("Content-Encoding", "gzip")
+
+        key = (ip_list.id, export_format, encoding)
+        body = self.export_cache.get(key, etag)
+        if body is not None:
+            resp.data = body
+            return
+
+        # Rendered after reading the version, so a body never claims a newer
+        # version than it holds.  Compressed bodies start from the plain one
+        # when that is cached, aggregated ones are always cached plain first.
+        identity_key = (ip_list.id, export_format, "identity")
+        plain = None
+        if encoding == "gzip":
+            plain = self.export_cache.get(identity_key, etag)
+        if plain is None and export_format in AGGREGATED_FORMATS:
+            plain = b"".join(export_ip_list(ip_list, export_format))
+            self.export_cache.put(identity_key, etag, plain)
+            if encoding == "identity":
+                resp.data = plain
+                return
+
+        if plain is not None:
+            stream = [plain]
+        else:
+            stream = buffered(export_ip_list(ip_list, export_format))
+        if encoding == "gzip":
+            stream = gzip_stream(stream)
+        resp.stream = self.export_cache.tee(key, etag, stream)
+
+
+class IPListQueryResource(BaseResource):
+    """
+    IP List Query Resource
+
+    Set algebra across lists, e.g. `feed-a - allowlist` or
+    `(vendor1 & vendor2) | vendor3`, evaluated on the sorted range arrays of
+    each list.  The result streams back in any export format as the fewest
+    CIDR networks, or is saved as a new list.
+    """
+
+    media_types = IPListExportResource.media_types
+
+    def __init__(self, membership: MembershipIndex):
+        self.membership = membership
+
+    @validate(load_schema("query_ip_lists"))
+    def on_post(self, req: falcon.Request, resp: falcon.Response):
+        text = req.media.get("expression")
+        save_as = req.media.get("save_as")
+        user = req.context["user"]
+        if save_as is not None and not (user.is_admin or user.is_manager):
+            raise falcon.HTTPUnauthorized(
+                "Unauthorized", "Insufficient privileges for method"
+            )
+        try:
+            expression = parse_expression(text)
+        except ValueError as e:
+            raise falcon.HTTPBadRequest("Invalid expression", str(e))
+
+        names = list_names(expression)
+        ids = dict(
+            IPList.select(IPList.name, IPList.id)
+            .where(IPList.name.in_(list(names)))
+            .tuples()
+        )
+        missing = sorted(names - set(ids))
+        if missing:
+            raise falcon.HTTPBadRequest(
+                "Invalid expression", f"Unknown IP lists: {', '.join(missing)}"
+            )
+        networks = range_networks(
+            evaluate(expression, lambda name: list_ranges(ids[name]))
+        )
+
+        if save_as is None:
+            export_format = req.media.get("format", "txt")
+            resp.content_type = EXPORT_MEDIA_TYPES[export_format]
+            resp.stream = buffered(export_networks(networks, export_format))
+            return
+
+        with write_transaction():
+            try:
+                ip_list = IPList.create(
+                    name=save_as["name"],
+                    description=save_as.get("description", text),
+                    is_public=save_as.get("is_public", True),
+                    created_by=user,
+                )
+            except IntegrityError:
+                raise falcon.HTTPBadRequest(
+                    "Bad Request", "List with name already exists."
+                )
+            counts = add_ips(
+                ip_list,
+                (format_network(*network) for network in networks),
+                user,
+                save_as.get("note", f"Query: {text}"),
+            )
+        self.membership.invalidate(ip_list.id)
+
+        resp.status = falcon.HTTP_201
+        resp.media = {
+            "iplist": ip_list.name,
+            "expression": text,
+            "count_added": counts["added"],
+        }
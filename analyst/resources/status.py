@@ -0,0 +1,21 @@
+import os
+
+import falcon
+
+from analyst.geoip import ReaderRegistry
+from analyst.resources import BaseResource
+
+
+class StatusResource(BaseResource):
+    """
+    Status Resource
+
+    Reports the GeoIP database builds loaded by the worker answering the request,
+    so a rolled-over database can be confirmed on every worker.
+    """
+
+    def __init__(self, readers: ReaderRegistry):
+        self.readers = readers
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response):
+        resp.media = {"pid": os.getpid(), "databases": self.readers.status()}
@@ -1,11 +1,15 @@
 import falcon
 from peewee import DoesNotExist
 
+from analyst.cache import TokenCache
 from analyst.models.user import User
 from analyst.resources import BaseResource
 
 
 class TokensResource(BaseResource):
+    def __init__(self, token_cache: TokenCache):
+        self.token_cache = token_cache
+
     def on_put(self, req: falcon.Request, resp: falcon.Response, username: str):
         try:
             user = User.get(username=username)
@@ -17,6 +21,7 @@ class TokensResource(BaseResource):
 
             user.generate_token()
             user.save()
+            self.token_cache.invalidate()
 
             resp.media = {"token": user.token}
 
@@ -2,12 +2,21 @@ import falcon
 from falcon.media.validators.jsonschema import validate
 from peewee import DoesNotExist, IntegrityError
 
+from analyst.cache import TokenCache
 from analyst.models.user import User, create_user
-from analyst.resources import BaseResource, check_permission
+from analyst.resources import (
+    BaseResource,
+    check_permission,
+    created_between,
+    keyset_page,
+)
 from analyst.schemas import load_schema
 
 
 class UsersResource(BaseResource):
+    def __init__(self, token_cache: TokenCache):
+        self.token_cache = token_cache
+
     def on_get(self, req: falcon.Request, resp: falcon.Response, username: str = None):
         if username is None:
             if not req.context["user"].is_admin:
@@ -16,14 +25,18 @@ class UsersResource(BaseResource):
                 )
 
             user = User.select(
+                User.id,
                 User.username,
                 User.is_active,
                 User.is_admin,
                 User.is_manager,
                 User.created_on,
             )
+            users, next_after = keyset_page(
+                req, user.dicts(), User.id, *created_between(req, User.created_on)
+            )
 
-            resp.media = {"users": list(user.dicts())}
+            resp.media = {"users": users, "next": next_after}
 
         else:
             user = User.get_or_404(User.username == username)
@@ -82,6 +95,7 @@ class UsersResource(BaseResource):
             user.is_active = is_active
 
         user.save()
+        self.token_cache.invalidate()
         resp.media = {"status": "Success", "message": "User updated."}
 
     @check_permission(lambda user: user.is_admin)
@@ -94,6 +108,7 @@ class UsersResource(BaseResource):
             raise falcon.HTTPBadRequest("Bad Request", "Can not delete self.")
 
         user.delete_instance()
+        self.token_cache.invalidate()
         resp.media = {"status": "Success", "message": "User deleted."}
 
 
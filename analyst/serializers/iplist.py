@@ -0,0 +1,213 @@
+import csv
+import io
+from datetime import datetime
+from typing import Iterable, Iterator, Tuple
+
+from falcon.util import json
+
+from analyst.iputils import format_network, int_to_ipv4, summarize_range
+from analyst.models.iplist import IPList, IPListItem, IPListMember, ListItem
+from analyst.models.user import User
+from analyst.serializers.datetime import to_serializable
+
+EXPORT_MEDIA_TYPES = {
+    "txt": "text/plain; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "json": "application/json",
+    "cidr": "text/plain; charset=utf-8",
+}
+
+# Formats that read the whole list before writing anything, their bodies are
+# always cached so the work isn't repeated for the same version.
+AGGREGATED_FORMATS = ("cidr",)
+
+EXPORT_FIELDS = ("ip", "note", "added_by", "created_on", "expires_at")
+
+ExportRow = Tuple[str, str, str, datetime, datetime]
+
+
+def export_rows(ip_list: IPList) -> Iterator[ExportRow]:
+    """
+    Export Rows
+
+    Params:
+
+    * **ip_list**  `IPList` to export.
+
+    Returns: Generator of (entry, note, added by, created on, expires at) for
+    every item on the list that hasn't expired, in the order they were added.
+    Rows are read from the cursor as they are consumed (`.iterator()`), nothing
+    is cached on the query.
+    """
+    query = (
+        IPListItem.select(
+            ListItem.ip,
+            ListItem.prefix_len,
+            IPListItem.note,
+            User.username,
+            IPListItem.created_on,
+            IPListItem.expires_at,
+        )
+        .join_from(IPListItem, ListItem)
+        .join_from(IPListItem, User, on=IPListItem.added_by)
+        .where((IPListItem.ip_list == ip_list) & IPListItem.live())
+        .order_by(IPListItem.id)
+        .tuples()
+    )
+    for ip, prefix_len, *row in query.iterator():
+        yield (format_network(ip, prefix_len), *row)
+
+
+def export_entries(ip_list: IPList) -> Iterator[str]:
+    """
+    Export Entries
+
+    Returns: Generator of every entry on `ip_list` like `export_rows`, without
+    the join to the user or the other columns.
+    """
+    query = (
+        ListItem.select(ListItem.ip, ListItem.prefix_len)
+        .join(IPListItem)
+        .where((IPListItem.ip_list == ip_list) & IPListItem.live())
+        .order_by(IPListItem.id)
+        .tuples()
+    )
+    for ip, prefix_len in query.iterator():
+        yield format_network(ip, prefix_len)
+
+
+def txt_lines(ip_list: IPList) -> Iterator[str]:
+    """One entry per line, for firewalls that take a plain list."""
+    for entry in export_entries(ip_list):
+        yield entry + "\n"
+
+
+def csv_lines(ip_list: IPList) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+
+    yield line(EXPORT_FIELDS)
+    for entry, note, added_by, created_on, expires_at in export_rows(ip_list):
+        yield line(
+            (
+                entry,
+                note,
+                added_by,
+                to_serializable(created_on),
+                expires_at and to_serializable(expires_at),
+            )
+        )
+
+
+def json_lines(ip_list: IPList) -> Iterator[str]:
+    """A JSON array of objects, written one item at a time."""
+    separator = "[\n"
+    for row in export_rows(ip_list):
+        yield separator + json.dumps(
+            dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, default=to_serializable
+        )
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+def cidr_lines(ip_list: IPList) -> Iterator[str]:
+    """
+    The fewest CIDR networks covering every address on the list, one per line,
+    for devices with a limit on rule counts.  Entries are read in address order
+    from `IPListMember` and overlapping or adjacent ones merged in a single
+    pass.
+    """
+    query = (
+        IPListMember.select(IPListMember.start, IPListMember.end)
+        .where((IPListMember.ip_list == ip_list) & IPListMember.live())
+        .order_by(IPListMember.start)
+        .tuples()
+    )
+    first = last = None
+    for start, end in query.iterator():
+        if last is not None and start <= last + 1:
+            last = max(last, end)
+            continue
+        if last is not None:
+            yield from network_lines(first, last)
+        first, last = start, end
+    if last is not None:
+        yield from network_lines(first, last)
+
+
+def network_lines(start: int, end: int) -> Iterator[str]:
+    for network, prefix_len in summarize_range(start, end):
+        yield f"{int_to_ipv4(network)}/{prefix_len}\n"
+
+
+EXPORT_WRITERS = {
+    "txt": txt_lines,
+    "csv": csv_lines,
+    "json": json_lines,
+    "cidr": cidr_lines,
+}
+
+
+def range_lines(
+    networks: Iterable[Tuple[str, int]], export_format: str
+) -> Iterator[str]:
+    if export_format == "cidr":
+        entries = (f"{network}/{prefix_len}" for network, prefix_len in networks)
+    else:
+        entries = (format_network(*network) for network in networks)
+    if export_format == "json":
+        separator = "[\n"
+        for entry in entries:
+            yield separator + json.dumps({"ip": entry})
+            separator = ",\n"
+        yield "[]\n" if separator == "[\n" else "\n]\n"
+        return
+
+    if export_format == "csv":
+        yield "ip\r\n"
+        newline = "\r\n"
+    else:
+        newline = "\n"
+    for entry in entries:
+        yield entry + newline
+
+
+def export_networks(
+    networks: Iterable[Tuple[str, int]], export_format: str
+) -> Iterator[bytes]:
+    """
+    Export Networks
+
+    Params:
+
+    * **networks**  Iterable of (network address, prefix length), such as the
+      result of a set expression over lists.
+    * **export_format**  String, one of `EXPORT_MEDIA_TYPES`.
+
+    Returns: Generator of UTF-8 encoded lines in the same formats as
+    `export_ip_list`, with only the `ip` field in `.csv` and `.json`.
+    """
+    for line in range_lines(networks, export_format):
+        yield line.encode("utf-8")
+
+
+def export_ip_list(ip_list: IPList, export_format: str) -> Iterator[bytes]:
+    """
+    Export IP List
+
+    Params:
+
+    * **ip_list**  `IPList` to export.
+    * **export_format**  String, one of `EXPORT_MEDIA_TYPES`.
+
+    Returns: Generator of UTF-8 encoded lines, consumed lazily, so memory stays
+    constant however long the list is.
+    """
+    for line in EXPORT_WRITERS[export_format](ip_list):
+        yield line.encode("utf-8")
@@ -0,0 +1,35 @@
+from typing import Iterable, Iterator
+
+import falcon
+from falcon.util import json
+
+from analyst.serializers.datetime import to_serializable
+from analyst.serializers.stream import CHUNK_SIZE, buffered
+
+MEDIA_NDJSON = "application/x-ndjson"
+
+
+def client_prefers_ndjson(req: falcon.Request) -> bool:
+    """JSON wins ties, so only an explicit `Accept: application/x-ndjson` streams."""
+    return req.client_prefers((MEDIA_NDJSON, falcon.MEDIA_JSON)) == MEDIA_NDJSON
+
+
+def ndjson_stream(records: Iterable, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    NDJSON Stream
+
+    Params:
+
+    * **records**  Iterable of JSON serializable objects, consumed lazily.
+    * **chunk_size**  Integer, approximate bytes per yielded chunk.
+
+    Returns: Generator of UTF-8 encoded, newline delimited JSON chunks.
+
+    Suitable for `resp.stream`, memory held is one chunk no matter how many
+    records there are.
+    """
+    lines = (
+        json.dumps(record, ensure_ascii=False, default=to_serializable) + "\n"
+        for record in records
+    )
+    return buffered((line.encode("utf-8") for line in lines), chunk_size)
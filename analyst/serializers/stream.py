@@ -0,0 +1,64 @@
+import zlib
+from typing import Iterable, Iterator
+
+import falcon
+
+# Lines are gathered into chunks of about this size before being handed to the
+# server, so a large response isn't written one small line at a time.
+CHUNK_SIZE = 64 * 1024
+
+
+def buffered(lines: Iterable[bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Buffered
+
+    Params:
+
+    * **lines**  Iterable of encoded lines, consumed lazily.
+    * **chunk_size**  Integer, approximate bytes per yielded chunk.
+
+    Returns: Generator of chunks, memory held is one chunk no matter how many
+    lines there are.
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def client_accepts_gzip(req: falcon.Request) -> bool:
+    """Does the `Accept-Encoding` header allow gzip, honouring `q=0`?"""
+    for coding in (req.get_header("Accept-Encoding") or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        params = params.replace(" ", "")
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """
+    Gzip Stream
+
+    Returns: Generator of gzip compressed `chunks`, compressed as they come.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
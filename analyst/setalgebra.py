@@ -0,0 +1,171 @@
+import re
+from typing import Callable, Iterator, Set, Tuple, Union
+
+import numpy as np
+
+from analyst.iputils import int_to_ipv4, summarize_range
+from analyst.membership import merge_ranges
+
+Ranges = Tuple[np.ndarray, np.ndarray]
+Expression = Union[str, Tuple[str, "Expression", "Expression"]]
+
+# Operators from loosest to tightest binding, the same precedence as Python's
+# set operators.
+PRECEDENCE = ("|", "&", "-")
+
+TOKEN_RE = re.compile(r"\s*(?:([|&()])|([a-z0-9_][a-z0-9_\-]*)|(-))", re.IGNORECASE)
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    Tokenize
+
+    List names may contain `-`, so difference is only read as an operator when
+    it doesn't continue a name: `feed - allowlist`, not `feed-allowlist`.
+    """
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected {text[position:].strip()[:20]!r}")
+        operator, name, minus = match.groups()
+        yield operator or minus or name.lower()
+        position = match.end()
+
+
+def parse_expression(text: str) -> Expression:
+    """
+    Parse Expression
+
+    Params:
+
+    * **text**  String, list names combined with `|` (union), `&`
+      (intersection) and `-` (difference), grouped with parentheses.
+
+    Returns: A list name, or an (operator, left, right) tuple.
+
+    Raises `ValueError` for malformed expressions.
+    """
+    tokens = list(tokenize(text))
+    position = 0
+
+    def peek() -> str:
+        return tokens[position] if position < len(tokens) else None
+
+    def operand() -> Expression:
+        nonlocal position
+        token = peek()
+        position += 1
+        if token == "(":
+            expression = binary(0)
+            if peek() != ")":
+                raise ValueError("Missing ')'")
+            position += 1
+            return expression
+        if token is None or token in PRECEDENCE or token == ")":
+            raise ValueError(f"Expected a list name, got {token or 'the end'!r}")
+        return token
+
+    def binary(level: int) -> Expression:
+        nonlocal position
+        if level == len(PRECEDENCE):
+            return operand()
+        expression = binary(level + 1)
+        while peek() == PRECEDENCE[level]:
+            position += 1
+            expression = (PRECEDENCE[level], expression, binary(level + 1))
+        return expression
+
+    expression = binary(0)
+    if peek() is not None:
+        raise ValueError(f"Unexpected {peek()!r}")
+    return expression
+
+
+def list_names(expression: Expression) -> Set[str]:
+    """Names of every list an expression refers to."""
+    if isinstance(expression, str):
+        return {expression}
+    return list_names(expression[1]) | list_names(expression[2])
+
+
+def covered(start: np.ndarray, end: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Mask of `values` inside one of the sorted, disjoint ranges."""
+    if not len(start):
+        return np.zeros(len(values), dtype=bool)
+    position = np.searchsorted(start, values, side="right") - 1
+    return (position >= 0) & (end[np.maximum(position, 0)] >= values)
+
+
+OPERATIONS = {
+    "|": np.logical_or,
+    "&": np.logical_and,
+    "-": lambda left, right: left & ~right,
+}
+
+
+def combine(operator: str, left: Ranges, right: Ranges) -> Ranges:
+    """
+    Combine
+
+    Params:
+
+    * **operator**  String, `|`, `&` or `-`.
+    * **left**, **right**  Tuples of sorted, disjoint (start, end) arrays.
+
+    Returns: Tuple of (start, end) arrays of the result.
+
+    Every range boundary of both sides splits the address space into segments
+    that are either wholly in or wholly out of each side, so the operator only
+    has to be applied once per segment.  Cost is a sort of the boundaries,
+    independent of how many addresses the ranges hold.
+    """
+    starts = [side[0].astype(np.int64) for side in (left, right)]
+    ends = [side[1].astype(np.int64) for side in (left, right)]
+    points = np.unique(np.concatenate(starts + [end + 1 for end in ends]))
+    segment_start = points[:-1]
+    segment_end = points[1:] - 1
+
+    keep = OPERATIONS[operator](
+        covered(starts[0], ends[0], segment_start),
+        covered(starts[1], ends[1], segment_start),
+    )
+    return merge_ranges(segment_start[keep], segment_end[keep])
+
+
+def evaluate(expression: Expression, load: Callable[[str], Ranges]) -> Ranges:
+    """
+    Evaluate
+
+    Params:
+
+    * **expression**  Parsed expression, see `parse_expression`.
+    * **load**  Callable returning the (start, end) arrays of a list by name.
+
+    Returns: Tuple of (start, end) arrays of the addresses the expression
+    selects.  Each list is loaded once however often it appears.
+    """
+    loaded = {}
+
+    def walk(node: Expression) -> Ranges:
+        if isinstance(node, str):
+            if node not in loaded:
+                loaded[node] = load(node)
+            return loaded[node]
+        operator, left, right = node
+        return combine(operator, walk(left), walk(right))
+
+    return walk(expression)
+
+
+def range_networks(ranges: Ranges) -> Iterator[Tuple[str, int]]:
+    """
+    Range Networks
+
+    Returns: Generator of (network address, prefix length) for the fewest CIDR
+    networks covering `ranges`, in order.
+    """
+    for start, end in zip(ranges[0].tolist(), ranges[1].tolist()):
+        for network, prefix_len in summarize_range(start, end):
+            yield int_to_ipv4(network), prefix_len
@@ -0,0 +1,77 @@
+import logging
+import threading
+
+from peewee import OperationalError
+
+from analyst.models.iplist import IPList, sweep_expired
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """
+    Expiry Sweeper
+
+    Params:
+
+    * **interval**  Float, seconds between sweeps, 0 disables the sweeper.
+    * **batch_size**  Integer, most list items deleted per transaction.
+    * **pause**  Float, seconds between batches of the same sweep.
+
+    Deletes expired IP list items on a background thread.  Reads already skip
+    expired items, sweeping keeps the tables from growing and records the
+    removals in the change log.  Each batch is its own short transaction and the
+    pause between batches leaves room for API writes to take the SQLite write
+    lock, a sweep that finds the database locked, or fails, is retried next
+    interval.
+    """
+
+    def __init__(self, interval: float, batch_size: int, pause: float = 0.05):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def sweep(self) -> int:
+        """
+        Sweep
+
+        Returns: Integer, number of expired list items deleted.
+        """
+        deleted = 0
+        while not self._stopped.is_set():
+            count = sweep_expired(self.batch_size)
+            deleted += count
+            if count < self.batch_size:
+                break
+            self._stopped.wait(self.pause)
+        return deleted
+
+    def start(self) -> None:
+        if not self.interval or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="expiry-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.sweep()
+                except OperationalError as e:
+                    logger.warning("Expiry sweep failed, retrying: %s", e)
+                except Exception:
+                    logger.exception("Expiry sweep failed, retrying")
+        finally:
+            # Connections are per thread.
+            IPList._meta.database.close()
@@ -0,0 +1,204 @@
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from analyst.bulk import bulk_locate
+from analyst.distance import haversine
+from analyst.geoip import GeoIPDatabase
+
+# Faster than a commercial flight, allowing for coarse city-level locations.
+DEFAULT_MAX_KMH = 1000.0
+
+# Distances under this are treated as the same place, GeoIP accuracy is poor.
+DEFAULT_MIN_KM = 100.0
+
+Event = Tuple[str, str, Union[int, float, str, datetime]]
+
+
+def to_epoch(timestamp: Union[int, float, str, datetime]) -> float:
+    """
+    To Epoch
+
+    Params:
+
+    * **timestamp**  Epoch seconds, ISO 8601 string or datetime (naive is UTC).
+
+    Returns: Float, seconds since the epoch.
+    """
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def from_epoch(seconds: float) -> datetime:
+    """Naive UTC datetime for epoch `seconds`, as the service stores them."""
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+
+class ImpossibleTravelDetector:
+    """
+    Impossible Travel Detector
+
+    Params:
+
+    * **max_kmh**  Float, speeds above this are flagged.
+    * **min_km**  Float, hops shorter than this are never flagged.
+
+    Keeps each user's last located login between batches.  Each batch is sorted
+    by (user, time) and every login is compared with the one before it, or with
+    the user's last-seen login from an earlier batch, in vectorized arrays.
+    """
+
+    def __init__(
+        self, max_kmh: float = DEFAULT_MAX_KMH, min_km: float = DEFAULT_MIN_KM
+    ):
+        self.max_kmh = max_kmh
+        self.min_km = min_km
+        self.last_seen = {}
+
+    def process(
+        self,
+        users: List[str],
+        ips: List[str],
+        timestamps: np.ndarray,
+        coords: np.ndarray,
+    ) -> List[Dict]:
+        """
+        Process
+
+        Params:
+
+        * **users**, **ips**  Lists of N user names and IP addresses.
+        * **timestamps**  Array of N epoch seconds.
+        * **coords**  N×2 array of (latitude, longitude).
+
+        Returns: List of alerts for logins faster than `max_kmh` from the user's
+        previous login.
+        """
+        if not users:
+            return []
+
+        # Integer code per user, a dict is much cheaper than np.unique on strings.
+        user_index = {}
+        user_codes = np.fromiter(
+            (user_index.setdefault(user, len(user_index)) for user in users),
+            dtype=np.int64,
+            count=len(users),
+        )
+        user_names = list(user_index)
+        order = np.lexsort((timestamps, user_codes))
+        codes = user_codes[order]
+        ts = np.asarray(timestamps, dtype=np.float64)[order]
+        lat = coords[order, 0]
+        lon = coords[order, 1]
+        sorted_ips = np.asarray(ips, dtype=object)[order]
+
+        # Index of the previous login in the batch, -1 for each user's first.
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        prev = np.arange(len(order)) - 1
+        prev[first] = -1
+
+        prev_ts = np.where(first, np.nan, ts[prev])
+        prev_lat = np.where(first, np.nan, lat[prev])
+        prev_lon = np.where(first, np.nan, lon[prev])
+        prev_ip = np.empty(len(order), dtype=object)
+        prev_ip[~first] = sorted_ips[prev[~first]]
+
+        # Each user's first login in the batch continues from earlier batches.
+        for i in np.flatnonzero(first):
+            seen = self.last_seen.get(user_names[codes[i]])
+            if seen is not None:
+                prev_ts[i], prev_lat[i], prev_lon[i], prev_ip[i] = seen
+
+        has_prev = ~np.isnan(prev_ts)
+        km = np.zeros(len(order))
+        km[has_prev] = haversine(
+            prev_lat[has_prev], prev_lon[has_prev], lat[has_prev], lon[has_prev]
+        )
+        hours = np.where(has_prev, ts - prev_ts, np.nan) / 3600.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            kmh = np.where(hours > 0, km / hours, np.inf)
+        flagged = has_prev & (km >= self.min_km) & (kmh > self.max_kmh)
+
+        # Remember the latest login of every user in this batch.
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = codes[:-1] != codes[1:]
+        for i in np.flatnonzero(last):
+            self.last_seen[user_names[codes[i]]] = (
+                ts[i],
+                lat[i],
+                lon[i],
+                sorted_ips[i],
+            )
+
+        flagged = np.flatnonzero(flagged)
+        alerts = []
+        for user, ip, at, prev_at, previous_ip, distance, speed in zip(
+            (user_names[x] for x in codes[flagged].tolist()),
+            sorted_ips[flagged].tolist(),
+            ts[flagged].tolist(),
+            prev_ts[flagged].tolist(),
+            prev_ip[flagged].tolist(),
+            km[flagged].round(3).tolist(),
+            kmh[flagged].round(3).tolist(),
+        ):
+            alerts.append(
+                {
+                    "user": user,
+                    "ip": ip,
+                    "timestamp": from_epoch(at),
+                    "previous_ip": previous_ip,
+                    "previous_timestamp": from_epoch(prev_at),
+                    "km": distance,
+                    "kmh": speed if speed != float("inf") else None,
+                }
+            )
+        return alerts
+
+
+def detect_impossible_travel(
+    events: Iterable[Event],
+    database: GeoIPDatabase,
+    max_kmh: float = DEFAULT_MAX_KMH,
+    min_km: float = DEFAULT_MIN_KM,
+    batch_size: int = 100000,
+) -> Iterator[Dict]:
+    """
+    Detect Impossible Travel
+
+    Params:
+
+    * **events**  Iterable of (user, ip, timestamp), in time order.
+    * **database**  City `GeoIPDatabase` used to locate each IP.
+    * **max_kmh**, **min_km**  See `ImpossibleTravelDetector`.
+    * **batch_size**  Integer, events located and compared per batch.
+
+    Returns: Generator of alerts.  Works offline on log exports as well as behind
+    the API, memory is bounded by `batch_size` plus one entry per user.
+    """
+    detector = ImpossibleTravelDetector(max_kmh, min_km)
+    events = iter(events)
+    while True:
+        batch = list(islice(events, batch_size))
+        if not batch:
+            return
+
+        located = bulk_locate(database, (ip for _, ip, _ in batch))
+        batch = [event for event in batch if event[1] in located]
+        if not batch:
+            continue
+
+        users, ips, timestamps = zip(*batch)
+        yield from detector.process(
+            list(users),
+            list(ips),
+            np.array([to_epoch(x) for x in timestamps]),
+            np.array([located[ip] for ip in ips]),
+        )
@@ -0,0 +1,64 @@
+"""
+Basic authentication benchmark
+
+Requests per second for a cheap endpoint authenticated with HTTP Basic
+credentials, through the whole middleware stack, with the verified
+credential cache disabled and enabled.
+
+Run from the repository root with `python -m benchmarks.basic_auth`.
+
+Usage:
+    basic_auth [options]
+
+Options:
+    -h --help               Show this screen.
+    --db-path=<path>        SQLite database, replaced on each run [default: ./basic_auth.db]
+    --requests=<n>          Requests per run [default: 200]
+"""
+
+import os
+import time
+from base64 import b64encode
+
+from docopt import docopt
+from falcon import testing
+
+from analyst.app import AnalystService
+from analyst.config import AppConfig
+from analyst.models.user import create_user
+
+
+def main():
+    args = docopt(__doc__)
+    path = args["--db-path"]
+    requests = int(args["--requests"])
+    credentials = b64encode(b"benchmark:benchmark").decode()
+    headers = {"Authorization": f"Basic {credentials}"}
+
+    for name, cache_size in (("uncached", 0), ("cached", 1000)):
+        if os.path.exists(path):
+            os.remove(path)
+        cfg = AppConfig()
+        cfg.db.file_path = path
+        cfg.version = "v1"
+        cfg.credential_cache_size = cache_size
+        app = AnalystService(cfg)
+        create_user("benchmark", "benchmark")
+        client = testing.TestClient(app)
+
+        start = time.perf_counter()
+        for _ in range(requests):
+            resp = client.simulate_get("/api/v1/users/benchmark", headers=headers)
+            assert resp.status_code == 200, resp.status
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>8}: {requests / elapsed:8.1f} requests/s "
+            f"{elapsed / requests * 1000:8.3f}ms per request"
+        )
+        app.manager.db.close()
+
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
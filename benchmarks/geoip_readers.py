@@ -0,0 +1,60 @@
+"""
+GeoIP reader benchmark
+
+Compares opening a reader per lookup (the old per-request behaviour) with the
+shared, memory-mapped reader held by `ReaderRegistry`, with and without the
+prefix lookup cache.
+
+Run from the repository root with `python -m benchmarks.geoip_readers`.
+
+Usage:
+    geoip_readers [options]
+
+Options:
+    -h --help               Show this screen.
+    --asn-path=<path>       ASN database [default: ./etc/analyst/GeoLite2-ASN/GeoLite2-ASN.mmdb]
+    --ip=<ip>               Address to look up [default: 1.1.1.1]
+    --number=<n>            Lookups per run [default: 2000]
+"""
+
+import timeit
+
+import geoip2.database
+from docopt import docopt
+
+from analyst.geoip import ReaderRegistry
+
+
+def main():
+    args = docopt(__doc__)
+    path = args["--asn-path"]
+    ip = args["--ip"]
+    number = int(args["--number"])
+
+    def per_request():
+        with geoip2.database.Reader(path) as reader:
+            reader.asn(ip)
+
+    registry = ReaderRegistry({"asn": (path, "asn")}, cache_size=10000)
+    registry.open()
+
+    def shared():
+        with registry["asn"].reader() as reader:
+            reader.asn(ip)
+
+    def cached():
+        registry["asn"].lookup(ip)
+
+    for name, func in (
+        ("per-request open", per_request),
+        ("shared mmap", shared),
+        ("shared mmap+cache", cached),
+    ):
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"{name:>18}: {elapsed / number * 1e6:9.1f} us/lookup")
+
+    registry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+IP list storage layout benchmark
+
+Compares the normalized layout (`ListItem` joined through `IPListItem`) with the
+denormalized `IPListMember` table on one list of random addresses: bulk
+inserts, exact membership checks and a full export in address order.
+
+The member triggers are dropped while timing `add_ips`, so it measures the
+normalized tables alone, and the same entries are then inserted into
+`IPListMember` directly.  The last line times `add_ips` with the triggers in
+place, as the service runs it, adding the same addresses to a second list.
+
+Run from the repository root with `python -m benchmarks.list_layouts`.
+
+Usage:
+    list_layouts [options]
+
+Options:
+    -h --help               Show this screen.
+    --db-path=<path>        SQLite database, replaced on each run [default: ./list_layouts.db]
+    --number=<n>            Addresses on the list [default: 1000000]
+    --checks=<n>            Membership checks to time [default: 100000]
+"""
+
+import os
+import random
+import time
+
+from docopt import docopt
+
+from analyst.iputils import int_to_ipv4
+from analyst.models.iplist import (
+    MEMBER_TRIGGERS,
+    IPList,
+    IPListItem,
+    IPListMember,
+    ListItem,
+    add_ips,
+    create_member_triggers,
+)
+from analyst.models.manager import DBManager
+from analyst.models.user import User, create_user
+
+
+def timed(name: str, func, number: int) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>28}: {elapsed:7.2f}s {number / elapsed:10.0f}/s")
+
+
+def main():
+    args = docopt(__doc__)
+    path = args["--db-path"]
+    number = int(args["--number"])
+    checks = int(args["--checks"])
+
+    if os.path.exists(path):
+        os.remove(path)
+    manager = DBManager(path)
+    manager.setup()
+    db = manager.db
+
+    user = User.get_by_token(create_user("benchmark", "benchmark"))
+    ip_list = IPList.create(name="benchmark", created_by=user)
+    addresses = list({random.getrandbits(32) for _ in range(number)})
+    ips = [int_to_ipv4(address) for address in addresses]
+    probes = [
+        random.choice(addresses) if i % 2 else random.getrandbits(32)
+        for i in range(checks)
+    ]
+
+    for name in MEMBER_TRIGGERS:
+        db.execute_sql(f'DROP TRIGGER "{name}"')
+
+    def insert_members():
+        with db.atomic():
+            for start in range(0, len(addresses), 10000):
+                db.cursor().executemany(
+                    'INSERT OR IGNORE INTO "iplistmember" '
+                    '("ip_list_id", "start", "end") VALUES (?, ?, ?)',
+                    [
+                        (ip_list.id, address, address)
+                        for address in addresses[start : start + 10000]
+                    ],
+                )
+
+    timed("insert normalized", lambda: add_ips(ip_list, ips, user), len(ips))
+    timed("insert members", insert_members, len(ips))
+
+    normalized_check = (
+        IPListItem.select(IPListItem.id)
+        .join(ListItem)
+        .where(
+            (IPListItem.ip_list == ip_list)
+            & (ListItem.start == 0)
+            & (ListItem.end == 0)
+        )
+        .sql()[0]
+    )
+    member_check = (
+        IPListMember.select(IPListMember.start)
+        .where(
+            (IPListMember.ip_list == ip_list)
+            & (IPListMember.start == 0)
+            & (IPListMember.end == 0)
+        )
+        .sql()[0]
+    )
+    for name, sql, params in (
+        ("check normalized", normalized_check, (ip_list.id,)),
+        ("check members", member_check, (ip_list.id,)),
+    ):
+        found = []
+        timed(
+            name,
+            lambda: found.extend(
+                db.execute_sql(sql, params + (probe, probe)).fetchone() is not None
+                for probe in probes
+            ),
+            checks,
+        )
+        assert sum(found) >= checks // 2
+
+    normalized_export = (
+        ListItem.select(ListItem.start, ListItem.end)
+        .join(IPListItem)
+        .where(IPListItem.ip_list == ip_list)
+        .order_by(ListItem.start)
+        .tuples()
+    )
+    member_export = (
+        IPListMember.select(IPListMember.start, IPListMember.end)
+        .where(IPListMember.ip_list == ip_list)
+        .order_by(IPListMember.start)
+        .tuples()
+    )
+    for name, query in (
+        ("export normalized", normalized_export),
+        ("export members", member_export),
+    ):
+        sql, params = query.sql()
+        timed(name, lambda: db.execute_sql(sql, params).fetchall(), len(ips))
+
+    create_member_triggers(db)
+    second = IPList.create(name="with-triggers", created_by=user)
+    timed("insert normalized, triggers", lambda: add_ips(second, ips, user), len(ips))
+
+    manager.db.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
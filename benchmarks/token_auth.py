@@ -0,0 +1,67 @@
+"""
+Token authentication benchmark
+
+Times resolving an API token to a user the way the authentication middleware
+does on every request, straight from SQLite (`User.get_by_token`) and through
+the `TokenCache`, on a fresh database with a number of users.
+
+Run from the repository root with `python -m benchmarks.token_auth`.
+
+Usage:
+    token_auth [options]
+
+Options:
+    -h --help               Show this screen.
+    --db-path=<path>        SQLite database, replaced on each run [default: ./token_auth.db]
+    --users=<n>             Users to create [default: 1000]
+    --requests=<n>          Lookups to time [default: 100000]
+"""
+
+import os
+import random
+import time
+
+from docopt import docopt
+
+from analyst.cache import TokenCache
+from analyst.models.manager import DBManager
+from analyst.models.user import User
+
+
+def main():
+    args = docopt(__doc__)
+    path = args["--db-path"]
+    number = int(args["--users"])
+    requests = int(args["--requests"])
+
+    if os.path.exists(path):
+        os.remove(path)
+    manager = DBManager(path)
+    manager.setup()
+
+    # Password hashing is deliberately slow and not what is measured here.
+    with manager.db.atomic():
+        for i in range(number):
+            user = User(username=f"user{i}")
+            user.generate_token()
+            user.save()
+    tokens = [token for (token,) in User.select(User.token).tuples()]
+    sample = [random.choice(tokens) for _ in range(requests)]
+
+    cache = TokenCache(maxsize=number, ttl=30)
+    for name, lookup in (
+        ("sqlite", User.get_by_token),
+        ("cached", lambda token: cache.get(token, User.get_by_token)),
+    ):
+        start = time.perf_counter()
+        for token in sample:
+            lookup(token)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>6}: {elapsed / requests * 1e6:8.2f}µs per request")
+
+    manager.db.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
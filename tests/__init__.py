@@ -8,6 +8,11 @@ from analyst.models.user import create_user
 class TestDBConfig:
     def __init__(self):
         self.file_path = ":memory:"
+        self.journal_mode = "wal"
+        self.synchronous = "normal"
+        self.cache_size = -2000
+        self.mmap_size = 0
+        self.busy_timeout = 5000
 
 
 class TestConfig:
@@ -15,6 +20,20 @@ class TestConfig:
         self.db = TestDBConfig()
         self.asn_path = "./etc/analyst/GeoLite2-ASN/GeoLite2-ASN.mmdb"
         self.geo_path = "./etc/analyst/GeoLite2-City/GeoLite2-City.mmdb"
+        self.geoip_check_interval = 0
+        self.geoip_cache_size = 100
+        self.max_batch_size = 1000
+        self.max_distance_pairs = 10000
+        self.asn_compiled_index = False
+        self.membership_refresh_interval = 0
+        self.export_cache_size = 1024 * 1024
+        self.change_log_versions = 1000
+        self.expiry_sweep_interval = 0
+        self.expiry_sweep_batch_size = 100
+        self.token_cache_size = 100
+        self.token_cache_ttl = 30
+        self.credential_cache_size = 100
+        self.credential_cache_ttl = 300
         self.version = "test"
 
 
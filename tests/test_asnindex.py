@@ -0,0 +1,174 @@
+from ipaddress import ip_network
+
+import maxminddb
+import numpy as np
+
+from analyst.asnindex import ASNIndex, ASNIndexLoader
+from analyst.iputils import ipv4_to_int
+
+NETWORKS = [
+    (
+        ip_network("8.8.8.0/24"),
+        {"autonomous_system_number": 15169, "autonomous_system_organization": "GOOGLE"},
+    ),
+    (
+        ip_network("1.1.1.0/24"),
+        {
+            "autonomous_system_number": 13335,
+            "autonomous_system_organization": "CLOUDFLARENET",
+        },
+    ),
+    (
+        ip_network("8.8.4.0/24"),
+        {"autonomous_system_number": 15169, "autonomous_system_organization": "GOOGLE"},
+    ),
+    (
+        ip_network("2001:4860::/32"),
+        {"autonomous_system_number": 15169, "autonomous_system_organization": "GOOGLE"},
+    ),
+]
+
+
+class FakeMetadata:
+    build_epoch = 1563148800
+
+
+class FakeReader:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        return iter(NETWORKS)
+
+    def metadata(self):
+        return FakeMetadata()
+
+
+def fake_open_database(path, mode):
+    return FakeReader()
+
+
+def test_asnindex_compile(monkeypatch):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    index = ASNIndex.compile("asn.mmdb")
+    assert len(index) == 3
+    assert list(index.start) == sorted(index.start)
+    assert index.orgs == ["GOOGLE", "CLOUDFLARENET"]
+    assert index.build_epoch == FakeMetadata.build_epoch
+
+
+def test_asnindex_lookup(monkeypatch):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    index = ASNIndex.compile("asn.mmdb")
+    ips = np.array([ipv4_to_int(x) for x in ("1.1.1.1", "8.8.5.1", "8.8.8.8")])
+    found, position = index.lookup(ips)
+    assert found.tolist() == [True, False, True]
+    assert index.asn[position[2]] == 15169
+
+
+def test_asnindex_bulk_lookup(monkeypatch):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    index = ASNIndex.compile("asn.mmdb")
+    results = list(index.bulk_lookup(["8.8.8.8", "10.0.0.1", "8.8.8.8", "1.1.1.1"]))
+    assert results == [
+        {
+            "ip": "1.1.1.1",
+            "status": "ok",
+            "asn_number": 13335,
+            "asn_org": "CLOUDFLARENET",
+        },
+        {"ip": "8.8.8.8", "status": "ok", "asn_number": 15169, "asn_org": "GOOGLE"},
+        {"ip": "10.0.0.1", "status": "not_found"},
+    ]
+
+
+def test_asnindex_open_caches_next_to_mmdb(monkeypatch, tmp_path):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    mmdb_path = str(tmp_path / "GeoLite2-ASN.mmdb")
+    ASNIndex.open(mmdb_path)
+
+    def fail_compile(path):
+        raise AssertionError("index should be loaded from the cache")
+
+    monkeypatch.setattr(ASNIndex, "compile", fail_compile)
+    index = ASNIndex.open(mmdb_path)
+    assert isinstance(index.start, np.memmap)
+    assert len(index) == 3
+
+
+def test_asnindex_ranges_merge_adjacent():
+    start = np.array([ipv4_to_int(x) for x in ("8.8.4.0", "8.8.5.0", "8.8.8.0")])
+    end = np.array([ipv4_to_int(x) for x in ("8.8.4.255", "8.8.5.255", "8.8.8.255")])
+    index = ASNIndex(
+        start, end, np.array([15169] * 3), np.zeros(3, np.uint32), ["GOOGLE"], 0
+    )
+    assert index.ranges(15169) == [
+        (ipv4_to_int("8.8.4.0"), ipv4_to_int("8.8.5.255")),
+        (ipv4_to_int("8.8.8.0"), ipv4_to_int("8.8.8.255")),
+    ]
+    assert [str(x) for x in index.prefixes(15169)] == ["8.8.4.0/23", "8.8.8.0/24"]
+    assert index.ranges(64512) == []
+
+
+def test_asnindex_prefixes(monkeypatch):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    index = ASNIndex.compile("asn.mmdb")
+    assert [str(x) for x in index.prefixes(15169)] == ["8.8.4.0/24", "8.8.8.0/24"]
+    assert index.org_name(13335) == "CLOUDFLARENET"
+    assert index.org_name(64512) is None
+
+
+def test_asnindex_open_cache_not_writable(monkeypatch, tmp_path):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+
+    def fail_save(self, directory):
+        raise PermissionError(directory)
+
+    monkeypatch.setattr(ASNIndex, "save", fail_save)
+    index = ASNIndex.open(str(tmp_path / "GeoLite2-ASN.mmdb"))
+    assert len(index) == 3
+
+
+class FakeDatabase:
+    path = "GeoLite2-ASN.mmdb"
+
+
+def test_asnindexloader_backs_off_after_failure(monkeypatch):
+    attempts = []
+
+    def fail_open(path):
+        attempts.append(path)
+        raise ValueError("corrupt database")
+
+    monkeypatch.setattr(ASNIndex, "open", fail_open)
+    loader = ASNIndexLoader(FakeDatabase(), retry_interval=60)
+    loader.load()
+    loader._thread.join()
+    loader.load()
+    assert loader._thread is not None and not loader._thread.is_alive()
+    assert attempts == ["GeoLite2-ASN.mmdb"]
+
+    loader._retry_at = 0
+    loader.load()
+    loader._thread.join()
+    assert len(attempts) == 2
+
+
+def test_asnindex_bulk_lookup_not_ipv4(monkeypatch):
+    monkeypatch.setattr(maxminddb, "open_database", fake_open_database)
+    index = ASNIndex.compile("asn.mmdb")
+    results = list(index.bulk_lookup(["8.8.8.8", "2001:4860::1", "not-an-ip"]))
+    assert results == [
+        {"ip": "8.8.8.8", "status": "ok", "asn_number": 15169, "asn_org": "GOOGLE"},
+        {"ip": "2001:4860::1", "status": "invalid"},
+        {"ip": "not-an-ip", "status": "invalid"},
+    ]
+
+    def fallback(ips):
+        return ({"ip": ip, "status": "not_found"} for ip in ips)
+
+    results = list(index.bulk_lookup(["2001:4860::1", "8.8.8.8"], fallback))
+    assert results[1] == {"ip": "2001:4860::1", "status": "not_found"}
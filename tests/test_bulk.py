@@ -0,0 +1,80 @@
+import geoip2.errors
+
+from analyst.bulk import bulk_enrich, bulk_lookup, split_addresses, unique_sorted
+
+
+class FakeDatabase:
+    def __init__(self, known):
+        self.known = known
+        self.lookups = []
+
+    def handle(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def lookup(self, ip, handle=None):
+        self.lookups.append(ip)
+        if ip not in self.known:
+            raise geoip2.errors.AddressNotFoundError(ip)
+        return self.known[ip]
+
+
+def test_unique_sorted():
+    ips = ["10.0.0.2", "9.9.9.9", "10.0.0.2", "10.0.0.10"]
+    assert unique_sorted(ips) == ["9.9.9.9", "10.0.0.2", "10.0.0.10"]
+
+
+def test_bulk_lookup_not_found_continues():
+    database = FakeDatabase({"1.1.1.1": 13335, "8.8.8.8": 15169})
+    ips = ["8.8.8.8", "192.168.1.1", "1.1.1.1", "8.8.8.8"]
+    results = list(bulk_lookup(database, ips, lambda x: {"asn_number": x}))
+
+    assert database.lookups == ["1.1.1.1", "8.8.8.8", "192.168.1.1"]
+    assert results == [
+        {"ip": "1.1.1.1", "status": "ok", "asn_number": 13335},
+        {"ip": "8.8.8.8", "status": "ok", "asn_number": 15169},
+        {"ip": "192.168.1.1", "status": "not_found"},
+    ]
+
+
+def test_split_addresses():
+    ips = ["10.0.0.2", "bad", "::1", "10.0.0.2", "1.1.1"]
+    assert split_addresses(ips) == (["::1", "10.0.0.2"], ["bad", "1.1.1"])
+
+
+def test_bulk_lookup_invalid_continues():
+    database = FakeDatabase({"1.1.1.1": 13335})
+    ips = ["not-an-ip", "1.1.1.1"]
+    results = list(bulk_lookup(database, ips, lambda x: {"asn_number": x}))
+
+    assert database.lookups == ["1.1.1.1"]
+    assert results == [
+        {"ip": "1.1.1.1", "status": "ok", "asn_number": 13335},
+        {"ip": "not-an-ip", "status": "invalid"},
+    ]
+
+
+class FakeMembership:
+    def lists_for(self, ip):
+        return ["first"] if ip == "1.1.1.1" else []
+
+
+def test_bulk_enrich_invalid_continues():
+    asn = FakeDatabase({"1.1.1.1": 13335})
+    geo = FakeDatabase({})
+    ips = ["nope", "1.1.1.1", "2.2.2.2", "nope"]
+    results = list(
+        bulk_enrich(ips, asn, geo, FakeMembership(), lambda x: x, lambda x: x)
+    )
+
+    assert asn.lookups == ["1.1.1.1", "2.2.2.2"]
+    assert results == [
+        {"ip": "1.1.1.1", "asn": 13335, "geo": None, "iplists": ["first"]},
+        {"ip": "2.2.2.2", "asn": None, "geo": None, "iplists": []},
+        {"ip": "nope", "status": "invalid"},
+    ]
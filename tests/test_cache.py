@@ -0,0 +1,150 @@
+import multiprocessing
+from ipaddress import ip_address, ip_network
+
+from analyst.cache import CredentialCache, ExportCache, PrefixLRUCache, TokenCache
+
+
+def test_prefixlrucache_hit_in_network():
+    cache = PrefixLRUCache(10)
+    cache.put(ip_network("1.1.1.0/24"), "cloudflare")
+    assert cache.get(ip_address("1.1.1.200")) == "cloudflare"
+    assert cache.get(ip_address("1.1.2.1")) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_prefixlrucache_mixed_prefix_lens():
+    cache = PrefixLRUCache(10)
+    cache.put(ip_network("8.0.0.0/9"), "a")
+    cache.put(ip_network("8.8.8.0/24"), "b")
+    assert cache.get(ip_address("8.8.8.8")) == "b"
+    assert cache.get(ip_address("8.1.1.1")) == "a"
+
+
+def test_prefixlrucache_evicts_lru():
+    cache = PrefixLRUCache(2)
+    cache.put(ip_network("1.0.0.0/24"), "a")
+    cache.put(ip_network("2.0.0.0/24"), "b")
+    cache.get(ip_address("1.0.0.1"))
+    cache.put(ip_network("3.0.0.0/16"), "c")
+    assert cache.get(ip_address("2.0.0.1")) is None
+    assert cache.get(ip_address("1.0.0.1")) == "a"
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_prefixlrucache_clear():
+    cache = PrefixLRUCache(2)
+    cache.put(ip_network("1.0.0.0/24"), "a")
+    cache.clear()
+    assert cache.get(ip_address("1.0.0.1")) is None
+    assert len(cache) == 0
+
+
+def test_prefixlrucache_disabled():
+    cache = PrefixLRUCache(0)
+    cache.put(ip_network("1.0.0.0/24"), "a")
+    assert cache.get(ip_address("1.0.0.1")) is None
+
+
+def test_exportcache_versions():
+    cache = ExportCache(100)
+    cache.put("a", 1, b"one")
+    assert cache.get("a", 1) == b"one"
+    assert cache.get("a", 2) is None
+    cache.put("a", 2, b"two")
+    assert cache.get("a", 1) is None
+    assert cache.get("a", 2) == b"two"
+    assert cache.stats()["size"] == 3
+
+
+def test_exportcache_evicts_by_size():
+    cache = ExportCache(10)
+    cache.put("a", 1, b"x" * 4)
+    cache.put("b", 1, b"x" * 4)
+    cache.get("a", 1)
+    cache.put("c", 1, b"x" * 4)
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None
+    cache.put("d", 1, b"x" * 11)
+    assert cache.get("d", 1) is None
+
+
+def test_exportcache_tee():
+    cache = ExportCache(10)
+    assert b"".join(cache.tee("a", 1, [b"ab", b"cd"])) == b"abcd"
+    assert cache.get("a", 1) == b"abcd"
+
+    assert b"".join(cache.tee("b", 1, [b"x" * 6, b"x" * 6])) == b"x" * 12
+    assert cache.get("b", 1) is None
+
+    stream = cache.tee("c", 1, [b"ab", b"cd"])
+    next(stream)
+    stream.close()
+    assert cache.get("c", 1) is None
+
+
+def test_tokencache():
+    users = {"a": "alice", "b": "bob"}
+    loads = []
+
+    def load(token):
+        loads.append(token)
+        return users.get(token)
+
+    cache = TokenCache(maxsize=1, ttl=60)
+    assert cache.get("a", load) == "alice"
+    assert cache.get("a", load) == "alice"
+    assert cache.get("x", load) is None
+    assert cache.get("x", load) is None
+    assert loads == ["a", "x", "x"]
+
+    # Bounded, least recently used goes first.
+    assert cache.get("b", load) == "bob"
+    assert cache.get("a", load) == "alice"
+    assert loads == ["a", "x", "x", "b", "a"]
+
+    users["a"] = "alice2"
+    cache.invalidate()
+    assert cache.get("a", load) == "alice2"
+
+    cache = TokenCache(maxsize=10, ttl=0)
+    cache.get("a", load)
+    cache.get("a", load)
+    assert cache.stats()["hits"] == 0
+
+
+def test_tokencache_invalidate_across_processes():
+    cache = TokenCache(maxsize=10, ttl=60)
+    assert cache.get("a", lambda token: "alice") == "alice"
+
+    # Another worker, forked from the same master, regenerates a token.
+    context = multiprocessing.get_context("fork")
+    worker = context.Process(target=cache.invalidate)
+    worker.start()
+    worker.join()
+    assert cache.get("a", lambda token: "alice2") == "alice2"
+
+
+def test_credentialcache():
+    passwords = {"alice": "secret"}
+    calls = []
+
+    def load(username, password):
+        calls.append((username, password))
+        return username if passwords.get(username) == password else None
+
+    tokens = TokenCache(maxsize=10, ttl=60)
+    cache = CredentialCache(maxsize=10, ttl=60, generation=tokens.generation)
+    assert cache.verify("alice", "secret", load) == "alice"
+    assert cache.verify("alice", "secret", load) == "alice"
+    assert cache.verify("alice", "wrong", load) is None
+    assert cache.verify("alice", "wrong", load) is None
+    assert len(calls) == 3
+    # Keys are digests, the password isn't kept.
+    assert all(isinstance(key, bytes) for key in cache._entries)
+
+    passwords["alice"] = "changed"
+    tokens.invalidate()
+    assert cache.verify("alice", "secret", load) is None
+    assert cache.verify("alice", "changed", load) == "alice"
@@ -0,0 +1,31 @@
+import numpy as np
+
+from analyst.distance import haversine, haversine_matrix, nearest_k
+
+
+def test_haversine_known_distance():
+    # London to Paris, roughly 343 km.
+    km = haversine(51.5074, -0.1278, 48.8566, 2.3522)
+    assert 340 < km < 346
+
+
+def test_haversine_matrix_shape_and_zero_diagonal():
+    lat = np.array([0.0, 10.0, 20.0])
+    lon = np.array([0.0, 10.0, 20.0])
+    distances = haversine_matrix(lat, lon, lat, lon)
+    assert distances.shape == (3, 3)
+    assert np.allclose(np.diag(distances), 0.0)
+    assert np.allclose(distances, distances.T)
+
+
+def test_haversine_matrix_matches_pairwise():
+    lat1, lon1 = np.array([1.0, 2.0]), np.array([3.0, 4.0])
+    lat2, lon2 = np.array([5.0, 6.0, 7.0]), np.array([8.0, 9.0, 10.0])
+    distances = haversine_matrix(lat1, lon1, lat2, lon2)
+    assert np.isclose(distances[1, 2], haversine(2.0, 4.0, 7.0, 10.0))
+
+
+def test_nearest_k():
+    distances = np.array([[5.0, 1.0, 3.0, 2.0], [0.5, 9.0, 8.0, 7.0]])
+    assert nearest_k(distances, 2).tolist() == [[1, 3], [0, 3]]
+    assert nearest_k(distances, 10).tolist() == [[1, 3, 2, 0], [0, 3, 2, 1]]
@@ -0,0 +1,145 @@
+import os
+import threading
+from ipaddress import ip_network
+
+import geoip2.database
+import pytest
+
+from analyst.geoip import ReaderRegistry
+
+
+class FakeMetadata:
+    database_type = "GeoLite2-ASN"
+    build_epoch = 1563148800
+
+
+class FakeASN:
+    def __init__(self, ip_address):
+        self.network = ip_network(f"{ip_address}/24", strict=False)
+
+
+class FakeReader:
+    opened = 0
+    lookups = 0
+
+    def __init__(self, path, mode=None):
+        FakeReader.opened += 1
+        self.path = path
+        self.mode = mode
+        self.closed = False
+
+    def asn(self, ip_address):
+        FakeReader.lookups += 1
+        return FakeASN(ip_address)
+
+    def metadata(self):
+        return FakeMetadata()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture()
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(geoip2.database, "Reader", FakeReader)
+    FakeReader.opened = 0
+    FakeReader.lookups = 0
+    path = tmp_path / "asn.mmdb"
+    path.write_bytes(b"v1")
+    return str(path)
+
+
+def test_readerregistry_opens_once_mmap(db_path):
+    registry = ReaderRegistry({"asn": (db_path, "asn")})
+
+    threads = [threading.Thread(target=registry["asn"].open) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with registry["asn"].reader() as reader:
+        assert reader.mode == geoip2.database.MODE_MMAP
+    assert FakeReader.opened == 1
+
+
+def test_readerregistry_close(db_path):
+    registry = ReaderRegistry({"asn": (db_path, "asn")})
+    registry.open()
+    with registry["asn"].reader() as reader:
+        pass
+    registry.close()
+    assert reader.closed
+
+
+def test_geoipdatabase_reload_requested_keeps_inflight(db_path):
+    registry = ReaderRegistry({"asn": (db_path, "asn")})
+    database = registry["asn"]
+
+    with database.reader() as old_reader:
+        registry.request_reload()
+        with database.reader() as new_reader:
+            assert new_reader is not old_reader
+        assert not old_reader.closed
+    assert old_reader.closed
+    assert not new_reader.closed
+
+
+def test_geoipdatabase_reload_on_file_change(db_path):
+    database = ReaderRegistry({"asn": (db_path, "asn")}, check_interval=1)["asn"]
+    with database.reader() as old_reader:
+        pass
+
+    replacement = db_path + ".new"
+    with open(replacement, "wb") as fp:
+        fp.write(b"version 2")
+    os.replace(replacement, db_path)
+    database._next_check = 0
+
+    with database.reader() as new_reader:
+        assert new_reader is not old_reader
+    assert old_reader.closed
+
+
+def test_geoipdatabase_status(db_path):
+    database = ReaderRegistry({"asn": (db_path, "asn")})["asn"]
+    assert database.status()["build_epoch"] is None
+    database.open()
+    assert database.status()["build_epoch"] == FakeMetadata.build_epoch
+
+
+def test_geoipdatabase_lookup_cached_by_network(db_path):
+    database = ReaderRegistry({"asn": (db_path, "asn")}, cache_size=10)["asn"]
+    first = database.lookup("1.1.1.1")
+    assert database.lookup("1.1.1.254") is first
+    assert FakeReader.lookups == 1
+    assert database.status()["cache"]["hits"] == 1
+
+
+def test_geoipdatabase_reload_clears_cache(db_path):
+    database = ReaderRegistry({"asn": (db_path, "asn")}, cache_size=10)["asn"]
+    database.lookup("1.1.1.1")
+    database.reload()
+    assert len(database.cache) == 0
+    database.lookup("1.1.1.1")
+    assert FakeReader.lookups == 2
+
+
+def test_geoipdatabase_failed_reload_keeps_reader(db_path, monkeypatch):
+    database = ReaderRegistry({"asn": (db_path, "asn")})["asn"]
+    with database.reader() as old_reader:
+        pass
+
+    def corrupt(path, mode=None):
+        raise ValueError("Error opening database file")
+
+    monkeypatch.setattr(geoip2.database, "Reader", corrupt)
+    database.request_reload()
+    with database.reader() as reader:
+        assert reader is old_reader
+    assert not old_reader.closed
+
+    monkeypatch.setattr(geoip2.database, "Reader", FakeReader)
+    with database.reader() as reader:
+        assert reader is not old_reader
+    assert old_reader.closed
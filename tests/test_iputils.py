@@ -0,0 +1,50 @@
+import ipaddress
+import random
+
+import pytest
+
+from analyst.iputils import (
+    format_network,
+    normalize_ipv4,
+    parse_network,
+    summarize_range,
+)
+
+
+def test_normalize_ipv4():
+    assert normalize_ipv4(" 1.1.1.1\n") == "1.1.1.1"
+    for ip in ("1.1.1", "1.1.1.256", "::1", None):
+        with pytest.raises(ValueError):
+            normalize_ipv4(ip)
+
+
+def test_parse_network():
+    assert parse_network("1.1.1.1") == ("1.1.1.1", 32, 16843009, 16843009)
+    assert parse_network("10.0.0.0/8") == ("10.0.0.0", 8, 167772160, 184549375)
+    assert parse_network("0.0.0.0/0") == ("0.0.0.0", 0, 0, 2**32 - 1)
+    for entry in ("10.0.0.1/8", "10.0.0.0/33", "10.0.0.0/", "10.0.0.0/a", 1):
+        with pytest.raises(ValueError):
+            parse_network(entry)
+
+
+def test_format_network():
+    assert format_network("1.1.1.1", 32) == "1.1.1.1"
+    assert format_network("10.0.0.0", 8) == "10.0.0.0/8"
+
+
+def test_summarize_range():
+    assert list(summarize_range(0, 2**32 - 1)) == [(0, 0)]
+    assert list(summarize_range(5, 5)) == [(5, 32)]
+    assert list(summarize_range(2**32 - 1, 2**32 - 1)) == [(2**32 - 1, 32)]
+
+    rand = random.Random(1)
+    for _ in range(200):
+        start = rand.randrange(2**32)
+        end = min(start + rand.randrange(2 ** rand.randrange(1, 33)), 2**32 - 1)
+        expected = [
+            (int(network.network_address), network.prefixlen)
+            for network in ipaddress.summarize_address_range(
+                ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)
+            )
+        ]
+        assert list(summarize_range(start, end)) == expected
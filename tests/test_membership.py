@@ -0,0 +1,133 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from tests import client, superuser
+
+from analyst.membership import MembershipIndex, merge_ranges
+from analyst.models.iplist import IPList, IPListItem, ListItem, add_ips, remove_ips
+from analyst.models.user import User
+
+
+def add_item(ip_list, ip, user):
+    item, _ = ListItem.get_or_create(ip=ip)
+    IPListItem.create(ip=item, ip_list=ip_list, added_by=user)
+
+
+def test_membershipindex_lists_for(client, superuser):
+    user = User.get_by_token(superuser)
+    first = IPList.create(name="first", created_by=user)
+    second = IPList.create(name="second", created_by=user)
+    add_item(first, "1.1.1.1", user)
+    add_item(second, "1.1.1.1", user)
+    add_item(second, "9.9.9.9", user)
+
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == ["first", "second"]
+    assert index.lists_for("9.9.9.9") == ["second"]
+    assert index.lists_for("8.8.8.8") == []
+
+
+def test_membershipindex_invalidate(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="first", created_by=user)
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == []
+
+    add_item(ip_list, "1.1.1.1", user)
+    assert index.lists_for("1.1.1.1") == []
+    index.invalidate()
+    assert index.lists_for("1.1.1.1") == ["first"]
+
+
+def test_membershipindex_version_refresh(client, superuser):
+    user = User.get_by_token(superuser)
+    first = IPList.create(name="first", created_by=user)
+    second = IPList.create(name="second", created_by=user)
+    add_ips(first, ["1.1.1.1"], user)
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == ["first"]
+    loaded = index.snapshot()[first.id][2]
+
+    add_ips(second, ["1.1.1.1"], user)
+    assert index.lists_for("1.1.1.1") == ["first", "second"]
+    # Only the list that changed is reloaded.
+    assert index.snapshot()[first.id][2] is loaded
+
+    remove_ips(first, ["1.1.1.1"])
+    assert index.lists_for("1.1.1.1") == ["second"]
+
+
+def test_membershipindex_expiry(client, superuser):
+    user = User.get_by_token(superuser)
+    first = IPList.create(name="first", created_by=user)
+    second = IPList.create(name="second", created_by=user)
+    expires_at = datetime.utcnow() + timedelta(seconds=0.2)
+    add_ips(first, ["1.1.1.1"], user, expires_at=expires_at)
+    add_ips(first, ["2.2.2.2"], user, expires_at=expires_at + timedelta(days=1))
+    add_ips(second, ["1.1.1.1"], user)
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == ["first", "second"]
+    loaded = index.snapshot()[second.id][2]
+
+    # Dropped once it expires, before the sweep removes it.
+    time.sleep(0.3)
+    assert index.lists_for("1.1.1.1") == ["second"]
+    assert index.lists_for("2.2.2.2") == ["first"]
+    assert index.snapshot()[first.id][4] == expires_at + timedelta(days=1)
+    assert index.snapshot()[second.id][2] is loaded
+
+
+def test_membershipindex_refresh_interval(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="first", created_by=user)
+    index = MembershipIndex(refresh_interval=3600)
+    assert index.lists_for("1.1.1.1") == []
+
+    add_ips(ip_list, ["1.1.1.1"], user)
+    assert index.lists_for("1.1.1.1") == []
+    index.invalidate(ip_list.id)
+    assert index.lists_for("1.1.1.1") == ["first"]
+
+
+def test_membershipindex_bulk_lists_for(client, superuser):
+    user = User.get_by_token(superuser)
+    first = IPList.create(name="first", created_by=user)
+    second = IPList.create(name="second", created_by=user)
+    IPList.create(name="empty", created_by=user)
+    add_ips(first, ["1.1.1.1", "255.255.255.255"], user)
+    add_ips(second, ["1.1.1.1", "0.0.0.0"], user)
+
+    index = MembershipIndex()
+    assert index.bulk_lists_for(
+        ["1.1.1.1", "8.8.8.8", "255.255.255.255", "0.0.0.0", "1.1.1.1"]
+    ) == {
+        "1.1.1.1": ["first", "second"],
+        "8.8.8.8": [],
+        "255.255.255.255": ["first"],
+        "0.0.0.0": ["second"],
+    }
+
+
+def test_merge_ranges():
+    start, end = merge_ranges(
+        np.array([10, 0, 5, 20, 12]), np.array([15, 4, 6, 25, 13])
+    )
+    assert start.tolist() == [0, 10, 20]
+    assert end.tolist() == [6, 15, 25]
+
+
+def test_membershipindex_networks(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="first", created_by=user)
+    add_ips(ip_list, ["10.0.0.0/8", "10.1.0.0/16", "192.0.2.1"], user)
+
+    index = MembershipIndex()
+    assert index.lists_for("10.255.255.255") == ["first"]
+    assert index.lists_for("11.0.0.0") == []
+    assert index.bulk_lists_for(["9.255.255.255", "10.1.2.3", "192.0.2.1"]) == {
+        "9.255.255.255": [],
+        "10.1.2.3": ["first"],
+        "192.0.2.1": ["first"],
+    }
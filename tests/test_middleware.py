@@ -1,20 +1,70 @@
 import pytest
-from falcon import HTTPNotAcceptable
+from falcon import MEDIA_JSON, HTTPNotAcceptable
 
+from analyst.middleware.database import ClosingStream
 from analyst.middleware.json import RequireJSONMiddleware
+from analyst.serializers.ndjson import MEDIA_NDJSON
 
 
 class TestReq:
-    def __init__(self, accepts_json: bool = True):
+    def __init__(self, accepts_json: bool = True, accepts: tuple = ()):
         self.client_accepts_json = accepts_json
+        self.accepts = accepts
+
+    def client_accepts(self, media_type: str) -> bool:
+        if media_type == MEDIA_JSON:
+            return self.client_accepts_json
+        return media_type in self.accepts
+
+
+class TestResource:
+    media_types = ("text/plain",)
 
 
 def test_requirejsonmiddleware_bad():
     middleware = RequireJSONMiddleware()
     with pytest.raises(HTTPNotAcceptable):
-        middleware.process_request(req=TestReq(False), resp=None)
+        middleware.process_resource(
+            req=TestReq(False), resp=None, resource=None, params={}
+        )
 
 
 def test_requirejsonmiddleware_good():
     middleware = RequireJSONMiddleware()
-    middleware.process_request(req=TestReq(True), resp=None)
+    middleware.process_resource(req=TestReq(True), resp=None, resource=None, params={})
+
+
+def test_requirejsonmiddleware_ndjson():
+    middleware = RequireJSONMiddleware()
+    middleware.process_resource(
+        req=TestReq(False, (MEDIA_NDJSON,)), resp=None, resource=None, params={}
+    )
+
+
+def test_requirejsonmiddleware_resource_media_types():
+    middleware = RequireJSONMiddleware()
+    middleware.process_resource(
+        req=TestReq(False, ("text/plain",)),
+        resp=None,
+        resource=TestResource(),
+        params={},
+    )
+    with pytest.raises(HTTPNotAcceptable):
+        middleware.process_resource(
+            req=TestReq(True), resp=None, resource=TestResource(), params={}
+        )
+
+
+def test_closingstream():
+    closed = []
+    stream = ClosingStream(iter([b"a", b"b"]), lambda: closed.append(True))
+    assert list(stream) == [b"a", b"b"]
+    stream.close()
+    assert closed == [True]
+
+    # Closed by the server before it was read, or part way through.
+    closed = []
+    chunks = (chunk for chunk in [b"a", b"b"])
+    ClosingStream(chunks, lambda: closed.append(True)).close()
+    assert closed == [True]
+    assert list(chunks) == []
@@ -0,0 +1,178 @@
+import threading
+from datetime import datetime
+
+from falcon import testing
+from tests import TestConfig
+
+from analyst.app import AnalystService
+from analyst.models.iplist import (
+    IPList,
+    IPListItem,
+    add_ips,
+    collapse_ranges,
+    remove_ips,
+    sweep_expired,
+)
+from analyst.models.manager import DBManager
+from analyst.models.user import User, create_user
+
+PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -2000,
+    "mmap_size": 1024 * 1024,
+    "busy_timeout": 200,
+}
+
+
+def test_dbmanager_pragmas(tmp_path):
+    manager = DBManager(str(tmp_path / "analyst.db"), pragmas=PRAGMAS)
+    manager.setup()
+    assert manager.db.is_closed()
+
+    manager.connect()
+    assert manager.db.execute_sql("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert manager.db.execute_sql("PRAGMA synchronous").fetchone() == (1,)
+    assert manager.db.execute_sql("PRAGMA busy_timeout").fetchone() == (200,)
+    manager.close()
+    assert manager.db.is_closed()
+
+
+def test_dbmanager_write_during_read(tmp_path):
+    manager = DBManager(str(tmp_path / "analyst.db"), pragmas=PRAGMAS)
+    manager.setup()
+    create_user("first", "password")
+
+    reading = threading.Event()
+    written = threading.Event()
+    seen = []
+
+    def reader():
+        # Connections are per thread, this one holds a read transaction open.
+        with manager.db.atomic():
+            seen.append(User.select().count())
+            reading.set()
+            written.wait(5)
+            seen.append(User.select().count())
+        manager.close()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    reading.wait(5)
+    # Commits without waiting for the reader, which keeps its snapshot.
+    create_user("second", "password")
+    written.set()
+    thread.join()
+    assert seen == [1, 1]
+    assert User.select().count() == 2
+    manager.close()
+
+
+def test_database_connection_middleware(tmp_path):
+    cfg = TestConfig()
+    cfg.db.file_path = str(tmp_path / "analyst.db")
+    client = testing.TestClient(AnalystService(cfg))
+    token = create_user("superuser", "password", is_admin=True)
+    client.app.manager.close()
+
+    resp = client.simulate_get(
+        "/api/test/users/superuser", headers={"Authorization": f"Token {token}"}
+    )
+    assert resp.status_code == 200
+    assert client.app.manager.db.is_closed()
+
+    # Streamed exports read while they are sent, and close once they are done.
+    user = User.get_by_token(token)
+    add_ips(IPList.create(name="first", created_by=user), ["1.1.1.1"], user)
+    client.app.manager.close()
+    resp = client.simulate_get(
+        "/api/test/iplists/first.txt", headers={"Authorization": f"Token {token}"}
+    )
+    assert resp.text == "1.1.1.1\n"
+    assert client.app.manager.db.is_closed()
+
+
+def test_concurrent_imports(tmp_path):
+    # Writers queue on the lock, give them longer than the other tests do.
+    pragmas = dict(PRAGMAS, busy_timeout=5000)
+    manager = DBManager(str(tmp_path / "analyst.db"), pragmas=pragmas)
+    manager.setup()
+    user = User.get_by_token(create_user("first", "password"))
+    ip_lists = [IPList.create(name=f"list{i}", created_by=user) for i in range(4)]
+    manager.close()
+    errors = []
+
+    def importer(ip_list):
+        try:
+            for i in range(5):
+                add_ips(ip_list, [f"10.{i}.{x}.1" for x in range(200)], user)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            manager.close()
+
+    threads = [threading.Thread(target=importer, args=(x,)) for x in ip_lists]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert IPListItem.select().count() == 4 * 5 * 200
+    manager.close()
+
+
+def test_concurrent_writers(tmp_path):
+    pragmas = dict(PRAGMAS, busy_timeout=5000)
+    manager = DBManager(str(tmp_path / "analyst.db"), pragmas=pragmas)
+    manager.setup()
+    user = User.get_by_token(create_user("first", "password"))
+    ips = [f"10.{i}.{x}.1" for i in range(5) for x in range(200)]
+    imported, removed, expired, collapsed = (
+        IPList.create(name=name, created_by=user)
+        for name in ("imported", "removed", "expired", "collapsed")
+    )
+    add_ips(removed, ips, user)
+    add_ips(expired, ips, user, expires_at=datetime(2000, 1, 1))
+    manager.close()
+    errors = []
+
+    def writer(func):
+        def run():
+            try:
+                func()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                manager.close()
+
+        return threading.Thread(target=run)
+
+    def importer():
+        for start in range(0, len(ips), 200):
+            add_ips(imported, ips[start : start + 200], user)
+
+    def remover():
+        for start in range(0, len(ips), 200):
+            remove_ips(removed, ips[start : start + 200])
+
+    def sweeper():
+        while sweep_expired(100):
+            pass
+
+    def collapser():
+        for i in range(5):
+            add_ips(collapsed, [f"10.{i}.0.{x}" for x in range(256)], user)
+            collapse_ranges(collapsed, user)
+
+    threads = [writer(func) for func in (importer, remover, sweeper, collapser)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    counts = {
+        ip_list.name: IPListItem.select().where(IPListItem.ip_list == ip_list).count()
+        for ip_list in (imported, removed, expired, collapsed)
+    }
+    assert counts == {"imported": 1000, "removed": 0, "expired": 0, "collapsed": 5}
+    manager.close()
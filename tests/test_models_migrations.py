@@ -0,0 +1,193 @@
+import time
+from datetime import datetime
+
+from playhouse.migrate import SqliteMigrator, migrate
+from tests import client, superuser
+
+from analyst.membership import list_ranges
+from analyst.models.iplist import (
+    IPList,
+    IPListChange,
+    IPListItem,
+    IPListMember,
+    ListItem,
+    MEMBER_TRIGGERS,
+    add_ips,
+    insert_list_items_sql,
+    remove_ips,
+)
+from analyst.models.manager import DBManager
+from analyst.models.migrations import MIGRATIONS, indexes
+from analyst.models.user import User, create_user
+
+
+def query_plan(query) -> str:
+    sql, params = query.sql()
+    rows = IPList._meta.database.execute_sql("EXPLAIN QUERY PLAN " + sql, params)
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_migrations_new_database(tmp_path):
+    manager = DBManager(str(tmp_path / "analyst.db"))
+    manager.setup()
+    manager.connect()
+    assert manager.db.pragma("user_version") == len(MIGRATIONS)
+    assert manager.migrate() == []
+    manager.close()
+
+
+def test_migrations_upgrade(tmp_path):
+    manager = DBManager(str(tmp_path / "analyst.db"))
+    manager.setup()
+    manager.connect()
+    # Roll the schema back to before the migrations runner, with a duplicate
+    # entry on a list.
+    db = manager.db
+    for name in MEMBER_TRIGGERS:
+        db.execute_sql(f'DROP TRIGGER "{name}"')
+    db.drop_tables([IPListMember])
+    migrator = SqliteMigrator(db)
+    migrate(
+        migrator.drop_index("iplistitem", "iplistitem_ip_list_id_ip_id"),
+        migrator.drop_index(
+            "iplistchange", "iplistchange_ip_list_id_version_action_ip_id"
+        ),
+        migrator.add_index("iplistchange", ("ip_list_id",)),
+        migrator.add_index("iplistchange", ("ip_list_id", "version")),
+        migrator.drop_index("iplistitem", "iplistitem_expires_at"),
+        migrator.drop_column("iplistitem", "expires_at"),
+        migrator.drop_column("iplist", "default_ttl"),
+    )
+    db.pragma("user_version", 0)
+    user = User.get_by_token(create_user("superuser", "password"))
+    ip_list = IPList.create(name="first", created_by=user)
+    item = ListItem.create(ip="1.1.1.1")
+    for note in ("first", "second"):
+        db.execute_sql(
+            'INSERT INTO "iplistitem" ("ip_id", "ip_list_id", "added_by_id", '
+            '"note", "created_on") VALUES (?, ?, ?, ?, ?)',
+            (item.id, ip_list.id, user.id, note, datetime.utcnow()),
+        )
+
+    assert manager.migrate() == [func.__name__ for func in MIGRATIONS]
+    assert db.pragma("user_version") == len(MIGRATIONS)
+    assert [(i.note, i.expires_at) for i in IPListItem.select()] == [("first", None)]
+    assert IPList.get().default_ttl is None
+    assert list(IPListMember.select().tuples()) == [
+        (ip_list.id, item.start, item.end, None)
+    ]
+    assert "iplistitem_ip_list_id_ip_id" in indexes(db, "iplistitem")
+    assert indexes(db, "iplistchange") == {
+        "iplistchange_ip_id",
+        "iplistchange_ip_list_id_version_action_ip_id",
+    }
+    assert manager.migrate() == []
+    manager.close()
+
+
+def test_created_on_default(client, superuser):
+    first = ListItem.create(ip="1.1.1.1")
+    time.sleep(0.01)
+    second = ListItem.create(ip="2.2.2.2")
+    assert first.created_on < second.created_on
+
+
+def test_query_plan_token(client):
+    plan = query_plan(User.select().where(User.token == "token"))
+    assert "USING INDEX user_token" in plan
+
+
+def test_query_plan_list_items_page(client):
+    plan = query_plan(
+        IPListItem.select()
+        .where((IPListItem.ip_list == 1) & (IPListItem.id > 100))
+        .order_by(IPListItem.id)
+        .limit(100)
+    )
+    assert "USING INDEX iplistitem_ip_list_id (ip_list_id=? AND rowid>?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_query_plan_add_ips(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="first", created_by=user)
+    assert add_ips(ip_list, ["1.1.1.1", "1.1.1.1"], user)["added"] == 1
+    assert add_ips(ip_list, ["1.1.1.1"], user)["added"] == 0
+
+    # The statement add_ips runs per entry, repeats are ignored by the
+    # (ip_list, ip) unique index.
+    rows = IPList._meta.database.execute_sql(
+        "EXPLAIN QUERY PLAN " + insert_list_items_sql(),
+        (ip_list.id, user.id, None, None, None, 16843009, 16843009),
+    )
+    plan = "\n".join(row[-1] for row in rows)
+    assert (
+        plan == "SEARCH t1 USING COVERING INDEX listitem_start_end (start=? AND end=?)"
+    )
+    assert "iplistitem_ip_list_id_ip_id" in indexes(IPList._meta.database, "iplistitem")
+
+
+def test_query_plan_list_members(client):
+    plan = query_plan(
+        IPListMember.select(IPListMember.start, IPListMember.end)
+        .where((IPListMember.ip_list == 1) & IPListMember.live())
+        .order_by(IPListMember.start)
+    )
+    assert plan == "SEARCH t1 USING PRIMARY KEY (ip_list_id=?)"
+    assert list_ranges(1)[0].size == 0
+
+
+def test_list_members_follow_items(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="first", created_by=user)
+    other = IPList.create(name="second", created_by=user)
+    expires_at = datetime(2030, 1, 1)
+
+    def members(ip_list):
+        return list(
+            IPListMember.select(
+                IPListMember.start, IPListMember.end, IPListMember.expires_at
+            )
+            .where(IPListMember.ip_list == ip_list)
+            .tuples()
+        )
+
+    add_ips(ip_list, ["1.1.1.1", "10.0.0.0/8"], user, expires_at=expires_at)
+    add_ips(other, ["1.1.1.1"], user)
+    assert members(ip_list) == [
+        (16843009, 16843009, expires_at),
+        (167772160, 184549375, expires_at),
+    ]
+    assert members(other) == [(16843009, 16843009, None)]
+
+    add_ips(ip_list, ["1.1.1.1"], user, expires_at=datetime(2031, 1, 1))
+    assert members(ip_list)[0] == (16843009, 16843009, datetime(2031, 1, 1))
+
+    remove_ips(ip_list, ["1.1.1.1"])
+    assert members(ip_list) == [(167772160, 184549375, expires_at)]
+    assert members(other) == [(16843009, 16843009, None)]
+
+    IPListItem.delete().where(IPListItem.ip_list == ip_list).execute()
+    assert members(ip_list) == []
+
+
+def test_query_plan_changes(client):
+    plan = query_plan(
+        IPListChange.select(IPListChange.version, IPListChange.action, IPListChange.ip)
+        .where((IPListChange.ip_list == 1) & (IPListChange.version > 3))
+        .order_by(IPListChange.version, IPListChange.id)
+    )
+    assert "USING COVERING INDEX iplistchange_ip_list_id_version_action_ip_id" in plan
+    # Only changes within a version are sorted by id.
+    assert "TEMP B-TREE FOR ORDER BY" not in plan
+
+
+def test_query_plan_sweep(client):
+    plan = query_plan(
+        IPListItem.select(IPListItem.id, IPListItem.ip_list)
+        .where(IPListItem.expires_at <= datetime.utcnow())
+        .order_by(IPListItem.expires_at)
+        .limit(100)
+    )
+    assert "USING INDEX iplistitem_expires_at" in plan
+    assert "TEMP B-TREE" not in plan
@@ -2,6 +2,11 @@ import pytest
 from tests import client, superuser
 import json
 
+import numpy as np
+
+from analyst.asnindex import ASNIndex
+from analyst.iputils import ipv4_to_int
+
 
 def test_asn_post_ok(client, superuser):
     resp = client.simulate_post(
@@ -26,3 +31,29 @@ def test_asn_get_found(client, superuser):
     )
     assert resp.status_code == 200
     assert "ip" in resp.json
+
+
+def test_asn_post_batch_too_large(client, superuser):
+    resp = client.simulate_post(
+        "/api/test/asn",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"ips": ["1.1.1.1"] * 1001},
+    )
+    assert resp.status_code == 400
+
+
+def test_asn_prefixes_found(client, superuser):
+    start = np.array([ipv4_to_int("192.0.2.0"), ipv4_to_int("198.51.100.0")])
+    end = np.array([ipv4_to_int("192.0.2.255"), ipv4_to_int("198.51.100.127")])
+    index = ASNIndex(
+        start, end, np.array([64496, 64496]), np.zeros(2, np.uint32), ["EX"], 0
+    )
+    client.app.asn_index.current = lambda: index
+
+    resp = client.simulate_get(
+        "/api/test/asn/prefixes/64496",
+        headers={"Authorization": f"Token {superuser}"},
+    )
+    assert resp.status_code == 200
+    assert resp.json["prefixes"] == ["192.0.2.0/24", "198.51.100.0/25"]
+    assert resp.json["count_addresses"] == 384
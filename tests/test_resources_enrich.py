@@ -0,0 +1,21 @@
+from tests import client, superuser
+
+
+def test_enrich_post_ok(client, superuser):
+    resp = client.simulate_post(
+        "/api/test/enrich",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"ips": ["1.1.1.1", "1.1.1.1"]},
+    )
+    assert resp.status_code == 200
+    assert len(resp.json) == 1
+    assert resp.json[0]["iplists"] == []
+
+
+def test_enrich_get_found(client, superuser):
+    resp = client.simulate_get(
+        "/api/test/enrich/1.1.1.1", headers={"Authorization": f"Token {superuser}"}
+    )
+    assert resp.status_code == 200
+    assert "asn" in resp.json
+    assert "geo" in resp.json
@@ -26,3 +26,38 @@ def test_ges_get_found(client, superuser):
     )
     assert resp.status_code == 200
     assert "city" in resp.json
+
+
+def test_geo_distance_too_many_pairs(client, superuser):
+    resp = client.simulate_post(
+        "/api/test/geo/distance",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"sources": ["1.1.1.1"] * 1000, "targets": ["8.8.8.8"] * 11},
+    )
+    assert resp.status_code == 400
+
+
+def test_geo_distance_chunked(client, superuser, monkeypatch):
+    from analyst.resources import geo
+
+    coords = {"1.1.1.1": (0.0, 0.0), "2.2.2.2": (0.0, 1.0), "3.3.3.3": (0.0, 2.0)}
+    monkeypatch.setattr(geo, "bulk_locate", lambda database, ips: coords)
+    # One source per chunk.
+    monkeypatch.setattr(geo, "DISTANCE_CHUNK_PAIRS", 2)
+    resp = client.simulate_post(
+        "/api/test/geo/distance",
+        headers={"Authorization": f"Token {superuser}"},
+        json={
+            "sources": ["1.1.1.1", "3.3.3.3", "9.9.9.9"],
+            "targets": ["2.2.2.2", "3.3.3.3"],
+            "nearest": 1,
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.json == {
+        "distances": [
+            {"ip": "1.1.1.1", "targets": [{"ip": "2.2.2.2", "km": 111.195}]},
+            {"ip": "3.3.3.3", "targets": [{"ip": "3.3.3.3", "km": 0.0}]},
+        ],
+        "not_found": ["9.9.9.9"],
+    }
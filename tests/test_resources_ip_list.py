@@ -1,10 +1,27 @@
+import csv
+import gzip
+import io
 import json
+import time
+from datetime import datetime, timedelta
 
+import numpy as np
 import pytest
 from falcon import HTTPBadRequest
 from tests import client, superuser
 
-from analyst.models.iplist import IPList, IPListItem, ListItem
+from analyst.asnindex import ASNIndex
+from analyst.iputils import ipv4_to_int
+from analyst.models.iplist import (
+    IPList,
+    IPListChange,
+    IPListItem,
+    ListItem,
+    add_ips,
+    collapse_ranges,
+    compact_changes,
+    remove_ips,
+)
 from analyst.models.user import User, create_user
 
 
@@ -58,6 +75,28 @@ def test_iplistresource_on_put_ok(client, superuser):
     assert resp.json["status"] == "Success"
 
 
+def test_iplistresource_on_put_keeps_version(client, superuser, monkeypatch):
+    user = User.get_by_token(superuser)
+    IPList.create(name="test-list", created_by=user)
+    get_or_404 = IPList.get_or_404
+
+    def get_then_write(*expressions):
+        # Another request adds to the list after this one read it.
+        ip_list = get_or_404(*expressions)
+        add_ips(IPList.get_by_id(ip_list.id), ["1.1.1.1"], user)
+        return ip_list
+
+    monkeypatch.setattr(IPList, "get_or_404", get_then_write)
+    resp = client.simulate_put(
+        "/api/test/iplists/test-list",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"description": "new"},
+    )
+    assert resp.status_code == 200
+    ip_list = IPList.get()
+    assert (ip_list.description, ip_list.version) == ("new", 2)
+
+
 def test_iplistresource_on_delete_ok(client, superuser):
     ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
     ip_list.save()
@@ -146,6 +185,57 @@ def test_iplistitemresource_on_post_notes(client, superuser):
     assert list_item.note == "test note"
 
 
+def test_iplistitemresource_on_post_counts(client, superuser):
+    ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
+    ip_list.save()
+    add_ips(ip_list, ["1.1.1.1"], User.get_by_token(superuser))
+    json = {"ips": ["1.1.1.1", " 9.9.9.9", "9.9.9.9"], "note": "test note"}
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers={"Authorization": f"Token {superuser}"},
+        json=json,
+    )
+    assert resp.status_code == 201
+    assert resp.json == {
+        "count_requested": 3,
+        "count_created": 1,
+        "count_added": 1,
+        "count_skipped": 2,
+    }
+
+
+def test_iplistitemresource_on_post_invalid_rolls_back(client, superuser):
+    ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
+    ip_list.save()
+    json = {"ips": ["1.1.1.1", "1.1.1"], "note": "test note"}
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers={"Authorization": f"Token {superuser}"},
+        json=json,
+    )
+    assert resp.status_code == 400
+    assert ListItem.select().count() == 0
+
+
+def test_add_ips_chunked(client, superuser):
+    ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
+    ip_list.save()
+    ips = [f"10.0.{x // 256}.{x % 256}" for x in range(1000)]
+    counts = add_ips(ip_list, ips + ips[:10], User.get_by_token(superuser), None, 7)
+    assert counts == {"requested": 1010, "created": 1000, "added": 1000, "skipped": 10}
+    assert remove_ips(ip_list, ips[:500], 7) == 500
+    assert IPListItem.select().where(IPListItem.ip_list == ip_list).count() == 500
+
+
+def test_remove_ips_duplicates(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, ["1.1.1.1", "2.2.2.2"], user)
+    assert remove_ips(ip_list, ["1.1.1.1", "1.1.1.1/32", "1.1.1.1"]) == 1
+    removals = IPListChange.select().where(IPListChange.action == IPListChange.REMOVE)
+    assert removals.count() == 1
+
+
 def test_iplistitemresource_on_delete_remove_none(client, superuser):
     ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
     ip_list.save()
@@ -207,3 +297,584 @@ def test_iplistitemresource_on_delete_remove_all(client, superuser):
     assert resp.status_code == 200
     assert resp.json["count_removed"] == 2
     assert IPListItem.select().where((IPListItem.ip_list == ip_list)).count() == 0
+
+
+def test_iplistitemresource_on_post_asn(client, superuser):
+    start = np.array([ipv4_to_int("192.0.2.0")])
+    end = np.array([ipv4_to_int("192.0.2.15")])
+    index = ASNIndex(
+        start, end, np.array([64496]), np.zeros(1, np.uint32), ["EXAMPLE"], 0
+    )
+    client.app.asn_index.current = lambda: index
+
+    ip_list = IPList(name="test-list", created_by=User.get_by_token(superuser))
+    ip_list.save()
+    json = {"asn": 64496, "note": "test note"}
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers={"Authorization": f"Token {superuser}"},
+        json=json,
+    )
+    assert resp.status_code == 201
+    assert resp.json["count_added"] == 1
+    assert ListItem.get().cidr == "192.0.2.0/28"
+
+
+def test_iplistlookupresource(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+    resp = client.simulate_get("/api/test/iplists/lookup/1.1.1.1", headers=headers)
+    assert resp.json == {"ip": "1.1.1.1", "iplists": []}
+
+    client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["1.1.1.1"], "note": "test note"},
+    )
+    resp = client.simulate_get("/api/test/iplists/lookup/1.1.1.1", headers=headers)
+    assert resp.json == {"ip": "1.1.1.1", "iplists": ["test-list"]}
+
+    resp = client.simulate_post(
+        "/api/test/iplists/lookup",
+        headers=headers,
+        json={"ips": ["9.9.9.9", "1.1.1.1"]},
+    )
+    assert resp.status_code == 200
+    assert resp.json == [
+        {"ip": "9.9.9.9", "iplists": []},
+        {"ip": "1.1.1.1", "iplists": ["test-list"]},
+    ]
+
+    resp = client.simulate_post(
+        "/api/test/iplists/lookup",
+        headers=headers,
+        json={"ips": ["1.1.1.1", "not-an-ip", "::1"]},
+    )
+    assert resp.status_code == 200
+    assert resp.json == [
+        {"ip": "1.1.1.1", "iplists": ["test-list"]},
+        {"ip": "not-an-ip", "iplists": []},
+        {"ip": "::1", "iplists": []},
+    ]
+
+
+def test_iplistresource_on_post_reserved_name(client, superuser):
+    resp = client.simulate_post(
+        "/api/test/iplists",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"name": "lookup"},
+    )
+    assert resp.status_code == 400
+
+
+def test_iplistitemresource_on_post_networks(client, superuser):
+    ip_list = IPList.create(name="test-list", created_by=User.get_by_token(superuser))
+    headers = {"Authorization": f"Token {superuser}"}
+    json = {"ips": ["10.0.0.0/8", "10.0.0.0/16", "10.0.0.0"], "note": "test note"}
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items", headers=headers, json=json
+    )
+    assert resp.status_code == 201
+    assert resp.json["count_added"] == 3
+    assert [x.cidr for x in ListItem.select().order_by(ListItem.prefix_len)] == [
+        "10.0.0.0/8",
+        "10.0.0.0/16",
+        "10.0.0.0",
+    ]
+
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        params={"overlaps": "10.0.255.0/24"},
+    )
+    assert [item["ip"] for item in resp.json["items"]] == ["10.0.0.0/8", "10.0.0.0/16"]
+
+    resp = client.simulate_delete(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["10.0.0.0/16", "10.0.0.1"]},
+    )
+    assert resp.json["count_removed"] == 1
+
+    json = {"ips": ["10.0.0.1/8"], "note": "test note"}
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items", headers=headers, json=json
+    )
+    assert resp.status_code == 400
+
+
+def test_iplistitemresource_on_post_collapse(client, superuser):
+    ip_list = IPList.create(name="test-list", created_by=User.get_by_token(superuser))
+    json = {
+        "ips": ["192.0.2.0/25", "192.0.2.128/25", "192.0.2.7", "198.51.100.1"],
+        "note": "test note",
+        "collapse": True,
+    }
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers={"Authorization": f"Token {superuser}"},
+        json=json,
+    )
+    assert resp.status_code == 201
+    assert resp.json["count_collapsed"] == 3
+    items = ListItem.select().join(IPListItem).where(IPListItem.ip_list == ip_list)
+    assert sorted(x.cidr for x in items) == ["192.0.2.0/24", "198.51.100.1"]
+    assert collapse_ranges(ip_list, User.get_by_token(superuser)) == 0
+
+
+def test_iplistexportresource(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, ["1.1.1.1", "10.0.0.0/8"], user, "test note")
+    headers = {"Authorization": f"Token {superuser}", "Accept": "text/plain"}
+
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert resp.text == "1.1.1.1\n10.0.0.0/8\n"
+
+    resp = client.simulate_get("/api/test/iplists/test-list.csv", headers=headers)
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [row["ip"] for row in rows] == ["1.1.1.1", "10.0.0.0/8"]
+    assert rows[0]["note"] == "test note"
+    assert rows[0]["added_by"] == "superuser"
+
+    resp = client.simulate_get("/api/test/iplists/test-list.json", headers=headers)
+    assert [item["ip"] for item in resp.json] == ["1.1.1.1", "10.0.0.0/8"]
+
+    headers["Accept-Encoding"] = "gzip, deflate"
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(resp.content) == b"1.1.1.1\n10.0.0.0/8\n"
+
+
+def test_iplistexportresource_empty_and_missing(client, superuser):
+    IPList.create(name="test-list", created_by=User.get_by_token(superuser))
+    headers = {"Authorization": f"Token {superuser}"}
+    resp = client.simulate_get("/api/test/iplists/test-list.json", headers=headers)
+    assert resp.json == []
+    resp = client.simulate_get("/api/test/iplists/test-list.xml", headers=headers)
+    assert resp.status_code == 404
+    resp = client.simulate_get("/api/test/iplists/missing.txt", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_iplistresource_etag(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+    resp = client.simulate_get("/api/test/iplists/test-list", headers=headers)
+    etag = resp.headers["etag"]
+    assert etag == f'"{ip_list.id}.0"'
+
+    headers["If-None-Match"] = etag
+    resp = client.simulate_get("/api/test/iplists/test-list", headers=headers)
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    client.simulate_put(
+        "/api/test/iplists/test-list", headers=headers, json={"description": "new"}
+    )
+    resp = client.simulate_get("/api/test/iplists/test-list", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+
+def test_iplistexportresource_etag_and_cache(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, ["1.1.1.1"], user)
+    headers = {"Authorization": f"Token {superuser}"}
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    etag = resp.headers["etag"]
+    assert (
+        client.app.export_cache.get((ip_list.id, "txt", "identity"), f"{ip_list.id}.1")
+        == b"1.1.1.1\n"
+    )
+
+    headers["If-None-Match"] = etag
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.status_code == 304
+
+    # Different encodings of the same export are different representations.
+    headers["Accept-Encoding"] = "gzip"
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    del headers["Accept-Encoding"]
+
+    add_ips(ip_list, ["2.2.2.2"], user)
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.status_code == 200
+    assert resp.text == "1.1.1.1\n2.2.2.2\n"
+
+    hits = client.app.export_cache.hits
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.text == "1.1.1.1\n2.2.2.2\n"
+    assert client.app.export_cache.hits == hits + 1
+
+
+def test_iplistchangesresource(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+    add_ips(ip_list, ["1.1.1.1", "10.0.0.0/24"], user)
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.headers["x-iplist-version"] == "1"
+
+    client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["2.2.2.2", "1.1.1.1"], "note": "test"},
+    )
+    client.simulate_delete(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["1.1.1.1", "3.3.3.3"]},
+    )
+    # Removing nothing doesn't produce a version.
+    client.simulate_delete(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["3.3.3.3"]},
+    )
+
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes",
+        headers=headers,
+        params={"since": 1},
+    )
+    assert resp.status_code == 200
+    assert resp.json["version"] == 3
+    assert resp.json["resync"] is False
+    assert resp.json["changes"] == [
+        {"version": 2, "action": "add", "ip": "2.2.2.2"},
+        {"version": 3, "action": "remove", "ip": "1.1.1.1"},
+    ]
+
+    resp = client.simulate_get("/api/test/iplists/test-list/changes", headers=headers)
+    assert [change["ip"] for change in resp.json["changes"]] == [
+        "1.1.1.1",
+        "10.0.0.0/24",
+        "2.2.2.2",
+        "1.1.1.1",
+    ]
+
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes",
+        headers=headers,
+        params={"since": 3},
+    )
+    assert resp.json["changes"] == []
+
+
+def test_iplistchangesresource_compacted(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+    for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        add_ips(ip_list, [ip], user)
+    compact_changes(ip_list, 1)
+    assert IPListChange.select().where(IPListChange.ip_list == ip_list).count() == 1
+
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes",
+        headers=headers,
+        params={"since": 1},
+    )
+    assert resp.json["resync"] is True
+    assert resp.json["changes"] == []
+
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes",
+        headers=headers,
+        params={"since": 2},
+    )
+    assert resp.json["resync"] is False
+    assert resp.json["changes"] == [{"version": 3, "action": "add", "ip": "3.3.3.3"}]
+
+    client.simulate_delete("/api/test/iplists/test-list", headers=headers)
+    assert IPListChange.select().count() == 0
+
+
+def test_iplistchangesresource_recreated(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+    for ip in ("1.1.1.1", "2.2.2.2", "3.3.3.3"):
+        add_ips(ip_list, [ip], user)
+    client.simulate_delete("/api/test/iplists/test-list", headers=headers)
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes", headers=headers, params={"since": 3}
+    )
+    assert resp.status_code == 404
+
+    add_ips(IPList.create(name="test-list", created_by=user), ["4.4.4.4"], user)
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/changes", headers=headers, params={"since": 3}
+    )
+    assert resp.json["version"] == 1
+    assert resp.json["resync"] is True
+    assert resp.json["changes"] == []
+
+
+def test_collapse_ranges_logs_changes(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, ["10.0.0.0/25", "10.0.0.128/25"], user)
+    collapse_ranges(ip_list, user)
+
+    changes = (
+        IPListChange.select(IPListChange.version, IPListChange.action, ListItem.ip)
+        .join(ListItem)
+        .where(IPListChange.version > 1)
+        .order_by(IPListChange.id)
+        .tuples()
+    )
+    assert list(changes) == [
+        (2, "remove", "10.0.0.0"),
+        (2, "remove", "10.0.0.128"),
+        (3, "add", "10.0.0.0"),
+    ]
+
+
+def test_iplistexportresource_cidr(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(
+        ip_list,
+        ["10.0.0.0/25", "10.0.0.128/26", "10.0.0.192", "10.0.0.193/32", "1.1.1.1"],
+        user,
+    )
+    add_ips(ip_list, ["10.0.0.194/31", "10.0.0.196/30", "10.0.0.200/29"], user)
+    add_ips(ip_list, ["10.0.0.208/28", "10.0.0.224/27", "10.0.0.64/26"], user)
+    headers = {"Authorization": f"Token {superuser}", "Accept-Encoding": "gzip"}
+
+    resp = client.simulate_get("/api/test/iplists/test-list.cidr", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert gzip.decompress(resp.content) == b"1.1.1.1/32\n10.0.0.0/24\n"
+
+    # Aggregated once per version, the plain body is cached alongside.
+    assert (
+        client.app.export_cache.get((ip_list.id, "cidr", "identity"), f"{ip_list.id}.3")
+        == b"1.1.1.1/32\n10.0.0.0/24\n"
+    )
+    del headers["Accept-Encoding"]
+    hits = client.app.export_cache.hits
+    resp = client.simulate_get("/api/test/iplists/test-list.cidr", headers=headers)
+    assert resp.text == "1.1.1.1/32\n10.0.0.0/24\n"
+    assert client.app.export_cache.hits == hits + 1
+
+
+def test_iplistqueryresource(client, superuser):
+    user = User.get_by_token(superuser)
+    feed = IPList.create(name="feed-a", created_by=user)
+    allow = IPList.create(name="allow", created_by=user)
+    add_ips(feed, ["10.0.0.0/24", "1.1.1.1", "2.2.2.2"], user)
+    add_ips(allow, ["10.0.0.128/25", "2.2.2.2"], user)
+    headers = {"Authorization": f"Token {superuser}", "Accept": "text/plain"}
+
+    resp = client.simulate_post(
+        "/api/test/iplists/query",
+        headers=headers,
+        json={"expression": "feed-a - allow"},
+    )
+    assert resp.status_code == 200
+    assert resp.text == "1.1.1.1\n10.0.0.0/25\n"
+
+    resp = client.simulate_post(
+        "/api/test/iplists/query",
+        headers=headers,
+        json={"expression": "feed-a & allow", "format": "json"},
+    )
+    assert resp.json == [{"ip": "2.2.2.2"}, {"ip": "10.0.0.128/25"}]
+
+    resp = client.simulate_post(
+        "/api/test/iplists/query",
+        headers=headers,
+        json={"expression": "feed-a | allow", "format": "csv"},
+    )
+    assert resp.text == "ip\r\n1.1.1.1\r\n2.2.2.2\r\n10.0.0.0/24\r\n"
+
+    for expression in ("feed-a - missing", "feed-a -"):
+        resp = client.simulate_post(
+            "/api/test/iplists/query",
+            headers=headers,
+            json={"expression": expression},
+        )
+        assert resp.status_code == 400
+
+
+def test_iplistqueryresource_save_as(client, superuser):
+    user = User.get_by_token(superuser)
+    feed = IPList.create(name="feed-a", created_by=user)
+    allow = IPList.create(name="allow", created_by=user)
+    add_ips(feed, ["10.0.0.0/24", "1.1.1.1"], user)
+    add_ips(allow, ["10.0.0.0/25"], user)
+    headers = {"Authorization": f"Token {superuser}"}
+
+    json = {"expression": "feed-a - allow", "save_as": {"name": "feed-a-blocked"}}
+    resp = client.simulate_post("/api/test/iplists/query", headers=headers, json=json)
+    assert resp.status_code == 201
+    assert resp.json["count_added"] == 2
+    assert client.app.membership.lists_for("10.0.0.200") == ["feed-a", "feed-a-blocked"]
+
+    resp = client.simulate_post("/api/test/iplists/query", headers=headers, json=json)
+    assert resp.status_code == 400
+
+    token = create_user(username="analyst", password="password")
+    resp = client.simulate_post(
+        "/api/test/iplists/query",
+        headers={"Authorization": f"Token {token}"},
+        json=dict(json, save_as={"name": "other"}),
+    )
+    assert resp.status_code == 401
+
+
+def test_iplistitemresource_on_post_expiry(client, superuser):
+    headers = {"Authorization": f"Token {superuser}"}
+    client.simulate_post(
+        "/api/test/iplists",
+        headers=headers,
+        json={"name": "test-list", "default_ttl": 86400},
+    )
+    resp = client.simulate_get("/api/test/iplists/test-list", headers=headers)
+    assert resp.json["iplist"]["default_ttl"] == 86400
+
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["1.1.1.1"], "note": "test", "ttl": 60},
+    )
+    assert resp.status_code == 201
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["2.2.2.2"], "note": "test", "expires_at": "2001-01-01T00:00Z"},
+    )
+    assert resp.status_code == 201
+    resp = client.simulate_post(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        json={"ips": ["3.3.3.3"], "note": "test"},
+    )
+
+    expires = {item.ip.ip: item.expires_at for item in IPListItem.select()}
+    assert expires["2.2.2.2"] == datetime(2001, 1, 1)
+    assert expires["1.1.1.1"] < expires["3.3.3.3"]
+
+    resp = client.simulate_get("/api/test/iplists/test-list.json", headers=headers)
+    assert [item["ip"] for item in resp.json] == ["1.1.1.1", "3.3.3.3"]
+    assert all(item["expires_at"] for item in resp.json)
+    resp = client.simulate_get(
+        "/api/test/iplists/test-list/items",
+        headers=headers,
+        params={"overlaps": "0.0.0.0/0"},
+    )
+    assert [item["ip"] for item in resp.json["items"]] == ["1.1.1.1", "3.3.3.3"]
+
+    client.simulate_put(
+        "/api/test/iplists/test-list", headers=headers, json={"default_ttl": None}
+    )
+    assert IPList.get().default_ttl is None
+
+
+def test_iplistexportresource_expiry(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, ["1.1.1.1"], user)
+    add_ips(
+        ip_list,
+        ["2.2.2.2"],
+        user,
+        expires_at=datetime.utcnow() + timedelta(seconds=0.2),
+    )
+    headers = {"Authorization": f"Token {superuser}"}
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.text == "1.1.1.1\n2.2.2.2\n"
+    export_etag = resp.headers["etag"]
+    resp = client.simulate_get("/api/test/iplists/test-list/items", headers=headers)
+    items_etag = resp.headers["etag"]
+
+    # The cached body and the ETags go stale once it expires, before the sweep.
+    time.sleep(0.3)
+    headers["If-None-Match"] = export_etag
+    resp = client.simulate_get("/api/test/iplists/test-list.txt", headers=headers)
+    assert resp.status_code == 200
+    assert resp.text == "1.1.1.1\n"
+    headers["If-None-Match"] = items_etag
+    resp = client.simulate_get("/api/test/iplists/test-list/items", headers=headers)
+    assert resp.status_code == 200
+    assert [item["ip"] for item in resp.json["items"]] == ["1.1.1.1"]
+
+    headers["If-None-Match"] = resp.headers["etag"]
+    resp = client.simulate_get("/api/test/iplists/test-list/items", headers=headers)
+    assert resp.status_code == 304
+
+
+def test_iplistitemresource_on_get_pages(client, superuser):
+    user = User.get_by_token(superuser)
+    other = User.get_by_token(create_user(username="other", password="password"))
+    ip_list = IPList.create(name="test-list", created_by=user)
+    add_ips(ip_list, [f"10.0.0.{i}" for i in range(5)], user, "first")
+    add_ips(ip_list, ["10.0.1.0/24", "192.0.2.1"], other, "second")
+    headers = {"Authorization": f"Token {superuser}"}
+    url = "/api/test/iplists/test-list/items"
+
+    resp = client.simulate_get(url, headers=headers, params={"limit": 3})
+    assert [item["ip"] for item in resp.json["items"]] == [
+        "10.0.0.0",
+        "10.0.0.1",
+        "10.0.0.2",
+    ]
+    assert resp.json["items"][0]["added_by"] == "superuser"
+    assert resp.json["items"][0]["note"] == "first"
+    resp = client.simulate_get(
+        url, headers=headers, params={"limit": 3, "after": resp.json["next"]}
+    )
+    assert [item["ip"] for item in resp.json["items"]] == [
+        "10.0.0.3",
+        "10.0.0.4",
+        "10.0.1.0/24",
+    ]
+    resp = client.simulate_get(
+        url, headers=headers, params={"limit": 3, "after": resp.json["next"]}
+    )
+    assert [item["ip"] for item in resp.json["items"]] == ["192.0.2.1"]
+    assert resp.json["next"] is None
+
+    resp = client.simulate_get(url, headers=headers, params={"within": "10.0.0.0/16"})
+    assert len(resp.json["items"]) == 6
+    resp = client.simulate_get(url, headers=headers, params={"added_by": "other"})
+    assert [item["ip"] for item in resp.json["items"]] == ["10.0.1.0/24", "192.0.2.1"]
+    resp = client.simulate_get(
+        url, headers=headers, params={"created_after": "2000-01-01T00:00:00Z"}
+    )
+    assert len(resp.json["items"]) == 7
+    resp = client.simulate_get(
+        url, headers=headers, params={"created_before": "2000-01-01T00:00:00Z"}
+    )
+    assert resp.json["items"] == []
+
+    for params in ({"within": "10.0.0.1/8"}, {"limit": 5000}, {"after": "x"}):
+        resp = client.simulate_get(url, headers=headers, params=params)
+        assert resp.status_code == 400
+
+
+def test_iplistresource_list_on_get_pages(client, superuser):
+    user = User.get_by_token(superuser)
+    for i in range(3):
+        IPList.create(name=f"test-list-{i}", created_by=user)
+    headers = {"Authorization": f"Token {superuser}"}
+
+    resp = client.simulate_get(
+        "/api/test/iplists", headers=headers, params={"limit": 2}
+    )
+    assert [x["name"] for x in resp.json["iplists"]] == ["test-list-0", "test-list-1"]
+    resp = client.simulate_get(
+        "/api/test/iplists", headers=headers, params={"after": resp.json["next"]}
+    )
+    assert [x["name"] for x in resp.json["iplists"]] == ["test-list-2"]
+    assert resp.json["next"] is None
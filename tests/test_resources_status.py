@@ -0,0 +1,9 @@
+from tests import client, superuser
+
+
+def test_status_get(client, superuser):
+    resp = client.simulate_get(
+        "/api/test/status", headers={"Authorization": f"Token {superuser}"}
+    )
+    assert resp.status_code == 200
+    assert set(resp.json["databases"]) == {"asn", "geo"}
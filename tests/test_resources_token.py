@@ -68,3 +68,35 @@ def test_token_on_get_found_is_not_admin_ok(client, superuser):
     )
     assert resp.status_code == 200
     assert "token" in resp.json
+
+
+def test_token_on_put_invalidates_cache(client, superuser):
+    u = create_user("test-user", "test-user")
+    headers = {"Authorization": f"Token {u}"}
+    assert client.simulate_get("/api/test/tokens/test-user", headers=headers).json
+    assert client.app.token_cache.stats()["size"] == 1
+
+    resp = client.simulate_put("/api/test/tokens/test-user", headers=headers)
+    new_headers = {"Authorization": f"Token {resp.json['token']}"}
+    assert (
+        client.simulate_get("/api/test/tokens/test-user", headers=headers).status_code
+        == 401
+    )
+    assert (
+        client.simulate_get(
+            "/api/test/tokens/test-user", headers=new_headers
+        ).status_code
+        == 200
+    )
+
+    client.simulate_put(
+        "/api/test/users/test-user",
+        headers={"Authorization": f"Token {superuser}"},
+        json={"is_active": False},
+    )
+    assert (
+        client.simulate_get(
+            "/api/test/tokens/test-user", headers=new_headers
+        ).status_code
+        == 401
+    )
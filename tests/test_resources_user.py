@@ -1,4 +1,5 @@
 import json
+from base64 import b64encode
 
 import pytest
 from tests import client, superuser
@@ -155,3 +156,47 @@ def test_initresource_on_post_ok(client):
     resp = client.simulate_post("/api/test/init", json=json)
     assert resp.status_code == 201
     assert resp.json["status"] == "Success"
+
+
+def test_user_on_get_list_pages(client, superuser):
+    for i in range(4):
+        create_user(f"test-user-{i}", "test-password")
+    headers = {"Authorization": f"Token {superuser}"}
+
+    usernames = []
+    params = {"limit": 2}
+    while True:
+        resp = client.simulate_get("/api/test/users", headers=headers, params=params)
+        assert len(resp.json["users"]) <= 2
+        usernames += [user["username"] for user in resp.json["users"]]
+        if resp.json["next"] is None:
+            break
+        params["after"] = resp.json["next"]
+    assert usernames == ["superuser"] + [f"test-user-{i}" for i in range(4)]
+
+    resp = client.simulate_get("/api/test/users", headers=headers, params={"limit": 0})
+    assert resp.status_code == 400
+
+
+def test_user_basic_auth_password_change(client, superuser):
+    create_user("test-user", "test-password")
+    old = {"Authorization": "Basic " + b64encode(b"test-user:test-password").decode()}
+    new = {"Authorization": "Basic " + b64encode(b"test-user:new-password").decode()}
+    assert (
+        client.simulate_get("/api/test/users/test-user", headers=old).status_code == 200
+    )
+    assert (
+        client.simulate_get("/api/test/users/test-user", headers=old).status_code == 200
+    )
+    assert client.app.credential_cache.stats()["hits"] == 1
+
+    resp = client.simulate_put(
+        "/api/test/users/test-user", headers=old, json={"password": "new-password"}
+    )
+    assert resp.status_code == 200
+    assert (
+        client.simulate_get("/api/test/users/test-user", headers=old).status_code == 401
+    )
+    assert (
+        client.simulate_get("/api/test/users/test-user", headers=new).status_code == 200
+    )
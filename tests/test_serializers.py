@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+
+from analyst.serializers.ndjson import ndjson_stream
+
+
+def test_ndjson_stream_lines():
+    records = ({"ip": f"10.0.0.{i}", "seen": datetime(2019, 7, 1)} for i in range(3))
+    body = b"".join(ndjson_stream(records))
+    lines = body.decode("utf-8").splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[2]) == {"ip": "10.0.0.2", "seen": "2019-07-01T00:00:00Z"}
+
+
+def test_ndjson_stream_chunks_lazily():
+    consumed = []
+
+    def records():
+        for i in range(100):
+            consumed.append(i)
+            yield {"i": i}
+
+    stream = ndjson_stream(records(), chunk_size=32)
+    first = next(stream)
+    assert first.endswith(b"\n")
+    assert len(consumed) < 100
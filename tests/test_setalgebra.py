@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from analyst.membership import merge_ranges
+from analyst.setalgebra import (
+    combine,
+    evaluate,
+    list_names,
+    parse_expression,
+    range_networks,
+)
+
+
+def test_parse_expression():
+    assert parse_expression("feed-a") == "feed-a"
+    assert parse_expression("Feed-A - allow") == ("-", "feed-a", "allow")
+    assert parse_expression("a | b & c - d") == ("|", "a", ("&", "b", ("-", "c", "d")))
+    assert parse_expression("(a | b) & c") == ("&", ("|", "a", "b"), "c")
+    assert parse_expression("a - b - c") == ("-", ("-", "a", "b"), "c")
+    assert list_names(parse_expression("a | (b & a)")) == {"a", "b"}
+    for text in ("", "a |", "(a | b", "a b", "| a", "a ) b", "a $ b"):
+        with pytest.raises(ValueError):
+            parse_expression(text)
+
+
+def ranges(addresses):
+    values = np.array(sorted(addresses), dtype=np.int64)
+    return merge_ranges(values, values)
+
+
+def addresses(result):
+    return {
+        value
+        for start, end in zip(result[0].tolist(), result[1].tolist())
+        for value in range(start, end + 1)
+    }
+
+
+def test_combine():
+    rand = random.Random(1)
+    for _ in range(50):
+        left = {rand.randrange(64) for _ in range(rand.randrange(40))}
+        right = {rand.randrange(64) for _ in range(rand.randrange(40))}
+        assert addresses(combine("|", ranges(left), ranges(right))) == left | right
+        assert addresses(combine("&", ranges(left), ranges(right))) == left & right
+        assert addresses(combine("-", ranges(left), ranges(right))) == left - right
+
+
+def test_evaluate():
+    lists = {
+        "a": ranges(range(0, 16)),
+        "b": ranges(range(8, 24)),
+        "c": ranges([2**32 - 1]),
+    }
+    loaded = []
+
+    def load(name):
+        loaded.append(name)
+        return lists[name]
+
+    result = evaluate(parse_expression("(a - b) | c | (a & a)"), load)
+    assert sorted(loaded) == ["a", "b", "c"]
+    assert list(range_networks(result)) == [
+        ("0.0.0.0", 28),
+        ("255.255.255.255", 32),
+    ]
+    assert list(range_networks(evaluate("a", load))) == [("0.0.0.0", 28)]
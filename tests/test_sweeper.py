@@ -0,0 +1,99 @@
+import threading
+from datetime import datetime, timedelta
+
+from tests import client, superuser
+
+from analyst.membership import MembershipIndex
+from analyst.models.iplist import (
+    IPList,
+    IPListChange,
+    IPListItem,
+    add_ips,
+    sweep_expired,
+)
+from analyst.models.user import User
+from analyst.sweeper import ExpirySweeper
+
+
+def test_sweep_expired(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    now = datetime.utcnow()
+    add_ips(ip_list, ["1.1.1.1", "2.2.2.2"], user, expires_at=now - timedelta(1))
+    add_ips(ip_list, ["3.3.3.3"], user, expires_at=now + timedelta(1))
+    add_ips(ip_list, ["4.4.4.4"], user)
+
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == []
+    assert index.lists_for("3.3.3.3") == ["test-list"]
+
+    assert sweep_expired(1) == 1
+    assert sweep_expired(10) == 1
+    assert sweep_expired(10) == 0
+    assert IPListItem.select().count() == 2
+    assert IPList.get_by_id(ip_list.id).version == 5
+    removed = IPListChange.select().where(IPListChange.action == IPListChange.REMOVE)
+    assert sorted(change.version for change in removed) == [4, 5]
+
+    assert sweep_expired(10, now + timedelta(2)) == 1
+    assert [item.ip.ip for item in IPListItem.select()] == ["4.4.4.4"]
+
+
+def test_expirysweeper_sweep(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user)
+    expired = datetime.utcnow() - timedelta(1)
+    add_ips(ip_list, [f"10.0.0.{i}" for i in range(25)], user, expires_at=expired)
+
+    sweeper = ExpirySweeper(interval=0, batch_size=10, pause=0)
+    assert sweeper.sweep() == 25
+    assert IPListItem.select().count() == 0
+
+    # Disabled with no interval.
+    sweeper.start()
+    assert sweeper._thread is None
+    sweeper.stop()
+
+
+def test_sweeper_survives_errors(monkeypatch):
+    sweeper = ExpirySweeper(interval=0.01, batch_size=10)
+    calls = []
+    done = threading.Event()
+
+    def sweep():
+        calls.append(True)
+        if len(calls) < 3:
+            raise ValueError("broken")
+        done.set()
+        return 0
+
+    monkeypatch.setattr(sweeper, "sweep", sweep)
+    sweeper.start()
+    assert done.wait(5)
+    sweeper.stop()
+    assert len(calls) >= 3
+
+
+def test_add_ips_default_ttl_and_extend(client, superuser):
+    user = User.get_by_token(superuser)
+    ip_list = IPList.create(name="test-list", created_by=user, default_ttl=3600)
+    add_ips(ip_list, ["1.1.1.1"], user)
+    item = IPListItem.get()
+    assert timedelta(minutes=59) < item.expires_at - datetime.utcnow()
+
+    # Adding again pushes the expiry out, never pulls it in.
+    later = datetime.utcnow() + timedelta(days=7)
+    counts = add_ips(ip_list, ["1.1.1.1"], user, expires_at=later)
+    assert counts["skipped"] == 1
+    assert IPListItem.get().expires_at == later
+    add_ips(ip_list, ["1.1.1.1"], user)
+    assert IPListItem.get().expires_at == later
+
+    # An expired item that wasn't swept yet comes back.
+    IPListItem.update(expires_at=datetime.utcnow() - timedelta(1)).execute()
+    index = MembershipIndex()
+    assert index.lists_for("1.1.1.1") == []
+    version = IPList.get_by_id(ip_list.id).version
+    add_ips(ip_list, ["1.1.1.1"], user)
+    assert IPList.get_by_id(ip_list.id).version == version + 1
+    assert index.lists_for("1.1.1.1") == ["test-list"]
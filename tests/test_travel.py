@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import geoip2.errors
+import numpy as np
+
+from analyst.travel import (
+    ImpossibleTravelDetector,
+    detect_impossible_travel,
+    from_epoch,
+    to_epoch,
+)
+
+NEW_YORK = (40.7128, -74.0060)
+LONDON = (51.5074, -0.1278)
+BOSTON = (42.3601, -71.0589)
+
+
+class Location:
+    def __init__(self, lat, lon):
+        self.latitude = lat
+        self.longitude = lon
+
+
+class City:
+    def __init__(self, lat, lon):
+        self.location = Location(lat, lon)
+
+
+class FakeDatabase:
+    def __init__(self, locations):
+        self.locations = locations
+
+    @contextmanager
+    def handle(self):
+        yield None
+
+    def lookup(self, ip, handle=None):
+        if ip not in self.locations:
+            raise geoip2.errors.AddressNotFoundError(ip)
+        return City(*self.locations[ip])
+
+
+def test_to_epoch():
+    assert to_epoch(60) == 60.0
+    assert to_epoch("1970-01-01T00:01:00Z") == 60.0
+
+
+def test_from_epoch():
+    assert from_epoch(60.5) == datetime(1970, 1, 1, 0, 1, 0, 500000)
+    assert from_epoch(to_epoch("2020-02-03T04:05:06Z")).tzinfo is None
+
+
+def test_detector_flags_fast_hop():
+    detector = ImpossibleTravelDetector(max_kmh=1000)
+    alerts = detector.process(
+        ["alice", "alice", "bob", "bob"],
+        ["ny", "london", "ny", "boston"],
+        np.array([0.0, 3600.0, 0.0, 3600.0]),
+        np.array([NEW_YORK, LONDON, NEW_YORK, BOSTON]),
+    )
+    assert len(alerts) == 1
+    assert alerts[0]["user"] == "alice"
+    assert alerts[0]["previous_ip"] == "ny"
+    assert alerts[0]["kmh"] > 5000
+
+
+def test_detector_keeps_state_between_batches():
+    detector = ImpossibleTravelDetector(max_kmh=1000)
+    detector.process(["alice"], ["ny"], np.array([0.0]), np.array([NEW_YORK]))
+    alerts = detector.process(
+        ["alice"], ["london"], np.array([1800.0]), np.array([LONDON])
+    )
+    assert len(alerts) == 1
+    assert alerts[0]["previous_ip"] == "ny"
+
+
+def test_detect_impossible_travel_batches_and_skips_unlocated():
+    database = FakeDatabase({"1.1.1.1": NEW_YORK, "2.2.2.2": LONDON})
+    events = [
+        ("alice", "1.1.1.1", 0),
+        ("alice", "10.0.0.1", 600),
+        ("alice", "2.2.2.2", 1200),
+        ("alice", "2.2.2.2", 90000),
+    ]
+    alerts = list(detect_impossible_travel(events, database, batch_size=2))
+    assert [x["ip"] for x in alerts] == ["2.2.2.2"]